@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Thread safe in-process TTL cache
+File: cache
+Project: PiHome
+File Created: Sunday, 18th October 2026 12:21:40 am
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple, Union
+
+_LOG = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    A thread safe in-process cache whose entries expire ttl seconds after they are stored. The
+    least recently used entry is evicted when maxsize is reached. get_or_load lets only one thread
+    load a missing key while the others wait for its result, so a burst of requests for the same
+    expired key costs a single load.
+
+    Attributes:
+        ttl (float): Seconds an entry stays valid.
+        maxsize (int): The maximum number of entries.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 128) -> None:
+        """
+        Initializes the cache.
+
+        Args:
+            ttl (float): Seconds an entry stays valid.
+            maxsize (int, optional): The maximum number of entries. Defaults to 128.
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.__entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__loading: Dict[Hashable, threading.Lock] = {}
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Gets an entry.
+
+        Args:
+            key (Hashable): The key.
+            default (Any, optional): Returned if the key is missing or expired. Defaults to None.
+
+        Returns:
+            Any: The cached value or default.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                del self.__entries[key]
+                return default
+            self.__entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        """
+        Stores an entry.
+
+        Args:
+            key (Hashable): The key.
+            value (Any): The value.
+            ttl (float, optional): Overrides the cache ttl for this entry. Defaults to None.
+        """
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self.__lock:
+            self.__entries[key] = (expires, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Any],
+        ttl: Union[float, Callable[[Any], float]] = None,
+    ) -> Any:
+        """
+        Gets an entry, calling loader to load and store it if it is missing or expired. Exceptions
+        raised by loader are not cached and are raised to the caller that ran it.
+
+        Args:
+            key (Hashable): The key.
+            loader (Callable[[], Any]): Loads the value.
+            ttl (Union[float, Callable[[Any], float]], optional): Overrides the cache ttl for this
+                entry. A callable is called with the loaded value to compute it, for values that
+                know when they go stale. Defaults to None.
+
+        Returns:
+            Any: The cached or loaded value.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self.__lock:
+            loading = self.__loading.setdefault(key, threading.Lock())
+        with loading:
+            # another thread may have loaded it while this one waited
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                try:
+                    value = loader()
+                    self.set(key, value, ttl(value) if callable(ttl) else ttl)
+                finally:
+                    with self.__lock:
+                        if self.__loading.get(key) is loading:
+                            del self.__loading[key]
+        return value
+
+    def invalidate(self, key: Hashable):
+        """
+        Removes an entry.
+
+        Args:
+            key (Hashable): The key.
+        """
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        with self.__lock:
+            self.__entries.clear()
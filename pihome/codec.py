@@ -0,0 +1,347 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Compact binary encoding for XDB spool records
+File: codec
+Project: PiHome
+File Created: Saturday, 17th October 2026 6:41:09 pm
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import datetime as dt
+import decimal
+import struct
+from typing import Any, Dict, List, Set, Tuple
+
+#: Value type tags. Every encoded value starts with one of these.
+(
+    T_NONE,
+    T_FALSE,
+    T_TRUE,
+    T_INT,
+    T_FLOAT,
+    T_STR,
+    T_REF,
+    T_BYTES,
+    T_DATETIME,
+    T_DATETIME_TZ,
+    T_DATE,
+    T_TIME,
+    T_DECIMAL,
+    T_LIST,
+    T_DICT,
+) = range(15)
+
+_TAG = [bytes((tag,)) for tag in range(T_DICT + 1)]
+#: Encoded references to the first 128 interned strings.
+_REF_PREFIX = [bytes((T_REF, ref)) for ref in range(0x80)]
+_F64 = struct.Struct(">d")
+_EPOCH = dt.datetime(1970, 1, 1)
+_MICROSECOND = dt.timedelta(microseconds=1)
+
+
+def _uvarint(n: int) -> bytes:
+    """
+    Encodes an unsigned int as a LEB128 varint.
+
+    Args:
+        n (int): The value.
+
+    Returns:
+        bytes: The varint.
+    """
+    if n < 0x80:
+        return bytes((n,))
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _varint(n: int) -> bytes:
+    """
+    Encodes a signed int as a zigzag varint.
+
+    Args:
+        n (int): The value.
+
+    Returns:
+        bytes: The varint.
+    """
+    return _uvarint(n << 1 if n >= 0 else (-n << 1) - 1)
+
+
+class Encoder:
+    """
+    Encodes values into a compact tagged binary format. Datetimes, dates, times and decimals are
+    stored natively instead of as strings. Dict keys, and strings outside of the keys listed in
+    raw_keys, are interned: the first time a string is seen it is returned as a new definition
+    and every use is stored as a short reference. The decoder must be fed the same definitions in
+    the same order.
+
+    Attributes:
+        raw_keys (Set[str]): Dict keys whose values hold row data. Strings under them are not
+            interned, except for dict keys.
+    """
+
+    def __init__(self, raw_keys: Set[str] = frozenset()) -> None:
+        """
+        Initializes the encoder with an empty intern table.
+
+        Args:
+            raw_keys (Set[str], optional): Dict keys whose string values are not interned.
+                Defaults to no keys.
+        """
+        self.raw_keys = raw_keys
+        self.__strings: Dict[str, int] = {}
+
+    def reset(self):
+        """
+        Clears the intern table.
+        """
+        self.__strings = {}
+
+    def encode(self, value: Any) -> Tuple[List[str], bytes]:
+        """
+        Encodes a value.
+
+        Args:
+            value (Any): The value. Types without a native encoding are stored as their string
+                representation.
+
+        Returns:
+            Tuple[List[str], bytes]: The strings added to the intern table, in order, and the
+                encoded value.
+        """
+        new: List[str] = []
+        out: List[bytes] = []
+        self.__encode(value, True, out, new)
+        return new, b"".join(out)
+
+    def __ref(self, value: str, out: List[bytes], new: List[str]):
+        """
+        Writes a reference to an interned string, interning it if needed.
+        """
+        ref = self.__strings.get(value)
+        if ref is None:
+            ref = self.__strings[value] = len(self.__strings)
+            new.append(value)
+        out.append(_REF_PREFIX[ref] if ref < 0x80 else _TAG[T_REF] + _uvarint(ref))
+
+    def __encode(self, value: Any, intern: bool, out: List[bytes], new: List[str]):
+        """
+        Writes a value to out.
+        """
+        kind = type(value)
+        if kind is str:
+            if intern:
+                self.__ref(value, out, new)
+            else:
+                data = value.encode()
+                out.append(_TAG[T_STR] + _uvarint(len(data)) + data)
+        elif kind is float:
+            out.append(_TAG[T_FLOAT] + _F64.pack(value))
+        elif kind is int:
+            out.append(_TAG[T_INT] + _varint(value))
+        elif kind is dict:
+            out.append(_TAG[T_DICT] + _uvarint(len(value)))
+            for key, item in value.items():
+                key = str(key)
+                self.__ref(key, out, new)
+                self.__encode(item, intern and key not in self.raw_keys, out, new)
+        elif kind is list or kind is tuple:
+            out.append(_TAG[T_LIST] + _uvarint(len(value)))
+            for item in value:
+                self.__encode(item, intern, out, new)
+        elif value is None:
+            out.append(_TAG[T_NONE])
+        elif value is True:
+            out.append(_TAG[T_TRUE])
+        elif value is False:
+            out.append(_TAG[T_FALSE])
+        elif isinstance(value, dt.datetime):
+            if value.tzinfo is None:
+                out.append(_TAG[T_DATETIME] + _varint((value - _EPOCH) // _MICROSECOND))
+            else:
+                offset = value.utcoffset()
+                local = value.replace(tzinfo=None)
+                out.append(
+                    _TAG[T_DATETIME_TZ]
+                    + _varint((local - _EPOCH) // _MICROSECOND)
+                    + _varint(offset // _MICROSECOND)
+                )
+        elif isinstance(value, dt.date):
+            out.append(_TAG[T_DATE] + _uvarint(value.toordinal()))
+        elif isinstance(value, dt.time) and value.tzinfo is None:
+            micros = ((value.hour * 60 + value.minute) * 60 + value.second) * 10 ** 6
+            out.append(_TAG[T_TIME] + _uvarint(micros + value.microsecond))
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            data = bytes(value)
+            out.append(_TAG[T_BYTES] + _uvarint(len(data)) + data)
+        elif isinstance(value, decimal.Decimal):
+            data = str(value).encode()
+            out.append(_TAG[T_DECIMAL] + _uvarint(len(data)) + data)
+        elif isinstance(value, str):
+            self.__encode(str.__str__(value), intern, out, new)
+        elif isinstance(value, int):
+            self.__encode(int(value), intern, out, new)
+        elif isinstance(value, float):
+            self.__encode(float(value), intern, out, new)
+        elif isinstance(value, dict):
+            self.__encode(dict(value), intern, out, new)
+        elif isinstance(value, (list, tuple)):
+            self.__encode(list(value), intern, out, new)
+        else:
+            self.__encode(str(value), intern, out, new)
+
+
+class Decoder:
+    """
+    Decodes values written by Encoder. Interned strings must be defined in the order the encoder
+    returned them.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes the decoder with an empty intern table.
+        """
+        self.__strings: List[str] = []
+
+    def define(self, value: str):
+        """
+        Adds a string to the intern table.
+
+        Args:
+            value (str): The string.
+        """
+        self.__strings.append(value)
+
+    def decode(self, data: bytes) -> Any:
+        """
+        Decodes a value.
+
+        Args:
+            data (bytes): The encoded value.
+
+        Raises:
+            ValueError: If the data is not a valid encoded value.
+
+        Returns:
+            Any: The value.
+        """
+        try:
+            value, pos = self.__decode(data, 0)
+        except (IndexError, struct.error) as ex:
+            raise ValueError(f"Truncated value: {ex}") from ex
+        if pos != len(data):
+            raise ValueError(f"Trailing data after value at {pos}")
+        return value
+
+    @staticmethod
+    def __uvarint(data: bytes, pos: int) -> Tuple[int, int]:
+        """
+        Reads an unsigned varint. Returns the value and the position after it.
+        """
+        byte = data[pos]
+        if byte < 0x80:
+            return byte, pos + 1
+        value = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value, pos
+            shift += 7
+
+    def __varint(self, data: bytes, pos: int) -> Tuple[int, int]:
+        """
+        Reads a zigzag varint. Returns the value and the position after it.
+        """
+        value, pos = self.__uvarint(data, pos)
+        return (value >> 1) ^ -(value & 1), pos
+
+    def __decode(self, data: bytes, pos: int) -> Tuple[Any, int]:
+        """
+        Reads a value. Returns the value and the position after it.
+        """
+        tag = data[pos]
+        pos += 1
+        if tag == T_REF:
+            ref, pos = self.__uvarint(data, pos)
+            return self.__strings[ref], pos
+        if tag == T_INT:
+            return self.__varint(data, pos)
+        if tag == T_DICT:
+            count, pos = self.__uvarint(data, pos)
+            value = {}
+            for _ in range(count):
+                key, pos = self.__decode(data, pos)
+                value[key], pos = self.__decode(data, pos)
+            return value, pos
+        if tag == T_LIST:
+            count, pos = self.__uvarint(data, pos)
+            value = []
+            for _ in range(count):
+                item, pos = self.__decode(data, pos)
+                value.append(item)
+            return value, pos
+        if tag == T_NONE:
+            return None, pos
+        if tag == T_TRUE:
+            return True, pos
+        if tag == T_FALSE:
+            return False, pos
+        if tag == T_FLOAT:
+            return _F64.unpack_from(data, pos)[0], pos + _F64.size
+        if tag in (T_STR, T_BYTES, T_DECIMAL):
+            length, pos = self.__uvarint(data, pos)
+            if pos + length > len(data):
+                raise IndexError("string past end of data")
+            raw = data[pos : pos + length]
+            if tag == T_BYTES:
+                return bytes(raw), pos + length
+            text = bytes(raw).decode()
+            return (decimal.Decimal(text) if tag == T_DECIMAL else text), pos + length
+        if tag == T_DATETIME:
+            micros, pos = self.__varint(data, pos)
+            return _EPOCH + micros * _MICROSECOND, pos
+        if tag == T_DATETIME_TZ:
+            micros, pos = self.__varint(data, pos)
+            offset, pos = self.__varint(data, pos)
+            tz = dt.timezone(offset * _MICROSECOND)
+            return (_EPOCH + micros * _MICROSECOND).replace(tzinfo=tz), pos
+        if tag == T_DATE:
+            ordinal, pos = self.__uvarint(data, pos)
+            return dt.date.fromordinal(ordinal), pos
+        if tag == T_TIME:
+            micros, pos = self.__uvarint(data, pos)
+            seconds, micros = divmod(micros, 10 ** 6)
+            minutes, seconds = divmod(seconds, 60)
+            hours, minutes = divmod(minutes, 60)
+            return dt.time(hours, minutes, seconds, micros), pos
+        raise ValueError(f"Unknown value tag {tag} at {pos - 1}")
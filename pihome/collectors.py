@@ -0,0 +1,560 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Data collectors run as scheduler jobs by the PiHome daemons
+File: collectors
+Project: PiHome
+File Created: Sunday, 18th October 2026 1:37:19 am
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import datetime as dt
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Type
+
+import pihome.constants as constants
+from pihome.scheduler import Job, Scheduler
+from pihome.shared import Backoff, Cadence, GracefulExit, load_json_data, wait_for_vault
+
+if TYPE_CHECKING:
+    from pihome.notify import NotifyMgr
+    from pihome.vault import VaultMgr
+
+_LOG = logging.getLogger(__name__)
+
+
+class AlertThrottle:
+    """
+    Sends an alert for a condition at most once per interval.
+
+    Attributes:
+        notify (NotifyMgr): Sends the alerts.
+        app (str): The app name the alerts are sent as.
+        interval (dt.timedelta): The minimum time between alerts for the same key.
+    """
+
+    def __init__(
+        self, notify: "NotifyMgr", app: str, interval: dt.timedelta = dt.timedelta(minutes=60)
+    ) -> None:
+        """
+        Initializes the throttle.
+
+        Args:
+            notify (NotifyMgr): Sends the alerts.
+            app (str): The app name the alerts are sent as.
+            interval (dt.timedelta, optional): The minimum time between alerts for the same key.
+                Defaults to 60 minutes.
+        """
+        self.notify = notify
+        self.app = app
+        self.interval = interval
+        self.__last: Dict[str, dt.datetime] = {}
+
+    def alert(self, key: str, critical: bool, msg: str, notif_type: str = "alert"):
+        """
+        Sends an alert if the condition is critical and no alert was sent for the key within the
+        interval.
+
+        Args:
+            key (str): Identifies the condition.
+            critical (bool): Whether the condition is critical.
+            msg (str): The alert message.
+            notif_type (str, optional): The notification type. Defaults to "alert".
+        """
+        if not critical:
+            return
+        now = dt.datetime.now()
+        last = self.__last.get(key)
+        if last is not None and now < last + self.interval:
+            return
+        self.notify.notify(msg, notif_type, self.app)
+        self.__last[key] = now
+
+
+class Collector:
+    """
+    Base class of the collectors. A collector wraps a manager and does one collection cycle per
+    run. The class attributes are the schedule of its job, see pihome.scheduler.Job. Collectors
+    that store samples use the CATCH_UP policy so a slow or held cycle is made up late instead
+    of lost. Managers are imported when a collector is created so a process only loads what it
+    runs.
+
+    Attributes:
+        name (str): The collector name.
+        app (str): The app name alerts are sent as.
+        uses_notify (bool): Whether the collector sends notifications.
+        run_at_start (bool): Run once as soon as the scheduler starts.
+        dedicated (bool): Run serve in a thread of its own instead of scheduling run. For
+            collectors driven by events rather than the clock.
+        buffer_writes (bool): Whether the collector's manager buffers the rows it stores, see
+            DBMgr.buffer_insert_data.
+    """
+
+    name = ""
+    app = ""
+    uses_notify = False
+    run_at_start = False
+    interval = 60
+    offset = 10
+    jitter = 0
+    timeout = None
+    retries = 1
+    retry_delay = 5
+    policy = Cadence.SKIP
+    max_catch_up = None
+    dedicated = False
+    buffer_writes = constants.db_buffer_writes
+
+    def __init__(
+        self, vault: "VaultMgr", notify: Optional["NotifyMgr"], exit_event: threading.Event
+    ) -> None:
+        """
+        Initializes the collector.
+
+        Args:
+            vault (VaultMgr): Used to get the secrets.
+            notify (Optional[NotifyMgr]): Sends notifications if uses_notify is set.
+            exit_event (threading.Event): Set when the process is exiting.
+        """
+        self.vault = vault
+        self.exit_event = exit_event
+        self.alerts = AlertThrottle(notify, self.app) if self.uses_notify else None
+
+    def run(self):
+        """
+        Runs one collection cycle. Raising fails the attempt, see retries. Does nothing by default.
+        """
+
+    def serve(self):
+        """
+        Runs the collector until exit_event is set. Only called for dedicated collectors. Does
+        nothing by default.
+        """
+
+    def exit(self):
+        """
+        Releases the collector's resources.
+        """
+
+    def job(self) -> Job:
+        """
+        Gets the scheduler job that runs the collector.
+
+        Returns:
+            Job: The job.
+        """
+        return Job(
+            self.name,
+            self.run,
+            self.interval,
+            offset=self.offset,
+            jitter=self.jitter,
+            timeout=self.timeout,
+            retries=self.retries,
+            retry_delay=self.retry_delay,
+            policy=self.policy,
+            max_catch_up=self.max_catch_up,
+        )
+
+
+class SensorCollector(Collector):
+    """
+    Stores the oversampled environment reading every 3 minutes and alerts when temperature or
+    humidity is critical. The sensor device is restarted after two failed cycles in a row,
+    the DB connection is kept. Rows are not buffered since the display shows the latest one.
+    """
+
+    name = "sensor"
+    app = "sensor_mgr"
+    uses_notify = True
+    buffer_writes = False
+    interval = 180
+    timeout = 120
+    retries = 5
+    policy = Cadence.CATCH_UP
+    max_catch_up = 1
+
+    def __init__(
+        self, vault: "VaultMgr", notify: Optional["NotifyMgr"], exit_event: threading.Event
+    ) -> None:
+        super().__init__(vault, notify, exit_event)
+        from pihome.sensor import SensorMgr
+
+        self.location = os.getenv("LOCATION")
+        self.sensor = SensorMgr(vault, self.location, buffer_writes=self.buffer_writes)
+        self.__failures = 0
+
+    def run(self):
+        if self.__failures >= 2:
+            self.sensor.restart()
+        try:
+            sensor_data = self.sensor.get_sensor_data()
+        except Exception:
+            self.__failures += 1
+            raise
+        self.__failures = 0
+        temp_critical = sensor_data.pop("temp_critical")
+        humidity_critical = sensor_data.pop("humidity_critical")
+        self.sensor.update_db_sensor_data(sensor_data)
+        _LOG.info(f"Sensor data updated for {sensor_data['datetime']}.")
+        self.alerts.alert(
+            "temperature",
+            temp_critical,
+            f"{self.location.title()} temperature critical at "
+            f"{sensor_data['temperature']}\u00b0F.",
+        )
+        self.alerts.alert(
+            "humidity",
+            humidity_critical,
+            f"{self.location.title()} humidity critical at {sensor_data['humidity']}%.",
+        )
+
+    def exit(self):
+        self.sensor.exit()
+
+
+class HealthCollector(Collector):
+    """
+    Collects the node's system stats every 5 minutes and alerts when any is critical.
+    """
+
+    name = "health"
+    app = "health_check"
+    uses_notify = True
+    interval = 300
+    timeout = 120
+    retries = 5
+    policy = Cadence.CATCH_UP
+    max_catch_up = 1
+
+    def __init__(
+        self, vault: "VaultMgr", notify: Optional["NotifyMgr"], exit_event: threading.Event
+    ) -> None:
+        super().__init__(vault, notify, exit_event)
+        from pihome.health import HealthMgr
+
+        self.health = HealthMgr(vault, buffer_writes=self.buffer_writes)
+
+    def run(self):
+        stats = self.health.get_stats()
+        critical = {
+            key: stats.pop(f"{key}_critical")
+            for key in ("cpu_temp", "cpu_usage", "mem_usage", "disk_usage")
+        }
+        nodename = stats["nodename"]
+        self.health.update_db_system_stats(stats)
+        _LOG.info(f"System stats updated for {stats['datetime']}.")
+        disk_pct = round((stats["disk_usage"] / stats["disk_total"]) * 100, 2)
+        messages = {
+            "cpu_temp": f"{nodename} CPU temperature critical at {stats['cpu_temp']}\u00b0C.",
+            "cpu_usage": f"{nodename} CPU Usage critical at {stats['cpu_usage']}%.",
+            "mem_usage": f"{nodename} Memory Usage critical at {stats['mem_usage']}%.",
+            "disk_usage": f"{nodename} Disk Usage critical at {disk_pct}%.",
+        }
+        for key, msg in messages.items():
+            self.alerts.alert(key, critical[key], msg, "critical")
+
+    def exit(self):
+        self.health.exit()
+
+
+class SolarCollector(Collector):
+    """
+    Collects solar energy and power data every 10 minutes, one minute after the solaredge
+    update, and alerts when the battery turns critical or a power source changes status.
+    """
+
+    name = "solar"
+    app = "solar_mgr"
+    uses_notify = True
+    interval = 600
+    offset = 70
+    timeout = 300
+    retries = 3
+    retry_delay = 10
+    policy = Cadence.CATCH_UP
+    max_catch_up = 1
+
+    def __init__(
+        self, vault: "VaultMgr", notify: Optional["NotifyMgr"], exit_event: threading.Event
+    ) -> None:
+        super().__init__(vault, notify, exit_event)
+        from pihome.solar import SolarMgr
+
+        self.notify = notify
+        self.solar = SolarMgr(vault, buffer_writes=self.buffer_writes)
+        self.__previous: Dict[str, Any] = {}
+
+    def run(self):
+        energy_data = self.solar.get_energy()
+        power_data = self.solar.get_power()
+        self.solar.update_db_energy_data(energy_data)
+        self.solar.update_power_data(power_data)
+        _LOG.info(f"Solar data updated for {power_data['datetime']}.")
+        self.__check_status(power_data)
+        self.__previous = power_data
+
+    def __check_status(self, power_data: Dict[str, Any]):
+        """
+        Alerts on changes from the previous power data.
+
+        Args:
+            power_data (Dict[str, Any]): The current power data.
+        """
+        previous = self.__previous
+        if not previous:
+            _LOG.info("No previous power data to compare.")
+            return
+        if power_data["battery_critical"] and not previous["battery_critical"]:
+            self.notify.notify("Battery status is critical. Please investigate.", "alert", self.app)
+        for key in ["solar_status", "battery_status", "grid_status"]:
+            if power_data[key] != previous[key]:
+                _LOG.info(f"Sending alert {key}: {previous[key]} -> {power_data[key]}")
+                self.notify.notify(
+                    f"{key.replace('_',' ').title()} switched from {previous[key]} to "
+                    f"{power_data[key]}",
+                    "alert",
+                    self.app,
+                )
+
+    def exit(self):
+        self.solar.exit()
+
+
+class QuoteCollector(Collector):
+    """
+    Fetches the quote of the day every 15 minutes and stores it once per day.
+    """
+
+    name = "quote"
+    app = "quote_mgr"
+    interval = 900
+    timeout = 120
+    retries = 2
+    retry_delay = 30
+
+    def __init__(
+        self, vault: "VaultMgr", notify: Optional["NotifyMgr"], exit_event: threading.Event
+    ) -> None:
+        super().__init__(vault, notify, exit_event)
+        from pihome.qotd import QOTDMgr
+
+        self.quote = QOTDMgr(vault)
+
+    def run(self):
+        self.quote.update_db_with_quote(self.quote.get_quote())
+
+    def exit(self):
+        self.quote.exit()
+
+
+class DisplayCollector(Collector):
+    """
+    Shows the latest reading of the node's location on the OLED display every minute.
+    """
+
+    name = "display"
+    app = "sensor_display"
+    run_at_start = True
+    offset = 15
+    timeout = 60
+    retries = 5
+
+    def __init__(
+        self, vault: "VaultMgr", notify: Optional["NotifyMgr"], exit_event: threading.Event
+    ) -> None:
+        super().__init__(vault, notify, exit_event)
+        from pihome.i2cdisplay import Display
+
+        self.display = Display(vault, os.getenv("LOCATION"))
+
+    def run(self):
+        self.display.display_sensor_data(self.display.get_sensor_data())
+
+    def exit(self):
+        self.display.exit()
+
+
+class XDBCollector(Collector):
+    """
+    Replays the XDB spool into the database from a dedicated thread that blocks on the spool
+    change events, and every IDLE_CHECK_INTERVAL seconds checks for anything a missed change
+    event left behind. Failed replays are retried with an exponential backoff. Legacy XDB files
+    in data_dir are replayed first, and the ones the DB rejects go to the dead letter spool.
+    """
+
+    name = "xdb"
+    app = "xdb"
+    dedicated = True
+    #: Seconds the change event wait blocks before the exit event is checked.
+    WAIT_TIMEOUT = 1
+    #: Seconds between spool checks when no change events are seen.
+    IDLE_CHECK_INTERVAL = 300
+    #: Seconds between replay lane stats log entries.
+    STATS_INTERVAL = 60
+
+    def __init__(
+        self, vault: "VaultMgr", notify: Optional["NotifyMgr"], exit_event: threading.Event
+    ) -> None:
+        super().__init__(vault, notify, exit_event)
+        from pihome.latest import register as register_latest
+        from pihome.replay import XDBReplayer
+        from pihome.rollup import register as register_rollups
+        from pihome.spool import SpoolReader, SpoolWatcher
+
+        db_data = vault.get_secret("xdb/database")
+        # replayed inserts update the rollup tables and latest_state like live ones
+        register_rollups()
+        register_latest()
+        self.replayer = XDBReplayer(db_data)
+        self.reader = SpoolReader(constants.xdb_dir)
+        self.watcher = SpoolWatcher(constants.xdb_dir)
+        self.backoff = Backoff(initial=1, maximum=300)
+        self.legacy_files = sorted(
+            constants.data_dir.glob("*.xdb"), key=lambda fp: fp.stat().st_mtime
+        )
+        self.__pending = True
+        self.__retry_at = 0.0
+        self.__last_check = self.__last_stats = time.monotonic()
+
+    def serve(self):
+        while not self.exit_event.is_set():
+            self.run()
+            if self.watcher.wait(timeout=self.WAIT_TIMEOUT):
+                self.__pending = True
+            elif time.monotonic() - self.__last_check >= self.IDLE_CHECK_INTERVAL:
+                # catch anything a missed event would have left behind
+                self.__pending = self.__pending or self.reader.has_pending()
+                self.__last_check = time.monotonic()
+
+    def run(self):
+        if self.__pending and time.monotonic() >= self.__retry_at:
+            try:
+                while self.legacy_files:
+                    _LOG.info(f"File found: {self.legacy_files[0]}")
+                    self.replayer.replay_one(load_json_data(self.legacy_files[0]))
+                    self.legacy_files.pop(0).unlink()
+                self.replayer.replay(self.reader)
+                self.backoff.reset()
+                # keep reading once the lanes drain if the queue limit was hit
+                self.__pending = self.replayer.depth() >= self.replayer.max_queued
+            except Exception as ex:
+                delay = self.backoff.next()
+                _LOG.error(f"{type(ex).__name__}: {str(ex)}")
+                _LOG.error(f"Could not update DB will try again in {delay} seconds.")
+                self.__retry_at = time.monotonic() + delay
+        if time.monotonic() - self.__last_stats >= self.STATS_INTERVAL:
+            for name, stats in self.replayer.stats().items():
+                if stats["depth"] or stats["last_error"]:
+                    _LOG.info(f"Replay lane {name}: {stats}")
+            self.__last_stats = time.monotonic()
+
+    def exit(self):
+        self.watcher.close()
+        self.replayer.exit()
+
+
+#: The collectors by name.
+COLLECTORS: Dict[str, Type[Collector]] = {
+    collector.name: collector
+    for collector in (
+        SensorCollector,
+        HealthCollector,
+        SolarCollector,
+        QuoteCollector,
+        DisplayCollector,
+        XDBCollector,
+    )
+}
+
+
+def run_collectors(names: List[str]) -> int:
+    """
+    Connects to the vault and runs the named collectors on one scheduler until SIGINT or SIGTERM
+    is received. Dedicated collectors run in threads of their own, and the process exits if one
+    of them fails. The collectors share the vault manager, the notification manager and the
+    process wide DB pools.
+
+    Args:
+        names (List[str]): The collector names, see COLLECTORS.
+
+    Raises:
+        ValueError: If a collector name is unknown.
+
+    Returns:
+        int: The exit code. 255 if the process was stopped before vault was reached, 1 if a
+            dedicated collector failed.
+    """
+    unknown = set(names) - set(COLLECTORS)
+    if unknown:
+        raise ValueError(f"Unknown collectors {sorted(unknown)}. Must be in {list(COLLECTORS)}.")
+    exit_control = GracefulExit()
+    vault = wait_for_vault(exit_control.exit_now)
+    if vault is None:
+        _LOG.info("Exit signal recieved. Exiting...")
+        return 255
+    notify = None
+    if any(COLLECTORS[name].uses_notify for name in names):
+        from pihome.notify import NotifyMgr
+
+        notify = NotifyMgr(vault)
+    collectors: List[Collector] = []
+    threads: List[threading.Thread] = []
+    failed: List[str] = []
+
+    def serve(collector: Collector):
+        try:
+            collector.serve()
+        except Exception:
+            _LOG.exception(f"Collector {collector.name} failed. Exiting...")
+            failed.append(collector.name)
+            exit_control.exit_now.set()
+
+    try:
+        for name in names:
+            collectors.append(COLLECTORS[name](vault, notify, exit_control.exit_now))
+        scheduler = Scheduler(exit_control.exit_now, workers=len(collectors) + 1)
+        for collector in collectors:
+            if collector.dedicated:
+                thread = threading.Thread(target=serve, args=(collector,), name=collector.name)
+                thread.start()
+                threads.append(thread)
+            else:
+                scheduler.add(collector.job(), run_now=collector.run_at_start)
+        scheduler.run()
+        _LOG.info(f"Job stats: {scheduler.stats()}")
+    finally:
+        exit_control.exit_now.set()
+        for thread in threads:
+            thread.join()
+        for collector in collectors:
+            collector.exit()
+        if notify is not None:
+            notify.exit()
+    _LOG.info(f"Exited at {dt.datetime.now()}")
+    return 1 if failed else 0
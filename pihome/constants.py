@@ -43,6 +43,12 @@ script_dir = root_dir / "scripts"
 env_dir = root_dir / ".env"
 #: Data dir. Used for apps to store data.
 data_dir = root_dir / "data"
+#: XDB spool dir. Holds the spool of transactions waiting to be written to the DB.
+xdb_dir = data_dir / "xdb"
+#: XDB dead letter dir. Holds the spooled transactions the DB rejected during replay.
+xdb_dead_dir = data_dir / "xdb_dead"
+#: Vault cache dir. Holds the encrypted secret cache daemons start from while vault is down.
+vault_cache_dir = data_dir / "vault"
 #: Service dir. Holds all the systemd service files.
 service_dir = root_dir / "services"
 #: Lib dir. Holds all custom modules. This is symlinked on the Pi as pihome.
@@ -104,3 +110,42 @@ nodes = [
 ]
 
 ssh_key = Path("~pi/.ssh/id_rsa").expanduser()
+
+#: Retention policy per table, applied by scripts/retention.py. Rows whose time_col (datetime
+#: by default) is older than keep_days days are purged. downsample lists the rollup grains that
+#: are recomputed for the purged days before the raw rows are deleted. condition is an extra SQL
+#: filter on the rows that may be purged.
+retention_policy = {
+    "environment": {"vault_root": "sensor/", "keep_days": 90, "downsample": ["hour", "day"]},
+    "environment_minute": {"vault_root": "sensor/", "keep_days": 30, "time_col": "bucket"},
+    "environment_hour": {"vault_root": "sensor/", "keep_days": 730, "time_col": "bucket"},
+    "power": {"vault_root": "solar/", "keep_days": 90, "downsample": ["hour", "day"]},
+    "power_minute": {"vault_root": "solar/", "keep_days": 30, "time_col": "bucket"},
+    "power_hour": {"vault_root": "solar/", "keep_days": 730, "time_col": "bucket"},
+    "system_stats": {"vault_root": "report/", "keep_days": 30, "downsample": ["hour", "day"]},
+    "system_stats_minute": {"vault_root": "report/", "keep_days": 14, "time_col": "bucket"},
+    "system_stats_hour": {"vault_root": "report/", "keep_days": 365, "time_col": "bucket"},
+    "notifications": {"vault_root": "report/", "keep_days": 180, "condition": "status = 'read'"},
+}
+#: Off-peak hours [start, end) during which retention purges run.
+retention_hours = (2, 5)
+#: Rows deleted per retention transaction.
+retention_batch_size = 5000
+#: Vault prefixes prefetched by daemons at startup. Prefixes a node's app role may not list are
+#: skipped.
+vault_prefetch = ["sensor/", "solar/", "report/", "quote/", "xdb/", "network/"]
+#: Collectors pihomed runs per node type.
+pihomed_collectors = {
+    "frame": ["health", "xdb", "solar", "quote"],
+    "sensor": ["health", "xdb", "sensor", "display"],
+    "display": ["health", "xdb"],
+}
+#: Whether the pihomed collectors buffer their per-cycle rows and write them in batches, see
+#: DBMgr.buffer_insert_data. Rows are flushed on exit but lost if the process is killed, and
+#: latest_state lags by up to db_buffer_max_age.
+db_buffer_writes = True
+#: Seconds the oldest buffered row waits before the buffer is flushed. Spans several collection
+#: cycles (3 to 10 minutes) so that each flush writes more than one row per table.
+db_buffer_max_age = 900
+#: Rows buffered per table before the buffer is flushed.
+db_buffer_max_rows = 500
@@ -32,39 +32,231 @@ SOFTWARE.
 """
 
 import datetime as dt
+import io
+import itertools
+import json
 import logging
-import os
 import threading
-from typing import Any, Dict, List, Tuple, Union
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 import pihome.constants as constants
 from pihome.exceptions import DBConnectionError
-from pihome.shared import load_json_data, write_json_data
+from pihome.pool import get_pool, release_pool
+from pihome.spool import get_spool_writer
 
 _LOG = logging.getLogger(__name__)
 
+#: Called with the cursor and the inserted rows inside an insert transaction.
+InsertHook = Callable[[psycopg2.extensions.cursor, List[Dict[str, Any]]], None]
+#: Insert hooks keyed by table name. See register_insert_hook.
+_INSERT_HOOKS: Dict[str, List[InsertHook]] = {}
+
+#: Numbers the server side cursors opened by DBMgr.stream_raw so their names are unique.
+_CURSOR_IDS = itertools.count()
+
+
+#: A generated SQL statement. See build_sql.
+SQLShape = namedtuple("SQLShape", ["sql", "template", "params", "prepared_sql", "name"])
+
+
+@lru_cache(maxsize=256)
+def build_sql(
+    operation: str, table: str, cols: Tuple[str, ...] = (), key_cols: Tuple[str, ...] = ()
+) -> SQLShape:
+    """
+    Generates the SQL for a DBMgr operation. The result only depends on the arguments so it is
+    cached and the same handful of statements used by the daemon loops are only built once.
+
+    Operations:
+        insert -> INSERT of a single row with cols.
+        insert_values -> INSERT of many rows with cols for execute_values.
+        upsert -> insert_values with ON CONFLICT (key_cols) DO UPDATE of the other cols.
+        update -> UPDATE of cols that are not key_cols WHERE key_cols match.
+        select -> SELECT cols (all if empty) WHERE key_cols match.
+        delete -> DELETE WHERE key_cols match.
+        copy -> COPY cols FROM STDIN in CSV format.
+
+    Args:
+        operation (str): The operation to generate SQL for.
+        table (str): The table name.
+        cols (Tuple[str, ...], optional): The columns used by the operation. Defaults to ().
+        key_cols (Tuple[str, ...], optional): The key or condition columns. Defaults to ().
+
+    Raises:
+        ValueError: If the operation is unknown.
+
+    Returns:
+        SQLShape: The sql with named placeholders, the execute_values template if needed, the
+            parameter names in positional order, the sql with positional placeholders for
+            PREPARE and the prepared statement name.
+    """
+    template = None
+    params = ()
+
+    def build(ph: Callable[[str], str]) -> str:
+        where = " AND ".join(f"{col} = {ph(col)}" for col in key_cols)
+        if operation == "insert":
+            return f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join(map(ph, cols))})"
+        if operation in ("insert_values", "upsert"):
+            sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES %s"
+            if operation == "upsert":
+                update_cols = [col for col in cols if col not in key_cols]
+                if update_cols:
+                    sets = ", ".join(f"{col} = EXCLUDED.{col}" for col in update_cols)
+                    action = f"DO UPDATE SET {sets}"
+                else:
+                    action = "DO NOTHING"
+                sql += f" ON CONFLICT ({', '.join(key_cols)}) {action}"
+            return sql
+        if operation == "update":
+            sets = ", ".join(f"{col} = {ph(col)}" for col in cols if col not in key_cols)
+            return f"UPDATE {table} SET {sets} WHERE {where}"
+        if operation == "select":
+            sql = f"SELECT {', '.join(cols) or '*'} FROM {table}"
+            return f"{sql} WHERE {where}" if key_cols else sql
+        if operation == "delete":
+            sql = f"DELETE FROM {table}"
+            return f"{sql} WHERE {where}" if key_cols else sql
+        if operation == "copy":
+            return f"COPY {table} ({', '.join(cols)}) FROM STDIN WITH (FORMAT csv)"
+        raise ValueError(f"Invalid operation {operation}")
+
+    sql = build(lambda col: f"%({col})s")
+    if operation == "insert":
+        params = cols
+    elif operation == "update":
+        params = tuple(col for col in cols if col not in key_cols) + key_cols
+    elif operation in ("select", "delete"):
+        params = key_cols
+    elif operation in ("insert_values", "upsert"):
+        template = f"({', '.join(f'%({col})s' for col in cols)})"
+    prepared_sql = None
+    name = None
+    if operation in ("insert", "update", "select", "delete"):
+        prepared_sql = build(lambda col: f"${params.index(col) + 1}")
+        name = f"pihome_{zlib.crc32(sql.encode()):08x}"
+    return SQLShape(sql, template, params, prepared_sql, name)
+
+
+def register_insert_hook(table: str, hook: InsertHook):
+    """
+    Registers a hook that every DBMgr in the process runs after inserting rows into a table. The
+    hook is called with the cursor and the inserted rows inside the insert transaction, within a
+    savepoint, so derived tables are updated atomically with the insert. A hook that fails is
+    rolled back to the savepoint and logged without failing the insert. Registering the same hook
+    twice has no effect.
+
+    Args:
+        table (str): The table name.
+        hook (InsertHook): The hook.
+    """
+    hooks = _INSERT_HOOKS.setdefault(table, [])
+    if hook not in hooks:
+        hooks.append(hook)
+
+
+def has_insert_hooks(table: str) -> bool:
+    """
+    Checks whether insert hooks are registered for a table.
+
+    Args:
+        table (str): The table name.
+
+    Returns:
+        bool: True if at least one hook is registered.
+    """
+    return bool(_INSERT_HOOKS.get(table))
+
+
+def _to_csv_field(value: Any) -> str:
+    """
+    Converts a value to a quoted CSV field for COPY. None is returned as an unquoted empty field
+    which COPY reads as NULL.
+
+    Args:
+        value (Any): The value to convert.
+
+    Returns:
+        str: The CSV field.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (dt.date, dt.time)):
+        value = value.isoformat()
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value, default=str)
+    value = str(value).replace('"', '""')
+    return f'"{value}"'
+
 
 class DBMgr:
     """
     This class is responsible for managing the database. Allows the user to insert, update, fetch,
     and delete data from the db without writing any sql queries. If a DB connection is not available
-    then data is written to a file. The system should have a separate xdb process that can update
-    the databse from the file.
+    then data is appended to the XDB spool. The system should have a separate xdb process that can
+    update the databse from the spool. Connections come from a process wide pool so every manager in a
+    process that connects with the same parameters shares the same connections.
 
     Attributes:
-        xdb_file (Path): The path to the XDB file.
+        xdb_dir (Path): The XDB spool dir.
         retry_interval (int): The number of seconds to wait before retrying a failed DB update.
+        pool_min_size (int): Connections the shared pool keeps open while idle.
+        pool_max_size (int): Maximum connections the shared pool opens.
+        pool_idle_timeout (int): Seconds before idle connections above pool_min_size are closed.
+        pool_health_check_interval (int): Seconds a pooled connection can be idle before it is
+            checked on checkout. Only used when optimistic is False.
+        bulk_page_size (int): Rows packed into each INSERT statement by bulk_insert_data.
+        copy_threshold (int): Batches with at least this many rows are loaded with COPY.
+        prepare_statements (bool): Run generated single row statements as server side prepared
+            statements.
+        optimistic (bool): Run queries without checking the connection first. A query that fails
+            with a connection error is retried once on a fresh connection.
+        stream_itersize (int): Rows fetched per network round trip by stream_data and
+            stream_raw.
+        buffer_max_rows (int): Rows held by buffer_insert_data for a table before it is flushed.
+        buffer_max_age (float): Seconds the oldest buffered row waits before the buffer is
+            flushed.
+        keepalive_params (Dict[str, int]): TCP keepalive settings so dead connections are detected
+            by the OS instead of a probe query.
         db_params (Dict[str,str]): Containing all the necessary information to connect to the
             DB.
         host (str): The database host.
         user (str): The user to connect to the DB as.
-        conn (psycopg2.connection): The connection to the DB.
+        pool (ConnectionPool): The shared connection pool for the DB.
     """
 
-    xdb_dir = constants.data_dir
+    xdb_dir = constants.xdb_dir
     retry_interval = 300
+    pool_min_size = 1
+    pool_max_size = 5
+    pool_idle_timeout = 300
+    pool_health_check_interval = 60
+    optimistic = True
+    bulk_page_size = 500
+    copy_threshold = 5000
+    prepare_statements = False
+    stream_itersize = 2000
+    buffer_max_rows = constants.db_buffer_max_rows
+    buffer_max_age = constants.db_buffer_max_age
+    keepalive_params = {
+        "keepalives": 1,
+        "keepalives_idle": 60,
+        "keepalives_interval": 10,
+        "keepalives_count": 3,
+    }
 
     def __init__(
         self,
@@ -101,29 +293,44 @@ class DBMgr:
             self.db_params["options"] = options
         if kwargs:
             self.db_params.update(kwargs)
+        for key, value in self.keepalive_params.items():
+            self.db_params.setdefault(key, value)
         self.host = host
         self.dbname = dbname
         self.user = user
         self.db_options = options
         self.db_kwargs = kwargs
-        self.conn = None
+        self.pool = get_pool(
+            self.db_params,
+            min_size=self.pool_min_size,
+            max_size=self.pool_max_size,
+            idle_timeout=self.pool_idle_timeout,
+            health_check_interval=None if self.optimistic else self.pool_health_check_interval,
+        )
+        self.__released = False
+        self.__local = threading.local()
+        self.__buffer: Dict[Tuple[str, Tuple[str, ...]], List[Dict[str, Any]]] = {}
+        self.__buffer_lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__flush_timer: Optional[threading.Timer] = None
         self.connect()
 
     def exit(self):
         """
-        Closes the DB manager. Closes the connection and stops the xdb thread.
+        Closes the DB manager. Buffered rows are flushed and the shared pool is released, which
+        closes its connections once no other manager in the process is using it.
         """
-        if self.is_connected():
-            _LOG.info("Closing DB connection.")
-            self.conn.close()
+        if not self.__released:
+            self.flush_buffer()
+            self.__released = True
+            release_pool(self.pool)
 
     def connect(self):
         """
-        Connect to the DB server. Only connects if a previous connection is not present.
+        Connect to the DB server. Only opens connections if the pool does not already hold them.
         """
         try:
-            if not self.is_connected():
-                self.conn = psycopg2.connect(**self.db_params)
+            self.pool.fill()
             _LOG.info(f"Connected to DB {self.dbname} on {self.host} as {self.user}")
         except Exception as ex:
             _LOG.error(f"{type(ex).__name__}: {str(ex)}")
@@ -131,38 +338,184 @@ class DBMgr:
                 "Failed to connect to DB. Queries will be written to a file until DB connection "
                 "can be re-established."
             )
-            self.conn = None
 
     def is_connected(self) -> bool:
         """
-        Checks if the DB server is connected. Runs a simple query as a test.
+        Checks if the DB server is connected. This is a local check of the pooled connections and
+        does not run a query. Dead connections are detected through TCP keepalives.
 
         Returns:
             bool: True if connected. False otherwise.
         """
-        if self.conn is None or self.conn.closed:
-            return False
+        return self.pool.is_connected()
+
+    def _execute(self, func: Callable[[psycopg2.extensions.cursor], Any]) -> Any:
+        """
+        Runs func with a cursor from a pooled connection inside a transaction. The transaction is
+        committed when func returns and rolled back if it raises. In optimistic mode a connection
+        error caused by a broken connection is retried once on a fresh connection.
+
+        Args:
+            func (Callable[[psycopg2.extensions.cursor], Any]): Executes the queries.
+
+        Raises:
+            DBConnectionError: If connection to the DB could not be established.
+
+        Returns:
+            Any: The value returned by func.
+        """
+        cursor = getattr(self.__local, "cursor", None)
+        if cursor is not None:
+            return func(cursor)
+        attempts = 2 if self.optimistic else 1
+        for attempt in range(1, attempts + 1):
+            conn = self.pool.getconn()
+            try:
+                with conn:
+                    with conn.cursor() as c:
+                        result = func(c)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as ex:
+                broken = conn.closed != 0
+                self.pool.putconn(conn, discard=broken)
+                if not broken or attempt == attempts:
+                    raise
+                _LOG.warning(f"{type(ex).__name__}: {str(ex).strip()}. Reconnecting to retry.")
+                continue
+            except BaseException:
+                self.pool.putconn(conn)
+                raise
+            self.pool.putconn(conn)
+            return result
+
+    @contextmanager
+    def transaction(self) -> Iterator["DBMgr"]:
+        """
+        Runs every operation the current thread makes on this manager inside the block as a
+        single transaction on one pooled connection. The transaction is committed when the block
+        exits and rolled back if it raises. Errors are not written to XDB inside a transaction so
+        operations should be called with update_xdb=False. Nested calls join the outer transaction.
+
+        Raises:
+            DBConnectionError: If connection to the DB could not be established.
+
+        Yields:
+            DBMgr: This manager.
+        """
+        if getattr(self.__local, "cursor", None) is not None:
+            yield self
+            return
+        conn = self.pool.getconn()
         try:
-            with self.conn:
-                with self.conn.cursor() as c:
-                    c.execute("SELECT NOW()")
-                    row = c.fetchone()
-                    if row:
-                        connected = True
-        except Exception as ex:
-            connected = False
-        finally:
-            return connected
+            with conn:
+                with conn.cursor() as c:
+                    self.__local.cursor = c
+                    try:
+                        yield self
+                    finally:
+                        self.__local.cursor = None
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.pool.putconn(conn, discard=conn.closed != 0)
+            raise
+        except BaseException:
+            self.pool.putconn(conn)
+            raise
+        self.pool.putconn(conn)
+
+    def _run(
+        self,
+        c: psycopg2.extensions.cursor,
+        sql: Union[str, SQLShape],
+        params: Union[List[Any], Dict[str, Any]],
+    ):
+        """
+        Executes a single statement. Generated statements are run as server side prepared
+        statements when prepare_statements is enabled. Each pooled connection prepares a statement
+        the first time it runs it.
+
+        Args:
+            c (psycopg2.extensions.cursor): The cursor to execute with.
+            sql (Union[str, SQLShape]): Raw sql or a statement generated by build_sql.
+            params (Union[List[Any], Dict[str, Any]]): The query parameters.
+        """
+        if not isinstance(sql, SQLShape):
+            _LOG.info(f"Executing query: {sql}")
+            c.execute(sql, params)
+            return
+        prepared = getattr(c.connection, "prepared", None)
+        if not self.prepare_statements or sql.prepared_sql is None or prepared is None:
+            _LOG.info(f"Executing query: {sql.sql}")
+            c.execute(sql.sql, params)
+            return
+        if sql.name not in prepared:
+            _LOG.info(f"Preparing query {sql.name}: {sql.prepared_sql}")
+            c.execute(f"PREPARE {sql.name} AS {sql.prepared_sql}")
+            prepared.add(sql.name)
+        _LOG.info(f"Executing prepared query {sql.name}: {sql.sql}")
+        if sql.params:
+            placeholders = ", ".join(["%s"] * len(sql.params))
+            c.execute(
+                f"EXECUTE {sql.name} ({placeholders})", [params[col] for col in sql.params]
+            )
+        else:
+            c.execute(f"EXECUTE {sql.name}")
+
+    def _write(
+        self, sql: Union[str, SQLShape], data: Union[Dict[str, Any], List[Dict[str, Any]]]
+    ):
+        """
+        Executes a write query in its own transaction. A list of dicts executes the query once per
+        item.
+
+        Args:
+            sql (Union[str, SQLShape]): Raw sql or a statement generated by build_sql.
+            data (Union[Dict[str, Any], List[Dict[str, Any]]]): The query parameters.
+        """
+
+        def write(c: psycopg2.extensions.cursor):
+            if isinstance(data, list):
+                query = sql.sql if isinstance(sql, SQLShape) else sql
+                _LOG.info(f"Executing query: {query} ({len(data)} rows)")
+                c.executemany(query, data)
+            else:
+                self._run(c, sql, data)
+
+        self._execute(write)
+
+    def _query(
+        self,
+        sql: Union[str, SQLShape],
+        params: Union[List[Any], Dict[str, Any]],
+        single_row: bool = False,
+    ) -> Union[List[Tuple], Tuple]:
+        """
+        Executes a select query and fetches the results.
+
+        Args:
+            sql (Union[str, SQLShape]): Raw sql or a statement generated by build_sql.
+            params (Union[List[Any], Dict[str, Any]]): The query parameters.
+            single_row (bool, optional): Fetch a single row instead of all rows. Defaults to False.
+
+        Returns:
+            Union[List[Tuple], Tuple]: A single row or a list containing multiple rows from the DB.
+        """
+
+        def query(c: psycopg2.extensions.cursor) -> Union[List[Tuple], Tuple]:
+            self._run(c, sql, params)
+            if single_row:
+                return c.fetchone()
+            return c.fetchall()
+
+        return self._execute(query)
 
     def insert_data(
         self, table: str, data: Union[Dict[str, Any], List[Dict[str, Any]]], update_xdb: bool = True
     ):
         """
         Insert data into a table. This function automatically generates the sql required for the
-        insert. If data param is a list, then it assumes that many rows need to be inserted;
-        otherwise a single row insert is performed when data is a dict. The data dictionary keys
-        are the column names as they appear in the table and the values are the values that need
-        to be inserted.
+        insert. If data param is a list, then it assumes that many rows need to be inserted and
+        bulk_insert_data is used; otherwise a single row insert is performed when data is a dict.
+        The data dictionary keys are the column names as they appear in the table and the values
+        are the values that need to be inserted.
 
         Args:
             table (str): The table name to insert data into.
@@ -175,25 +528,18 @@ class DBMgr:
             NoConnection: If connection to the DB could not be established.
         """
         if isinstance(data, list):
-            cols = data[0].keys()
-        else:
-            cols = data.keys()
-        col_str = ", ".join(f"%({col})s" for col in cols)
-        sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({col_str})"
+            self.bulk_insert_data(table, data, update_xdb=update_xdb)
+            return
+        sql = build_sql("insert", table, tuple(data))
+
+        def insert(c: psycopg2.extensions.cursor):
+            self._run(c, sql, data)
+            self._run_insert_hooks(c, table, [data])
+
         try:
-            if not self.is_connected():
-                self.connect()
-            if self.conn is None:
-                raise DBConnectionError("No connection to database.")
-            with self.conn:
-                with self.conn.cursor() as c:
-                    _LOG.info(f"Executing query: {sql}")
-                    if isinstance(data, list):
-                        c.executemany(sql, data)
-                    else:
-                        c.execute(sql, data)
+            self._execute(insert)
             _LOG.info("Data inserted successfully")
-        except (psycopg2.OperationalError, DBConnectionError) as ex:
+        except (psycopg2.OperationalError, psycopg2.InterfaceError, DBConnectionError) as ex:
             _LOG.error(f"{type(ex).__name__}: {str(ex)}")
             if update_xdb:
                 _LOG.warning(f"Connection error. Data Will be written to file to be updated later.")
@@ -201,6 +547,154 @@ class DBMgr:
             else:
                 raise
 
+    def bulk_insert_data(
+        self,
+        table: str,
+        data: List[Dict[str, Any]],
+        page_size: int = None,
+        update_xdb: bool = True,
+    ):
+        """
+        Inserts many rows into a table in a single transaction. Batches smaller than
+        copy_threshold are sent with execute_values, which packs page_size rows into each INSERT
+        statement. Larger batches are streamed with COPY FROM STDIN from an in memory CSV buffer.
+        All dicts in data must have the same keys as the first one.
+
+        Args:
+            table (str): The table name to insert data into.
+            data (List[Dict[str, Any]]): The rows to insert.
+            page_size (int, optional): Rows per INSERT statement. Defaults to bulk_page_size.
+            update_xdb (bool, optional): Indicates whether to write data to xdb file if insert
+                fails. Defaults to True.
+
+        Raises:
+            NoConnection: If connection to the DB could not be established.
+        """
+        if not data:
+            return
+        cols = tuple(data[0])
+        if page_size is None:
+            page_size = self.bulk_page_size
+
+        def insert(c: psycopg2.extensions.cursor):
+            if len(data) >= self.copy_threshold:
+                _LOG.info(f"Copying {len(data)} rows into {table}")
+                self._copy_rows(c, table, cols, data)
+            else:
+                sql = build_sql("insert_values", table, cols)
+                _LOG.info(f"Executing query: {sql.sql} ({len(data)} rows)")
+                psycopg2.extras.execute_values(
+                    c, sql.sql, data, template=sql.template, page_size=page_size
+                )
+            self._run_insert_hooks(c, table, data)
+
+        try:
+            self._execute(insert)
+            _LOG.info(f"{len(data)} rows inserted successfully")
+        except (psycopg2.OperationalError, psycopg2.InterfaceError, DBConnectionError) as ex:
+            _LOG.error(f"{type(ex).__name__}: {str(ex)}")
+            if update_xdb:
+                _LOG.warning(f"Connection error. Data Will be written to file to be updated later.")
+                self.write_xdb("insert", {"table": table, "data": data})
+            else:
+                raise
+
+    @staticmethod
+    def _run_insert_hooks(c: psycopg2.extensions.cursor, table: str, rows: List[Dict[str, Any]]):
+        """
+        Runs the insert hooks registered for a table, each within its own savepoint.
+
+        Args:
+            c (psycopg2.extensions.cursor): The cursor of the insert transaction.
+            table (str): The table the rows were inserted into.
+            rows (List[Dict[str, Any]]): The inserted rows.
+        """
+        for hook in _INSERT_HOOKS.get(table, ()):
+            c.execute("SAVEPOINT pihome_insert_hook")
+            try:
+                hook(c, rows)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                raise
+            except Exception as ex:
+                _LOG.error(f"Insert hook {hook!r} failed for {table}")
+                _LOG.error(f"{type(ex).__name__}: {str(ex).strip()}")
+                c.execute("ROLLBACK TO SAVEPOINT pihome_insert_hook")
+            else:
+                c.execute("RELEASE SAVEPOINT pihome_insert_hook")
+
+    @staticmethod
+    def _copy_rows(
+        c: psycopg2.extensions.cursor, table: str, cols: List[str], data: List[Dict[str, Any]]
+    ):
+        """
+        Loads rows into a table with COPY FROM STDIN. The rows are written to an in memory CSV
+        buffer where every value is quoted so that only None is read back as NULL.
+
+        Args:
+            c (psycopg2.extensions.cursor): The cursor to copy with.
+            table (str): The table name to copy data into.
+            cols (List[str]): The columns to copy.
+            data (List[Dict[str, Any]]): The rows to copy.
+        """
+        buf = io.StringIO()
+        for row in data:
+            buf.write(",".join(_to_csv_field(row[col]) for col in cols))
+            buf.write("\n")
+        buf.seek(0)
+        c.copy_expert(build_sql("copy", table, tuple(cols)).sql, buf)
+
+    def buffer_insert_data(self, table: str, data: Dict[str, Any]):
+        """
+        Queues a row to be inserted later together with other buffered rows (write-behind). The
+        buffered rows of a table are sent with one multi row insert in one transaction when
+        buffer_max_rows rows are waiting, when the oldest row has waited buffer_max_age seconds,
+        or when flush_buffer or exit is called. Rows that cannot be written because the DB is
+        unreachable are written to XDB. Use insert_data instead when the row must be visible to
+        readers right away.
+
+        Args:
+            table (str): The table name to insert data into.
+            data (Dict[str, Any]): The row to insert.
+        """
+        key = (table, tuple(data))
+        with self.__buffer_lock:
+            rows = self.__buffer.setdefault(key, [])
+            rows.append(data)
+            full = len(rows) >= self.buffer_max_rows
+            if not full and (self.__flush_timer is None or not self.__flush_timer.is_alive()):
+                self.__flush_timer = threading.Timer(self.buffer_max_age, self.flush_buffer)
+                self.__flush_timer.daemon = True
+                self.__flush_timer.start()
+        if full:
+            self.flush_buffer()
+
+    def flush_buffer(self):
+        """
+        Inserts all rows queued by buffer_insert_data. Each table is written with one multi row
+        statement in its own transaction and written to XDB if the DB cannot be reached. If the DB
+        rejects a batch, its rows are inserted one at a time so a single bad row does not drop the
+        others.
+        """
+        with self.__flush_lock:
+            with self.__buffer_lock:
+                buffer, self.__buffer = self.__buffer, {}
+                if self.__flush_timer is not None:
+                    self.__flush_timer.cancel()
+                    self.__flush_timer = None
+            for (table, _), rows in buffer.items():
+                _LOG.info(f"Flushing {len(rows)} buffered rows into {table}")
+                try:
+                    self.bulk_insert_data(table, rows)
+                except psycopg2.Error as ex:
+                    _LOG.error(f"{type(ex).__name__}: {str(ex).strip()}")
+                    _LOG.warning(f"Buffered rows for {table} rejected. Inserting one at a time.")
+                    for row in rows:
+                        try:
+                            self.insert_data(table, row)
+                        except psycopg2.Error as ex:
+                            _LOG.error(f"Dropping rejected row {row}")
+                            _LOG.error(f"{type(ex).__name__}: {str(ex).strip()}")
+
     def update_data(
         self,
         table: str,
@@ -230,25 +724,13 @@ class DBMgr:
             NoConnection: If connection to the DB could not be established.
         """
         if isinstance(data, list):
-            cols = data[0].keys()
+            cols = tuple(data[0])
         else:
-            cols = data.keys()
-        col_str = ", ".join(f"{col} = %({col})s" for col in cols if col not in key_cols)
-        key_col_str = " AND ".join(f"{col} = %({col})s" for col in key_cols)
-        sql = f"UPDATE {table} SET {col_str} WHERE {key_col_str}"
+            cols = tuple(data)
+        sql = build_sql("update", table, cols, tuple(key_cols))
         try:
-            if not self.is_connected():
-                self.connect()
-            if self.conn is None:
-                raise DBConnectionError("No connection to database.")
-            with self.conn:
-                with self.conn.cursor() as c:
-                    _LOG.info(f"Executing query: {sql}")
-                    if isinstance(data, list):
-                        c.executemany(sql, data)
-                    else:
-                        c.execute(sql, data)
-        except (psycopg2.OperationalError, DBConnectionError) as ex:
+            self._write(sql, data)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError, DBConnectionError) as ex:
             _LOG.error(f"{type(ex).__name__}: {str(ex)}")
             if update_xdb:
                 _LOG.warning(f"Connection error. Data Will be written to file to updated later.")
@@ -284,41 +766,150 @@ class DBMgr:
         Returns:
             Union[List[Tuple], Tuple]: A single row or a list containing multiple rows from the DB.
         """
-        if cols is None:
-            col_str = "*"
-        else:
-            col_str = ", ".join(cols)
-        sql = f"SELECT {col_str} FROM {table}"
-        if condition:
-            condition_cols = condition.keys()
-            condition_str = " AND ".join(f"{col} = %({col})s" for col in condition_cols)
-            sql += f" WHERE {condition_str}"
-        if not self.is_connected():
-            self.connect()
-        if self.conn is None:
-            raise DBConnectionError("No connection to database.")
-        with self.conn:
-            with self.conn.cursor() as c:
-                _LOG.info(f"Executing query: {sql}")
-                c.execute(sql, condition)
-                if single_row:
-                    return_data = c.fetchone()
-                else:
-                    return_data = c.fetchall()
-        return return_data
+        sql = build_sql("select", table, tuple(cols or ()), tuple(condition))
+        return self._query(sql, condition, single_row)
 
     def fetch_raw(
         self, sql: str, params: Union[List[Any], Dict[str, Any]] = [], single_row: bool = False
     ) -> Union[List[Tuple], Tuple]:
-        with self.conn:
-            with self.conn.cursor() as c:
-                _LOG.info(f"Executing query: {sql}")
+        """
+        Runs a raw sql query and fetches the results. Useful for queries that cannot be expressed
+        through fetch_data such as aggregates or functions in the where clause.
+
+        Args:
+            sql (str): The query to run.
+            params (Union[List[Any], Dict[str, Any]], optional): The query parameters. Defaults to
+                [].
+            single_row (bool, optional): Whether the query should return only one row or multiple.
+                Defaults to False.
+
+        Raises:
+            NoConnection: If connection to the DB could not be established.
+
+        Returns:
+            Union[List[Tuple], Tuple]: A single row or a list containing multiple rows from the DB.
+        """
+        return self._query(sql, params, single_row)
+
+    def execute_raw(self, sql: str, params: Union[List[Any], Dict[str, Any]] = []) -> int:
+        """
+        Runs a raw sql statement that does not return rows, such as DDL or a set based UPDATE or
+        DELETE. Connection errors are raised and not written to XDB.
+
+        Args:
+            sql (str): The statement to run.
+            params (Union[List[Any], Dict[str, Any]], optional): The statement parameters.
+                Defaults to [].
+
+        Raises:
+            NoConnection: If connection to the DB could not be established.
+
+        Returns:
+            int: The number of rows affected.
+        """
+
+        def execute(c: psycopg2.extensions.cursor) -> int:
+            self._run(c, sql, params)
+            return c.rowcount
+
+        return self._execute(execute)
+
+    def stream_data(
+        self,
+        table: str,
+        cols: List[str] = None,
+        condition: Dict[str, Any] = {},
+        itersize: int = None,
+        columnar: bool = False,
+    ) -> Iterator[Union[Tuple, Dict[str, Any]]]:
+        """
+        Streams rows from a table with a server side cursor so large results are processed in
+        constant memory. The query is generated the same way as fetch_data. See stream_raw.
+
+        Args:
+            table (str): The table name to fetch data from.
+            cols (List[str], optional): The list of columns to fetch. If this value is None then '*'
+                is used in the query. Defaults to None.
+            condition (Dict[str, Any], optional): Used to generate the where clause as needed. If
+                this is empty then no where clause is used and all rows are fetched. Defaults to {}.
+            itersize (int, optional): Rows fetched per round trip. Defaults to stream_itersize.
+            columnar (bool, optional): Yield batches of columns instead of rows. Defaults to False.
+
+        Raises:
+            NoConnection: If connection to the DB could not be established.
+
+        Yields:
+            Union[Tuple, Dict[str, Any]]: A row, or a batch of columns in columnar mode.
+        """
+        sql = build_sql("select", table, tuple(cols or ()), tuple(condition))
+        yield from self.stream_raw(sql.sql, condition, itersize, columnar)
+
+    def stream_raw(
+        self,
+        sql: str,
+        params: Union[List[Any], Dict[str, Any]] = [],
+        itersize: int = None,
+        columnar: bool = False,
+    ) -> Iterator[Union[Tuple, Dict[str, Any]]]:
+        """
+        Runs a raw sql query on a named server side cursor and yields the results as they are
+        fetched, itersize rows per round trip, instead of materializing them with fetchall. A
+        pooled connection is held until the generator is exhausted or closed, so the generator
+        should be consumed in a for loop or closed explicitly. Inside transaction() the cursor is
+        opened on the transaction's connection.
+
+        In columnar mode each batch of itersize rows is yielded as a dict of column name to the
+        column values, as a numpy array if numpy is installed or a list otherwise.
+
+        Args:
+            sql (str): The query to run.
+            params (Union[List[Any], Dict[str, Any]], optional): The query parameters. Defaults to
+                [].
+            itersize (int, optional): Rows fetched per round trip. Defaults to stream_itersize.
+            columnar (bool, optional): Yield batches of columns instead of rows. Defaults to False.
+
+        Raises:
+            NoConnection: If connection to the DB could not be established.
+
+        Yields:
+            Union[Tuple, Dict[str, Any]]: A row, or a batch of columns in columnar mode.
+        """
+        itersize = itersize or self.stream_itersize
+        name = f"pihome_stream_{next(_CURSOR_IDS)}"
+
+        def stream(conn: psycopg2.extensions.connection):
+            with conn.cursor(name=name) as c:
+                c.itersize = itersize
+                _LOG.info(f"Streaming query: {sql}")
                 c.execute(sql, params)
-                if single_row:
-                    return_data = c.fetchone()
-                else:
-                    return_data = c.fetchall()
-        return return_data
+                if not columnar:
+                    yield from c
+                    return
+                while True:
+                    rows = c.fetchmany(itersize)
+                    if not rows:
+                        return
+                    cols = [desc[0] for desc in c.description]
+                    yield {
+                        col: numpy.array(values) if numpy is not None else list(values)
+                        for col, values in zip(cols, zip(*rows))
+                    }
+
+        cursor = getattr(self.__local, "cursor", None)
+        if cursor is not None:
+            yield from stream(cursor.connection)
+            return
+        conn = self.pool.getconn()
+        try:
+            with conn:
+                yield from stream(conn)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.pool.putconn(conn, discard=conn.closed != 0)
+            raise
+        except BaseException:
+            self.pool.putconn(conn)
+            raise
+        self.pool.putconn(conn)
 
     def insert_or_update_data(
         self,
@@ -328,28 +919,42 @@ class DBMgr:
         update_xdb: bool = True,
     ):
         """
-        Wrapper method to make insert or update an atomic operation. This is useful when it is not
-        known whether data exists in the table. Using this function also has the benefit of not
-        failing when a DB connection does not exist. If no DB connection is available this method
-        ensures that once re-established the data will be properly handled. The data and key_cols
-        parameters work the same way as they do for insert and update methods.
+        Inserts rows or updates them if they already exist as a single atomic statement. This is
+        useful when it is not known whether data exists in the table. A single
+        INSERT ... ON CONFLICT (key_cols) DO UPDATE statement is generated for both single rows and
+        batches, so key_cols must match a primary key or unique constraint on the table. Using
+        this function also has the benefit of not failing when a DB connection does not exist. If
+        no DB connection is available this method ensures that once re-established the data will
+        be properly handled. The data and key_cols parameters work the same way as they do for
+        insert and update methods.
 
         Args:
             table (str): The table name to fetch data from.
             data (Union[Dict[str, Any], List[Dict[str, Any]]]): The data to insert/update. List of
                 dicts updates multiple rows and a dict updates a single row.
-            key_cols (List[str]): The columns part of the where clause. These must also be present
-                in the data dict. Only used when insert fails and update is needed.
+            key_cols (List[str]): The columns of the conflicting unique constraint. These must also
+                be present in the data dict.
             update_xdb (bool, optional): Indicates whether to write data to xdb file if
                 insert/update fails. Defaults to True.
         """
+        rows = data if isinstance(data, list) else [data]
+        if not rows:
+            return
+        sql = build_sql("upsert", table, tuple(rows[0]), tuple(key_cols))
+        if len(rows) > 1:
+            # a single statement cannot affect the same row twice so keep the last row per key
+            rows = list({tuple(row[col] for col in key_cols): row for row in rows}.values())
+
+        def upsert(c: psycopg2.extensions.cursor):
+            _LOG.info(f"Executing query: {sql.sql} ({len(rows)} rows)")
+            psycopg2.extras.execute_values(
+                c, sql.sql, rows, template=sql.template, page_size=self.bulk_page_size
+            )
+
         try:
-            try:
-                self.insert_data(table, data, update_xdb=False)
-            except psycopg2.IntegrityError:
-                _LOG.info(f"Data already in {table}. Attempting to update {table}")
-                self.update_data(table, data, key_cols, update_xdb=False)
-        except (psycopg2.OperationalError, DBConnectionError) as ex:
+            self._execute(upsert)
+            _LOG.info(f"Data inserted or updated successfully")
+        except (psycopg2.OperationalError, psycopg2.InterfaceError, DBConnectionError) as ex:
             _LOG.error(f"{type(ex).__name__}: {str(ex)}")
             if update_xdb:
                 _LOG.warning(f"Connection error. Data Will be written to file to be updated later.")
@@ -375,22 +980,11 @@ class DBMgr:
         Raises:
             NoConnection: If connection to the DB could not be established.
         """
-        sql = f"DELETE FROM {table}"
-        if condition:
-            condition_cols = condition.keys()
-            condition_str = " AND ".join(f"{col} = %({col})s" for col in condition_cols)
-            sql += f" WHERE {condition_str}"
+        sql = build_sql("delete", table, (), tuple(condition))
         try:
-            if not self.is_connected():
-                self.connect()
-            if self.conn is None:
-                raise DBConnectionError("No connection to database.")
-            with self.conn:
-                with self.conn.cursor() as c:
-                    _LOG.info(f"Executing query: {sql}")
-                    c.execute(sql, condition)
+            self._write(sql, condition)
             _LOG.info("Matching rows deleted successfully")
-        except (psycopg2.OperationalError, DBConnectionError) as ex:
+        except (psycopg2.OperationalError, psycopg2.InterfaceError, DBConnectionError) as ex:
             _LOG.error(f"{type(ex).__name__}: {str(ex)}")
             if update_xdb:
                 _LOG.warning(f"Connection error. Data Will be written to file to be updated later.")
@@ -400,9 +994,9 @@ class DBMgr:
 
     def write_xdb(self, txn_type: str, params: Dict[str, Any]):
         """
-        Writes the data to a json file. This function is called when a DB transactions fails due to
-        a connection error. The xdb file is updated with the txn_type and the required params for
-        the transaction. This allows transactions to be properly executed later.
+        Appends the transaction to the XDB spool. This function is called when a DB transactions
+        fails due to a connection error. The spool record holds the txn_type and the required
+        params for the transaction. This allows transactions to be properly executed later.
 
         Args:
             txn_type (str): The type of transaction such as insert,delete, or update.
@@ -417,7 +1011,4 @@ class DBMgr:
             "dboptions": self.db_options,
             "dbkwargs": self.db_kwargs,
         }
-        xdb_file = (
-            self.xdb_dir / f"{os.getpid()}_txn_{dt.datetime.now().strftime('%Y%m%d_%H%S%M%f')}.xdb"
-        )
-        write_json_data(xdb_file, data, stage=True)
+        get_spool_writer(self.xdb_dir).append(data)
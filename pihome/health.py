@@ -44,6 +44,8 @@ from gpiozero import CPUTemperature
 import pihome.constants as constants
 from pihome.db import DBMgr
 from pihome.log import log_dict
+from pihome.latest import register as register_latest
+from pihome.rollup import register as register_rollups
 from pihome.vault import VaultMgr
 
 _LOG = logging.getLogger(__name__)
@@ -57,16 +59,20 @@ class HealthMgr:
     __MEM_USAGE_MAX = 70
     __DISK_USAGE_MAX = 90
 
-    def __init__(self, vault: VaultMgr) -> None:
+    def __init__(self, vault: VaultMgr, buffer_writes: bool = False) -> None:
         _LOG.info("Initializing health monitor.")
+        self.buffer_writes = buffer_writes
         self.__vault = vault
         self.__connect_to_database()
 
     def __connect_to_database(self):
         """
-        Connects to the database by initializing the db manager.
+        Connects to the database by initializing the db manager. Raw rows inserted through it
+        also update the rollup tables and latest_state.
         """
         db_params = self.__get_databse_params()
+        register_rollups()
+        register_latest()
         self.db = DBMgr(**db_params)
 
     def __get_databse_params(self) -> Dict[str, Any]:
@@ -131,7 +137,8 @@ class HealthMgr:
 
     def update_db_system_stats(self, stats: Dict[str, Any]):
         """
-        Adds the supplied system stats to the database
+        Adds the supplied system stats to the database. The row is buffered if buffer_writes is
+        set, see DBMgr.buffer_insert_data.
 
         Args:
             stats (Dict[str, Any]): The stats to add to the database
@@ -141,7 +148,10 @@ class HealthMgr:
         """
         if not ("datetime" in stats and "nodename" in stats):
             raise ValueError("Missing primary key columns: nodename, datetime")
-        self.db.insert_data(self.__STAT_TABLE, stats)
+        if self.buffer_writes:
+            self.db.buffer_insert_data(self.__STAT_TABLE, stats)
+        else:
+            self.db.insert_data(self.__STAT_TABLE, stats)
 
 
 def get_uptime() -> str:
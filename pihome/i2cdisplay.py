@@ -48,6 +48,7 @@ from PIL import Image, ImageDraw, ImageFont
 
 import pihome.constants as constants
 from pihome.db import DBMgr
+from pihome.latest import fetch_latest
 from pihome.log import log_dict
 
 _LOG = logging.getLogger(__name__)
@@ -121,7 +122,7 @@ class Display:
 
     def get_sensor_data(self) -> Dict[str, Any]:
         """
-        Fetches the latest sensor data from the db
+        Fetches the latest sensor data of the location from latest_state in the db
 
         Raises:
             Exception: If no data is found for today's date.
@@ -129,24 +130,18 @@ class Display:
         Returns:
             Dict[str,Any]: The sensor data: temperature, humidity, location
         """
-        sql = (
-            f"SELECT MAX(datetime) FROM {self.__SENSOR_TABLE} "
-            "WHERE DATE(datetime) = %s AND location = %s"
-        )
-        params = [dt.date.today(), self.location]
+        today = dt.datetime.combine(dt.date.today(), dt.time())
         _LOG.info(f"Fetching latest sensor update for today {dt.date.today()}")
-        row = self.db.fetch_raw(sql, params, single_row=True)
-        if not row:
+        latest = fetch_latest(self.db, self.__SENSOR_TABLE, self.location, today)
+        if self.location not in latest:
             raise Exception(f"Could not fetch data for {dt.date.today()}")
-        max_datetime = row[0]
-        _LOG.info(f"Latest sensor update: {max_datetime}")
-        row = self.db.fetch_data(
-            self.__SENSOR_TABLE,
-            ["temperature", "humidity", "location"],
-            {"datetime": max_datetime, "location": self.location},
-            single_row=True,
-        )
-        data = {"temperature": row[0], "humidity": row[1], "location": row[2]}
+        row = latest[self.location]
+        _LOG.info(f"Latest sensor update: {row['datetime']}")
+        data = {
+            "temperature": row["temperature"],
+            "humidity": row["humidity"],
+            "location": row["location"],
+        }
         _LOG.info("Fetched Data:")
         log_dict(data)
         return data
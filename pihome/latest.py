@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Latest row per key of the time-series tables
+File: latest
+Project: PiHome
+File Created: Saturday, 17th October 2026 11:58:14 pm
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import datetime as dt
+import json
+import logging
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+import psycopg2.extensions
+import psycopg2.extras
+
+from pihome.db import DBMgr, register_insert_hook
+
+_LOG = logging.getLogger(__name__)
+
+#: Time-series tables whose latest row per key_col is kept in latest_state. Tables without a
+#: key_col keep a single latest row under the empty key.
+LATEST: Dict[str, Dict[str, Any]] = {
+    "environment": {"key_col": "location"},
+    "power": {"key_col": None},
+    "system_stats": {"key_col": "nodename"},
+}
+
+_UPSERT_SQL = (
+    "INSERT INTO latest_state AS l (source, key, datetime, data) VALUES %s "
+    "ON CONFLICT (source, key) DO UPDATE SET datetime = EXCLUDED.datetime, data = EXCLUDED.data "
+    "WHERE EXCLUDED.datetime >= l.datetime"
+)
+
+
+def _json_default(value: Any) -> str:
+    """
+    Serializes the values json cannot. Dates and times use ISO format like to_jsonb.
+
+    Args:
+        value (Any): The value.
+
+    Returns:
+        str: The serialized value.
+    """
+    if isinstance(value, (dt.date, dt.time)):
+        return value.isoformat()
+    return str(value)
+
+
+_dumps = partial(json.dumps, default=_json_default)
+
+
+def create_latest_state(db: DBMgr, tables: List[str]):
+    """
+    Creates the latest_state table if it does not exist and seeds it with the latest rows of the
+    given tables that are tracked.
+
+    Args:
+        db (DBMgr): The DB manager for the tables' schema.
+        tables (List[str]): The tables in the schema.
+    """
+    with db.transaction():
+        db.execute_raw(
+            "CREATE TABLE IF NOT EXISTS latest_state (source TEXT NOT NULL, key TEXT NOT NULL, "
+            "datetime TIMESTAMP NOT NULL, data JSONB NOT NULL, PRIMARY KEY (source, key))"
+        )
+        for table in tables:
+            if table not in LATEST:
+                continue
+            key_col = LATEST[table]["key_col"]
+            _LOG.info(f"Seeding latest_state from {table}")
+            if key_col:
+                select = (
+                    f"SELECT DISTINCT ON ({key_col}) %s, {key_col}::TEXT, datetime, to_jsonb(t) "
+                    f"FROM {table} t ORDER BY {key_col}, datetime DESC"
+                )
+            else:
+                select = (
+                    f"SELECT %s, '', datetime, to_jsonb(t) FROM {table} t "
+                    "ORDER BY datetime DESC LIMIT 1"
+                )
+            db.execute_raw(
+                f"INSERT INTO latest_state (source, key, datetime, data) {select} "
+                "ON CONFLICT (source, key) DO NOTHING",
+                [table],
+            )
+
+
+def update_latest(table: str, c: psycopg2.extensions.cursor, rows: List[Dict[str, Any]]):
+    """
+    Upserts the newest of the inserted rows per key into latest_state. Rows older than the stored
+    state, such as late XDB replays, do not replace it. Registered as a DBMgr insert hook by
+    register so it runs in the insert transaction.
+
+    Args:
+        table (str): The time-series table.
+        c (psycopg2.extensions.cursor): The cursor of the insert transaction.
+        rows (List[Dict[str, Any]]): The inserted rows.
+    """
+    key_col = LATEST[table]["key_col"]
+    latest: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        when = row.get("datetime")
+        if not isinstance(when, dt.datetime):
+            continue
+        key = str(row.get(key_col)) if key_col else ""
+        if key not in latest or when >= latest[key]["datetime"]:
+            latest[key] = row
+    values = [
+        (table, key, row["datetime"], psycopg2.extras.Json(row, dumps=_dumps))
+        for key, row in latest.items()
+    ]
+    if values:
+        psycopg2.extras.execute_values(c, _UPSERT_SQL, values)
+
+
+_HOOKS = {table: partial(update_latest, table) for table in LATEST}
+
+
+def register():
+    """
+    Registers the latest_state insert hooks so every DBMgr in the process keeps latest_state up
+    to date as rows are inserted, including rows replayed from XDB. Safe to call more than once.
+    """
+    for table, hook in _HOOKS.items():
+        register_insert_hook(table, hook)
+
+
+def fetch_latest(
+    db: DBMgr, table: str, key: Optional[str] = None, since: Optional[dt.datetime] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetches the latest row per key of a table from latest_state with one primary key lookup.
+
+    Args:
+        db (DBMgr): The DB manager for the table's schema.
+        table (str): The time-series table.
+        key (Optional[str], optional): Only fetch this key. Defaults to None.
+        since (Optional[dt.datetime], optional): Skip keys not updated since then. Defaults to
+            None.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The latest row per key. Timestamps in the rows are ISO strings
+            except datetime which is the timestamp of the row.
+    """
+    sql = "SELECT key, datetime, data FROM latest_state WHERE source = %(source)s"
+    if key is not None:
+        sql += " AND key = %(key)s"
+    if since is not None:
+        sql += " AND datetime >= %(since)s"
+    rows = db.fetch_raw(sql, {"source": table, "key": key, "since": since})
+    return {key: {**data, "datetime": when} for key, when, data in rows}
@@ -0,0 +1,399 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Process wide DB connection pool for PiHome
+File: pool
+Project: PiHome
+File Created: Saturday, 17th October 2026 9:12:40 am
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+from pihome.exceptions import DBConnectionError
+
+_LOG = logging.getLogger(__name__)
+
+#: All pools in the current process keyed by their connection parameters.
+_POOLS: Dict[Tuple, "ConnectionPool"] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """
+    A psycopg2 connection that remembers the server side prepared statements created on it.
+
+    Attributes:
+        prepared (Set[str]): The names of the statements prepared on the connection.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.prepared: Set[str] = set()
+
+
+class ConnectionPool:
+    """
+    A thread safe pool of psycopg2 connections to a single database. Connections are handed out
+    with getconn and must be returned with putconn. Idle connections above the minimum size are
+    closed once they have been idle for longer than idle_timeout seconds. Connections that are
+    closed locally are never handed out, and if health_check_interval is set idle connections are
+    also checked with a query before they are handed out again.
+
+    Attributes:
+        db_params (Dict[str, Any]): The psycopg2 connection parameters.
+        min_size (int): The number of connections to keep open even when idle.
+        max_size (int): The maximum number of connections the pool will open.
+        idle_timeout (float): Seconds an idle connection above min_size is kept before closing.
+        health_check_interval (Optional[float]): Seconds a connection can be idle before it is
+            health checked on checkout. None disables the query based check.
+        refs (int): The number of DB managers currently using the pool.
+    """
+
+    def __init__(
+        self,
+        db_params: Dict[str, Any],
+        min_size: int = 1,
+        max_size: int = 5,
+        idle_timeout: float = 300,
+        health_check_interval: Optional[float] = 60,
+    ) -> None:
+        """
+        Initializes the pool. No connections are opened until one is requested.
+
+        Args:
+            db_params (Dict[str, Any]): The psycopg2 connection parameters.
+            min_size (int, optional): Connections kept open while idle. Defaults to 1.
+            max_size (int, optional): Maximum open connections. Defaults to 5.
+            idle_timeout (float, optional): Idle seconds before closing extra connections.
+                Defaults to 300.
+            health_check_interval (Optional[float], optional): Idle seconds before a connection is
+                tested on checkout. None disables the check. Defaults to 60.
+        """
+        if min_size > max_size:
+            raise ValueError(f"min_size {min_size} cannot be greater than max_size {max_size}")
+        self.db_params = db_params
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.refs = 0
+        self.closed = False
+        self.__idle: List[Tuple[psycopg2.extensions.connection, float]] = []
+        self.__used: Dict[int, psycopg2.extensions.connection] = {}
+        self.__pending = 0
+        self.__lock = threading.Condition()
+
+    @property
+    def size(self) -> int:
+        """
+        The number of connections currently open in the pool.
+        """
+        with self.__lock:
+            return len(self.__idle) + len(self.__used) + self.__pending
+
+    def __connect(self) -> psycopg2.extensions.connection:
+        """
+        Opens a new connection to the DB.
+
+        Raises:
+            DBConnectionError: If the connection could not be established.
+
+        Returns:
+            psycopg2.extensions.connection: The new connection.
+        """
+        try:
+            params = {"connection_factory": PooledConnection, **self.db_params}
+            conn = psycopg2.connect(**params)
+        except psycopg2.OperationalError as ex:
+            raise DBConnectionError(str(ex).strip()) from ex
+        _LOG.info(
+            f"Opened connection to DB {self.db_params.get('dbname')} on "
+            f"{self.db_params.get('host')} as {self.db_params.get('user')}"
+        )
+        return conn
+
+    @staticmethod
+    def __close(conn: psycopg2.extensions.connection):
+        """
+        Closes a connection ignoring any errors.
+
+        Args:
+            conn (psycopg2.extensions.connection): The connection to close.
+        """
+        try:
+            conn.close()
+        except Exception as ex:
+            _LOG.debug(f"{type(ex).__name__}: {str(ex)}")
+
+    @staticmethod
+    def __is_healthy(conn: psycopg2.extensions.connection) -> bool:
+        """
+        Runs a simple query on a connection to make sure it is still usable.
+
+        Args:
+            conn (psycopg2.extensions.connection): The connection to check.
+
+        Returns:
+            bool: True if the connection is usable. False otherwise.
+        """
+        if conn.closed:
+            return False
+        try:
+            with conn:
+                with conn.cursor() as c:
+                    c.execute("SELECT 1")
+                    c.fetchone()
+            return True
+        except Exception as ex:
+            _LOG.warning(f"Pooled connection failed health check. {type(ex).__name__}: {str(ex)}")
+            return False
+
+    def __prune(self):
+        """
+        Closes idle connections above min_size that have been idle for longer than idle_timeout.
+        Must be called with the lock held.
+        """
+        now = time.monotonic()
+        excess = len(self.__idle) + len(self.__used) + self.__pending - self.min_size
+        keep = []
+        # idle list is ordered oldest first so the least recently used connections are closed
+        for conn, last_used in self.__idle:
+            if excess > 0 and (conn.closed or now - last_used > self.idle_timeout):
+                _LOG.debug("Closing idle pooled connection.")
+                self.__close(conn)
+                excess -= 1
+            else:
+                keep.append((conn, last_used))
+        self.__idle = keep
+
+    def getconn(self, timeout: float = 30) -> psycopg2.extensions.connection:
+        """
+        Gets a connection from the pool. Reuses an idle connection if one is available, otherwise
+        opens a new one. If the pool is at max_size this waits for a connection to be returned.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a free connection. Defaults to 30.
+
+        Raises:
+            DBConnectionError: If the pool is closed, exhausted or the DB cannot be reached.
+
+        Returns:
+            psycopg2.extensions.connection: A connection ready to be used.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            conn = None
+            with self.__lock:
+                while True:
+                    if self.closed:
+                        raise DBConnectionError("Connection pool is closed.")
+                    self.__prune()
+                    if self.__idle:
+                        conn, last_used = self.__idle.pop()
+                        self.__used[id(conn)] = conn
+                        break
+                    if len(self.__used) + self.__pending < self.max_size:
+                        # reserve the slot so the pool never exceeds max_size while connecting
+                        self.__pending += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self.__lock.wait(remaining):
+                        raise DBConnectionError(
+                            f"Connection pool exhausted ({self.max_size} connections in use)."
+                        )
+            if conn is None:
+                try:
+                    conn = self.__connect()
+                finally:
+                    with self.__lock:
+                        self.__pending -= 1
+                        if conn is None:
+                            self.__lock.notify()
+                        else:
+                            self.__used[id(conn)] = conn
+                return conn
+            if not conn.closed and (
+                self.health_check_interval is None
+                or time.monotonic() - last_used < self.health_check_interval
+            ):
+                return conn
+            if self.health_check_interval is not None and self.__is_healthy(conn):
+                return conn
+            self.putconn(conn, discard=True)
+
+    def is_connected(self) -> bool:
+        """
+        Checks whether the pool holds at least one open connection. This only looks at the local
+        connection state and does not run a query.
+
+        Returns:
+            bool: True if an open connection exists. False otherwise.
+        """
+        with self.__lock:
+            conns = [conn for conn, _ in self.__idle] + list(self.__used.values())
+        return any(not conn.closed for conn in conns)
+
+    def putconn(self, conn: psycopg2.extensions.connection, discard: bool = False):
+        """
+        Returns a connection to the pool. Broken connections or connections with an open
+        transaction that cannot be rolled back are closed instead of being reused.
+
+        Args:
+            conn (psycopg2.extensions.connection): The connection to return.
+            discard (bool, optional): Close the connection instead of returning it to the idle
+                list. Defaults to False.
+        """
+        if not discard and not conn.closed:
+            if conn.status != psycopg2.extensions.STATUS_READY:
+                try:
+                    conn.rollback()
+                except Exception:
+                    discard = True
+        with self.__lock:
+            self.__used.pop(id(conn), None)
+            if discard or conn.closed or self.closed:
+                self.__close(conn)
+            else:
+                self.__idle.append((conn, time.monotonic()))
+            self.__prune()
+            self.__lock.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = 30) -> Iterator[psycopg2.extensions.connection]:
+        """
+        Context manager that checks out a connection and returns it when done. If the block raises
+        a connection level error the connection is discarded.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a free connection. Defaults to 30.
+
+        Yields:
+            psycopg2.extensions.connection: The checked out connection.
+        """
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def fill(self):
+        """
+        Opens connections until the pool holds min_size connections.
+
+        Raises:
+            DBConnectionError: If a connection could not be established.
+        """
+        while self.size < self.min_size:
+            conn = self.__connect()
+            with self.__lock:
+                self.__idle.append((conn, time.monotonic()))
+
+    def closeall(self):
+        """
+        Closes all idle connections and marks the pool as closed. Connections still in use are
+        closed as they are returned.
+        """
+        with self.__lock:
+            self.closed = True
+            for conn, _ in self.__idle:
+                self.__close(conn)
+            self.__idle = []
+            self.__lock.notify_all()
+
+
+def _pool_key(db_params: Dict[str, Any]) -> Tuple:
+    """
+    Generates the registry key for a set of connection parameters. The application name is not
+    part of the key so managers that only differ by name share a pool.
+
+    Args:
+        db_params (Dict[str, Any]): The psycopg2 connection parameters.
+
+    Returns:
+        Tuple: The hashable key.
+    """
+    return tuple(sorted((k, str(v)) for k, v in db_params.items() if k != "application_name"))
+
+
+def get_pool(db_params: Dict[str, Any], **pool_kwargs) -> ConnectionPool:
+    """
+    Gets the process wide pool for the given connection parameters, creating it if needed. Every
+    call must be matched by a release_pool call once the caller no longer needs the pool. Pooled
+    connections are shared by many managers so they report the process name as application_name.
+
+    Args:
+        db_params (Dict[str, Any]): The psycopg2 connection parameters.
+
+    Keyword Args:
+        Passed on to ConnectionPool when a new pool is created.
+
+    Returns:
+        ConnectionPool: The shared connection pool.
+    """
+    key = _pool_key(db_params)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None or pool.closed:
+            params = {k: v for k, v in db_params.items() if k != "application_name"}
+            params["application_name"] = Path(sys.argv[0]).stem or "pihome"
+            pool = ConnectionPool(params, **pool_kwargs)
+            _POOLS[key] = pool
+        pool.refs += 1
+    return pool
+
+
+def release_pool(pool: ConnectionPool):
+    """
+    Releases a reference to a pool obtained through get_pool. The pool's connections are closed
+    once the last reference is released.
+
+    Args:
+        pool (ConnectionPool): The pool to release.
+    """
+    with _POOLS_LOCK:
+        pool.refs -= 1
+        if pool.refs > 0:
+            return
+        for key, registered in list(_POOLS.items()):
+            if registered is pool:
+                del _POOLS[key]
+    _LOG.info("Closing DB connection pool.")
+    pool.closeall()
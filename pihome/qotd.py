@@ -129,12 +129,10 @@ class QOTDMgr:
         Args:
             quote_data (Dict[str, Any]): The quote data to be added.
         """
-        with self.db.conn.cursor() as c:
-            c.execute(
-                f"SELECT * FROM {self.__QUOTE_TABLE} WHERE quote=%s AND DATE(datetime) = %s",
-                (quote_data["quote"], quote_data["datetime"].date()),
-            )
-            rows = c.fetchall()
+        rows = self.db.fetch_raw(
+            f"SELECT * FROM {self.__QUOTE_TABLE} WHERE quote=%s AND DATE(datetime) = %s",
+            (quote_data["quote"], quote_data["datetime"].date()),
+        )
         if rows:
             _LOG.info("DB Update not required. Quote exists in DB for today's date.")
         else:
@@ -0,0 +1,701 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Replays XDB transactions against the database
+File: replay
+Project: PiHome
+File Created: Saturday, 17th October 2026 3:22:51 pm
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import psycopg2
+
+import pihome.constants as constants
+from pihome.db import DBMgr
+from pihome.exceptions import DBConnectionError
+from pihome.shared import Backoff
+from pihome.spool import SpoolReader, get_spool_writer
+
+_LOG = logging.getLogger(__name__)
+
+#: Errors that mean the DB is unreachable. The batch is retried later.
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, DBConnectionError)
+
+
+def target_key(xdb_data: Dict[str, Any]) -> Tuple[str, str, str]:
+    """
+    Gets the key identifying the DB a transaction was meant for.
+
+    Args:
+        xdb_data (Dict[str, Any]): The XDB record written by DBMgr.write_xdb.
+
+    Returns:
+        Tuple[str, str, str]: The dbname, options and connection kwargs.
+    """
+    return (
+        xdb_data["dbname"],
+        xdb_data["dboptions"] or "",
+        json.dumps(xdb_data["dbkwargs"] or {}, sort_keys=True),
+    )
+
+
+def batch_key(xdb_data: Dict[str, Any]) -> Tuple:
+    """
+    Gets the key used to batch consecutive transactions. Transactions with the same key can be
+    applied with one statement or one executemany call.
+
+    Args:
+        xdb_data (Dict[str, Any]): The XDB record written by DBMgr.write_xdb.
+
+    Returns:
+        Tuple: The target, operation, table, columns and key columns.
+    """
+    kwargs = xdb_data["kwargs"]
+    data = kwargs.get("data")
+    if isinstance(data, list):
+        cols = tuple(sorted(data[0])) if data else ()
+    elif data is not None:
+        cols = tuple(sorted(data))
+    else:
+        cols = tuple(sorted(kwargs.get("condition", {})))
+    return (
+        target_key(xdb_data),
+        xdb_data["txn_type"],
+        kwargs["table"],
+        cols,
+        tuple(kwargs.get("key_cols", ())),
+    )
+
+
+def split_rows(xdb_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Splits a transaction into one operation per row so rows can be coalesced individually. Each
+    operation records the sequence numbers of the transactions it stands for under "sources".
+
+    Args:
+        xdb_data (Dict[str, Any]): The XDB record written by DBMgr.write_xdb.
+
+    Returns:
+        List[Dict[str, Any]]: The operations.
+    """
+    kwargs = xdb_data["kwargs"]
+    data = kwargs.get("data")
+    rows = data if isinstance(data, list) else [data]
+    ops = []
+    for row in rows:
+        op = dict(xdb_data, sources=[tuple(xdb_data["seq"])])
+        if data is not None:
+            op["kwargs"] = dict(kwargs, data=row)
+        ops.append(op)
+    return ops
+
+
+def _row_key(op: Dict[str, Any]) -> Optional[Tuple]:
+    """
+    Gets the key of the row written by an insert_update or update operation.
+
+    Args:
+        op (Dict[str, Any]): The operation.
+
+    Returns:
+        Optional[Tuple]: The key column values. None if the row does not hold every key column.
+    """
+    row = op["kwargs"]["data"]
+    key_cols = op["kwargs"].get("key_cols") or ()
+    if not key_cols or any(col not in row for col in key_cols):
+        return None
+    return (tuple(key_cols), tuple(json.dumps(row[col], default=str) for col in key_cols))
+
+
+def _matches(row: Dict[str, Any], condition: Dict[str, Any]) -> bool:
+    """
+    Checks whether a delete condition matches a row.
+
+    Args:
+        row (Dict[str, Any]): The row.
+        condition (Dict[str, Any]): The delete condition.
+
+    Returns:
+        bool: True if the row has every condition column with the same value.
+    """
+    return all(col in row and row[col] == value for col, value in condition.items())
+
+
+def plan_replay(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Plans the replay of a set of XDB transactions. Transactions are ordered by their sequence
+    number and split into one operation per row, then:
+
+    * Repeated insert_update operations on the same key are coalesced into the last one, with the
+      columns of the earlier ones merged underneath, as long as no update or delete on the same
+      table comes in between.
+    * Insert operations whose row is removed by a later delete are dropped, as long as no update
+      or insert_update on the same table comes in between, since either may rewrite the inserted
+      row. The delete itself is kept since it may also remove rows that were already in the DB.
+      Updates and insert_updates are never dropped since the row they write may differ from the
+      row the delete sees.
+
+    Every operation lists the transactions it stands for under "sources", so a transaction is
+    only done once all the operations it was folded into are applied.
+
+    Args:
+        records (List[Dict[str, Any]]): The XDB records.
+
+    Returns:
+        List[Dict[str, Any]]: The operations to apply in order.
+    """
+    ops: List[Optional[Dict[str, Any]]] = []
+    # Pending operations per (target, table): row key -> index of the live insert_update, and
+    # the indexes of the live inserts a later delete may cancel.
+    upserts: Dict[Tuple, Dict[Tuple, int]] = {}
+    writes: Dict[Tuple, List[int]] = {}
+    for xdb_data in sorted(records, key=lambda xdb_data: xdb_data["seq"]):
+        for op in split_rows(xdb_data):
+            table = (target_key(op), op["kwargs"]["table"])
+            txn_type = op["txn_type"]
+            if txn_type == "delete":
+                condition = op["kwargs"].get("condition") or {}
+                live = []
+                for i in writes.get(table, []):
+                    if ops[i] is None:
+                        continue
+                    if _matches(ops[i]["kwargs"]["data"], condition):
+                        op["sources"].extend(ops[i]["sources"])
+                        ops[i] = None
+                    else:
+                        live.append(i)
+                writes[table] = live
+                upserts.pop(table, None)
+            elif txn_type == "update":
+                upserts.pop(table, None)
+                writes.pop(table, None)
+            elif txn_type == "insert_update":
+                writes.pop(table, None)
+                key = _row_key(op)
+                i = upserts.setdefault(table, {}).get(key) if key is not None else None
+                if i is not None:
+                    prev = ops[i]
+                    op["kwargs"]["data"] = {**prev["kwargs"]["data"], **op["kwargs"]["data"]}
+                    op["sources"] = prev["sources"] + op["sources"]
+                    ops[i] = None
+                if key is not None:
+                    upserts[table][key] = len(ops)
+            if txn_type == "insert":
+                writes.setdefault(table, []).append(len(ops))
+            ops.append(op)
+    return [op for op in ops if op is not None]
+
+
+class ReplayLane:
+    """
+    Applies the operations for one target DB in a worker thread. Each lane retries with its own
+    backoff when its DB cannot be reached, so a slow or locked target does not hold back the
+    others.
+
+    Attributes:
+        name (str): The lane name used in logs and stats.
+        backoff (Backoff): The retry backoff of the lane.
+        rows (int): The number of operations applied.
+        busy (float): Seconds spent applying batches.
+        last_error (Optional[str]): The last error seen by the lane.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        get_db: Callable[[], DBMgr],
+        on_done: Callable[[List[Dict[str, Any]]], None],
+        on_reject: Callable[[Dict[str, Any], str], None],
+    ) -> None:
+        """
+        Initializes the lane and starts its worker thread.
+
+        Args:
+            name (str): The lane name.
+            get_db (Callable[[], DBMgr]): Gets the DB manager for the target.
+            on_done (Callable[[List[Dict[str, Any]]], None]): Called with every batch once it is
+                committed.
+            on_reject (Callable[[Dict[str, Any], str], None]): Called with every operation the DB
+                rejects and the error. It must store the operation durably or raise.
+        """
+        self.name = name
+        self.backoff = Backoff(initial=1, maximum=300)
+        self.rows = 0
+        self.busy = 0.0
+        self.last_error: Optional[str] = None
+        self.__get_db = get_db
+        self.__on_done = on_done
+        self.__on_reject = on_reject
+        self.__queue: queue.Queue = queue.Queue()
+        self.__depth = 0
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, name=f"xdb {name}", daemon=True)
+        self.__thread.start()
+
+    @property
+    def depth(self) -> int:
+        """
+        int: The number of operations queued or being applied.
+        """
+        return self.__depth
+
+    def put(self, batch: List[Dict[str, Any]]):
+        """
+        Queues a batch of operations that share a batch key.
+
+        Args:
+            batch (List[Dict[str, Any]]): The operations.
+        """
+        with self.__lock:
+            self.__depth += len(batch)
+        self.__queue.put(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the lane stats.
+
+        Returns:
+            Dict[str, Any]: The queue depth, rows applied, rows per second while applying and the
+                last error.
+        """
+        return {
+            "depth": self.depth,
+            "rows": self.rows,
+            "rows_per_sec": round(self.rows / self.busy, 1) if self.busy else 0.0,
+            "last_error": self.last_error,
+        }
+
+    def close(self, timeout: float = 10):
+        """
+        Stops the worker thread. Queued operations are not applied and are replayed from the
+        spool next time.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the current batch. Defaults to 10.
+        """
+        self.__stop.set()
+        self.__thread.join(timeout)
+
+    def __run(self):
+        """
+        Applies queued batches in order. A batch is retried until it is applied or the lane is
+        closed. Operations that were committed before a failure are not retried.
+        """
+        while not self.__stop.is_set():
+            try:
+                batch = self.__queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            while batch and not self.__stop.is_set():
+                try:
+                    start = time.monotonic()
+                    self.__apply(self.__get_db(), batch)
+                    self.busy += time.monotonic() - start
+                except Exception as ex:
+                    self.last_error = f"{type(ex).__name__}: {str(ex).strip()}"
+                    if not isinstance(ex, CONNECTION_ERRORS):
+                        _LOG.exception(f"[{self.name}] Unexpected replay error")
+                    delay = self.backoff.next()
+                    _LOG.error(f"[{self.name}] {self.last_error}")
+                    _LOG.error(f"[{self.name}] Could not replay. Retrying in {delay} seconds.")
+                    self.__stop.wait(delay)
+                    continue
+                self.backoff.reset()
+
+    def __apply(self, db: DBMgr, batch: List[Dict[str, Any]]):
+        """
+        Applies a batch in one DB transaction. If the batch is rejected by the DB for a reason
+        other than a connection error, the operations are retried one at a time and the ones that
+        are still rejected are quarantined with on_reject so they cannot block the spool.
+        Operations are removed from the batch as they are committed or quarantined, so if this
+        raises, the batch holds only the operations that still have to be applied.
+
+        Args:
+            db (DBMgr): The DB manager for the target.
+            batch (List[Dict[str, Any]]): The operations. Emptied as they are applied.
+        """
+        _LOG.info(
+            f"[{self.name}] Replaying {len(batch)} {batch[0]['txn_type']} operation(s) on "
+            f"{batch[0]['kwargs']['table']}"
+        )
+        try:
+            with db.transaction():
+                XDBReplayer.apply(db, batch)
+            self.__finish(batch)
+            return
+        except CONNECTION_ERRORS:
+            raise
+        except psycopg2.Error as ex:
+            if len(batch) == 1:
+                error = f"{type(ex).__name__}: {str(ex).strip()}"
+                _LOG.error(f"[{self.name}] Quarantining rejected XDB transaction {batch[0]}.")
+                _LOG.error(error)
+                self.__on_reject(batch[0], error)
+                self.__finish(batch)
+                return
+            _LOG.warning(f"Batch rejected ({type(ex).__name__}). Replaying one at a time.")
+        while batch:
+            op = [batch[0]]
+            self.__apply(db, op)
+            del batch[0]
+
+    def __finish(self, batch: List[Dict[str, Any]]):
+        """
+        Records applied operations, reports them with on_done and empties the batch.
+
+        Args:
+            batch (List[Dict[str, Any]]): The operations that were committed or quarantined.
+        """
+        done = list(batch)
+        batch.clear()
+        self.rows += len(done)
+        with self.__lock:
+            self.__depth -= len(done)
+        self.__on_done(done)
+
+
+class XDBReplayer:
+    """
+    Replays XDB transactions. Transactions are ordered and compacted by plan_replay and handed to
+    one ReplayLane per target DB, so targets are replayed concurrently. Within a lane, consecutive
+    operations for the same table and operation are merged into a batch that is applied as a
+    single DB transaction, and the spool is checkpointed after every batch. Operations the DB
+    rejects are written to a dead letter spool in dead_dir before they are checkpointed.
+
+    Attributes:
+        db_data (Dict[str, Any]): The xdb database secret from the vault.
+        dead_dir (Path): The dead letter spool dir.
+        max_batch (int): Maximum number of operations applied in one DB transaction.
+        max_window (int): Maximum number of XDB transactions planned together.
+        max_queued (int): Operations queued across all lanes above which no more transactions are
+            read from the spool.
+    """
+
+    def __init__(
+        self,
+        db_data: Dict[str, Any],
+        max_batch: int = 1000,
+        max_window: int = 50000,
+        max_queued: int = 100000,
+        dead_dir: Path = constants.xdb_dead_dir,
+    ) -> None:
+        """
+        Initializes the replayer.
+
+        Args:
+            db_data (Dict[str, Any]): The xdb database secret from the vault.
+            max_batch (int, optional): Maximum operations per batch. Defaults to 1000.
+            max_window (int, optional): Maximum transactions planned together. Defaults to 50000.
+            max_queued (int, optional): Maximum operations queued before reading stops. Defaults
+                to 100000.
+            dead_dir (Path, optional): The dead letter spool dir. Defaults to
+                constants.xdb_dead_dir.
+        """
+        self.db_data = db_data
+        self.dead_dir = dead_dir
+        self.max_batch = max_batch
+        self.max_window = max_window
+        self.max_queued = max_queued
+        self.__lock = threading.Lock()
+        self.__dbs: Dict[Tuple[str, str, str], DBMgr] = {}
+        self.__lanes: Dict[Tuple[str, str, str], ReplayLane] = {}
+        self.__reader: Optional[SpoolReader] = None
+        # Offset just past the last record handed to a lane, keyed by segment stem.
+        self.__read_offsets: Dict[str, int] = {}
+        # Sequence number and end offset of every read record that is not checkpointed yet.
+        self.__progress: Dict[str, List[Tuple[Tuple, int]]] = {}
+        self.__done: Set[Tuple] = set()
+        # Operations queued on the lanes but not committed yet, per transaction sequence number.
+        self.__outstanding: Dict[Tuple, int] = {}
+
+    def exit(self):
+        """
+        Stops all lanes and closes all DB managers.
+        """
+        for lane in self.__lanes.values():
+            lane.close()
+        self.__lanes = {}
+        for db in self.__dbs.values():
+            db.exit()
+        self.__dbs = {}
+
+    def get_db(self, xdb_data: Dict[str, Any]) -> DBMgr:
+        """
+        Gets the DB manager for the DB a transaction was meant for, creating it if needed.
+
+        Args:
+            xdb_data (Dict[str, Any]): The XDB record written by DBMgr.write_xdb.
+
+        Returns:
+            DBMgr: The DB manager.
+        """
+        key = target_key(xdb_data)
+        with self.__lock:
+            db = self.__dbs.get(key)
+        if db is None:
+            connect_params = {
+                "host": self.db_data["hostname"],
+                "user": self.db_data["user"],
+                "password": self.db_data["password"],
+                "port": self.db_data["port"],
+                "dbname": xdb_data["dbname"],
+            }
+            if xdb_data["dboptions"] is not None:
+                connect_params["options"] = xdb_data["dboptions"]
+            if xdb_data["dbkwargs"]:
+                connect_params.update(xdb_data["dbkwargs"])
+            db = DBMgr(**connect_params)
+            with self.__lock:
+                if key in self.__dbs:
+                    db.exit()
+                    db = self.__dbs[key]
+                else:
+                    self.__dbs[key] = db
+        return db
+
+    def get_lane(self, xdb_data: Dict[str, Any]) -> ReplayLane:
+        """
+        Gets the lane for the DB a transaction was meant for, starting it if needed.
+
+        Args:
+            xdb_data (Dict[str, Any]): The XDB record written by DBMgr.write_xdb.
+
+        Returns:
+            ReplayLane: The lane.
+        """
+        key = target_key(xdb_data)
+        lane = self.__lanes.get(key)
+        if lane is None:
+            name = xdb_data["dbname"]
+            if xdb_data["dboptions"]:
+                name = f"{name} {xdb_data['dboptions']}"
+            target = {k: xdb_data[k] for k in ("dbname", "dboptions", "dbkwargs")}
+            lane = ReplayLane(
+                name, lambda: self.get_db(target), self.__on_done, self.__quarantine
+            )
+            self.__lanes[key] = lane
+        return lane
+
+    def depth(self) -> int:
+        """
+        Gets the number of operations queued across all lanes.
+
+        Returns:
+            int: The queue depth.
+        """
+        return sum(lane.depth for lane in self.__lanes.values())
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Gets the stats of every lane.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: The lane stats keyed by lane name.
+        """
+        return {lane.name: lane.stats() for lane in self.__lanes.values()}
+
+    @staticmethod
+    def apply(db: DBMgr, batch: List[Dict[str, Any]]):
+        """
+        Applies a batch of XDB transactions that share a batch key. Rows of insert, update and
+        insert_update transactions are merged so the batch runs as one bulk statement.
+
+        Args:
+            db (DBMgr): The DB manager for the batch target.
+            batch (List[Dict[str, Any]]): The XDB records.
+        """
+        txn_type = batch[0]["txn_type"]
+        kwargs = batch[0]["kwargs"]
+        if txn_type == "delete":
+            for xdb_data in batch:
+                db.delete_data(**xdb_data["kwargs"], update_xdb=False)
+            return
+        rows = []
+        for xdb_data in batch:
+            data = xdb_data["kwargs"]["data"]
+            rows.extend(data if isinstance(data, list) else [data])
+        if txn_type == "insert":
+            db.bulk_insert_data(kwargs["table"], rows, update_xdb=False)
+        elif txn_type == "update":
+            db.update_data(kwargs["table"], rows, kwargs["key_cols"], update_xdb=False)
+        elif txn_type == "insert_update":
+            db.insert_or_update_data(kwargs["table"], rows, kwargs["key_cols"], update_xdb=False)
+        else:
+            raise ValueError(f"Invalid XDB transaction type {txn_type}")
+
+    def replay_one(self, xdb_data: Dict[str, Any]):
+        """
+        Applies a single XDB transaction in its own DB transaction. If the DB rejects it for a
+        reason other than a connection error, it is written to the dead letter spool instead so
+        it cannot block the transactions after it.
+
+        Args:
+            xdb_data (Dict[str, Any]): The XDB record written by DBMgr.write_xdb.
+        """
+        db = self.get_db(xdb_data)
+        try:
+            with db.transaction():
+                self.apply(db, [xdb_data])
+        except CONNECTION_ERRORS:
+            raise
+        except psycopg2.Error as ex:
+            error = f"{type(ex).__name__}: {str(ex).strip()}"
+            _LOG.error(f"Quarantining rejected XDB transaction {xdb_data}.")
+            _LOG.error(error)
+            self.__quarantine(xdb_data, error)
+
+    def replay(self, reader: SpoolReader) -> int:
+        """
+        Reads the pending transactions in the spool that are not queued yet, in windows of up to
+        max_window transactions, plans them with plan_replay and queues the operations on the
+        lanes. Reading stops once max_queued operations are queued. The lanes checkpoint the spool
+        as batches are committed, so the same reader must be passed on every call.
+
+        Args:
+            reader (SpoolReader): The spool reader.
+
+        Returns:
+            int: The number of transactions queued.
+        """
+        self.__reader = reader
+        live = {fp.stem for fp in reader.segments()}
+        with self.__lock:
+            self.__read_offsets = {
+                stem: offset for stem, offset in self.__read_offsets.items() if stem in live
+            }
+        queued = 0
+        while self.depth() < self.max_queued:
+            window = []
+            for pending in reader.pending(self.__read_offsets):
+                window.append(pending)
+                if len(window) >= self.max_window:
+                    break
+            if window:
+                self.__dispatch(window)
+                queued += len(window)
+            if len(window) < self.max_window:
+                break
+        if queued:
+            _LOG.info(f"Queued {queued} XDB transactions for replay.")
+        return queued
+
+    def __dispatch(self, window: List[Tuple[Path, Dict, int]]):
+        """
+        Plans a window of pending transactions and queues the operations on the lanes.
+
+        Args:
+            window (List[Tuple[Path, Dict, int]]): The segment, record and offset just past it for
+                each pending transaction, in spool order.
+        """
+        ops = plan_replay([xdb_data for _, xdb_data, _ in window])
+        with self.__lock:
+            for op in ops:
+                for seq in op["sources"]:
+                    self.__outstanding[seq] = self.__outstanding.get(seq, 0) + 1
+            for segment, xdb_data, offset in window:
+                seq = tuple(xdb_data["seq"])
+                self.__read_offsets[segment.stem] = offset
+                self.__progress.setdefault(segment.stem, []).append((seq, offset))
+                if seq not in self.__outstanding:
+                    self.__done.add(seq)
+            self.__checkpoint()
+        _LOG.info(f"Planned {len(window)} XDB transactions as {len(ops)} operations.")
+        batches: Dict[Tuple, List[Tuple[Tuple, List[Dict[str, Any]]]]] = {}
+        for op in ops:
+            key = batch_key(op)
+            lane_batches = batches.setdefault(key[0], [])
+            if (
+                lane_batches
+                and lane_batches[-1][0] == key
+                and len(lane_batches[-1][1]) < self.max_batch
+            ):
+                lane_batches[-1][1].append(op)
+            else:
+                lane_batches.append((key, [op]))
+        for lane_batches in batches.values():
+            lane = self.get_lane(lane_batches[0][1][0])
+            for _, batch in lane_batches:
+                lane.put(batch)
+
+    def __quarantine(self, op: Dict[str, Any], error: str):
+        """
+        Appends a rejected operation to the dead letter spool and fsyncs it, so it can be
+        inspected and replayed by hand. The record keeps the sequence numbers of the XDB
+        transactions it stands for under "xdb_seqs", empty for legacy XDB files, and the DB
+        error under "error".
+
+        Args:
+            op (Dict[str, Any]): The rejected operation.
+            error (str): The DB error.
+        """
+        record = {key: value for key, value in op.items() if key not in ("seq", "sources")}
+        record["xdb_seqs"] = [list(seq) for seq in op.get("sources", [])]
+        record["error"] = error
+        writer = get_spool_writer(self.dead_dir)
+        writer.append(record)
+        writer.flush()
+
+    def __on_done(self, batch: List[Dict[str, Any]]):
+        """
+        Records the operations of a committed batch and checkpoints the spool. A transaction is
+        done once every operation it was split or folded into is committed, which may take
+        several batches.
+
+        Args:
+            batch (List[Dict[str, Any]]): The operations.
+        """
+        with self.__lock:
+            for op in batch:
+                for seq in op["sources"]:
+                    self.__outstanding[seq] -= 1
+                    if not self.__outstanding[seq]:
+                        del self.__outstanding[seq]
+                        self.__done.add(seq)
+            self.__checkpoint()
+
+    def __checkpoint(self):
+        """
+        Checkpoints each segment past the longest run of done transactions at its checkpoint. Must
+        be called with the lock held.
+        """
+        for stem, pending in list(self.__progress.items()):
+            count = 0
+            while count < len(pending) and pending[count][0] in self.__done:
+                count += 1
+            if count:
+                self.__reader.checkpoint(self.__reader.dirpath / stem, pending[count - 1][1])
+                self.__done.difference_update(seq for seq, _ in pending[:count])
+                del pending[:count]
+            if not pending:
+                del self.__progress[stem]
@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Retention and downsampling of raw telemetry
+File: retention
+Project: PiHome
+File Created: Saturday, 17th October 2026 10:20:31 pm
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import datetime as dt
+import logging
+import threading
+from typing import Any, Dict
+
+import pihome.constants as constants
+from pihome.db import DBMgr
+from pihome.rollup import ROLLUPS, backfill
+from pihome.schema import TABLES, drop_partitions, ensure_partitions, partitions
+from pihome.shared import get_db_params
+from pihome.vault import VaultMgr
+
+_LOG = logging.getLogger(__name__)
+
+
+class RetentionMgr:
+    """
+    Applies the retention policy in constants.retention_policy. For every table, rows older than
+    the policy's keep_days are deleted in batches of batch_size rows, one transaction per batch,
+    so the purge never holds long locks or builds a large transaction. Monthly partitions that
+    are entirely past the cutoff are dropped instead. Tables with downsample set have their
+    rollups recomputed for the days being purged first so history is kept at a coarser grain.
+
+    Attributes:
+        policy (Dict[str, Dict[str, Any]]): The retention policy keyed by table.
+        batch_size (int): Rows deleted per transaction.
+        pause (float): Seconds to wait between batches so other clients get the DB.
+    """
+
+    def __init__(
+        self,
+        vault: VaultMgr,
+        policy: Dict[str, Dict[str, Any]] = constants.retention_policy,
+        batch_size: int = constants.retention_batch_size,
+        pause: float = 0.5,
+    ) -> None:
+        """
+        Initializes the retention manager.
+
+        Args:
+            vault (VaultMgr): Used to get the database secrets.
+            policy (Dict[str, Dict[str, Any]], optional): The retention policy. Defaults to
+                constants.retention_policy.
+            batch_size (int, optional): Rows deleted per transaction. Defaults to
+                constants.retention_batch_size.
+            pause (float, optional): Seconds between batches. Defaults to 0.5.
+        """
+        _LOG.info("Initializing retention manager.")
+        self.policy = policy
+        self.batch_size = batch_size
+        self.pause = pause
+        self.__vault = vault
+        self.__dbs: Dict[str, DBMgr] = {}
+
+    def exit(self):
+        """
+        Closes the DB managers.
+        """
+        for db in self.__dbs.values():
+            db.exit()
+        self.__dbs = {}
+
+    def __get_db(self, vault_root: str) -> DBMgr:
+        """
+        Gets the DB manager for a vault root, creating it if needed.
+
+        Args:
+            vault_root (str): The vault root holding the database secret.
+
+        Returns:
+            DBMgr: The DB manager.
+        """
+        if vault_root not in self.__dbs:
+            params = get_db_params(self.__vault, vault_root, self.__class__.__name__)
+            self.__dbs[vault_root] = DBMgr(**params)
+        return self.__dbs[vault_root]
+
+    def run(self, stop: threading.Event, until: dt.datetime = None) -> Dict[str, int]:
+        """
+        Creates the partitions that are due and applies the retention policy to every table.
+
+        Args:
+            stop (threading.Event): Stops the purge between batches when set.
+            until (dt.datetime, optional): Stops the purge between batches at this time, such as
+                the end of the off-peak window. Defaults to None.
+
+        Returns:
+            Dict[str, int]: The number of rows deleted per table.
+        """
+        for table, spec in TABLES.items():
+            if spec.get("partition_col"):
+                try:
+                    ensure_partitions(self.__get_db(spec["vault_root"]), table)
+                except Exception:
+                    _LOG.exception(f"Could not create partitions of {table}")
+        deleted = {}
+        for table, policy in self.policy.items():
+            if stop.is_set() or (until is not None and dt.datetime.now() >= until):
+                _LOG.info("Retention window over. Remaining tables are purged next time.")
+                break
+            try:
+                deleted[table] = self.purge(table, policy, stop, until)
+            except Exception:
+                _LOG.exception(f"Could not apply retention policy to {table}")
+        return deleted
+
+    def purge(
+        self,
+        table: str,
+        policy: Dict[str, Any],
+        stop: threading.Event,
+        until: dt.datetime = None,
+    ) -> int:
+        """
+        Downsamples and deletes the rows of a table that are older than the policy allows. Expired
+        monthly partitions are dropped and the remaining rows are deleted in batches.
+
+        Args:
+            table (str): The table.
+            policy (Dict[str, Any]): The table's retention policy.
+            stop (threading.Event): Stops the purge between batches when set.
+            until (dt.datetime, optional): Stops the purge between batches at this time. Defaults
+                to None.
+
+        Returns:
+            int: The number of rows deleted.
+        """
+        db = self.__get_db(policy["vault_root"])
+        time_col = policy.get("time_col", "datetime")
+        cutoff = dt.date.today() - dt.timedelta(days=policy["keep_days"])
+        where = f"{time_col} < %(cutoff)s"
+        if policy.get("condition"):
+            where += f" AND ({policy['condition']})"
+        params = {"cutoff": cutoff, "limit": self.batch_size}
+        if policy.get("downsample") and table in ROLLUPS:
+            sql = f"SELECT MIN({time_col}) FROM {table} WHERE {where}"
+            oldest = db.fetch_raw(sql, params, True)
+            if oldest and oldest[0] is not None:
+                _LOG.info(f"Downsampling {table} from {oldest[0].date()} to {cutoff}")
+                backfill(db, table, oldest[0].date(), cutoff, tuple(policy["downsample"]))
+        targets = [table]
+        if TABLES.get(table, {}).get("partition_col"):
+            # ctids are only unique within a partition so each partition is purged on its own
+            if TABLES[table]["partition_col"] == time_col and not policy.get("condition"):
+                drop_partitions(db, table, cutoff)
+            targets = [
+                name
+                for name, lower, _ in partitions(db, table)
+                if lower is None or lower < cutoff
+            ]
+        _LOG.info(f"Purging {table} rows older than {cutoff}")
+        deleted = 0
+        stopped = False
+        for target in targets:
+            if stopped:
+                break
+            sql = (
+                f"DELETE FROM {target} WHERE ctid = ANY(ARRAY("
+                f"SELECT ctid FROM {target} WHERE {where} LIMIT %(limit)s))"
+            )
+            while True:
+                count = db.execute_raw(sql, params)
+                deleted += count
+                if count < self.batch_size:
+                    break
+                if stop.wait(self.pause) or (until is not None and dt.datetime.now() >= until):
+                    _LOG.info(f"Stopped purging {table}. The rest is purged next time.")
+                    stopped = True
+                    break
+        _LOG.info(f"Purged {deleted} rows from {table}")
+        return deleted
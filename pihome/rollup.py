@@ -0,0 +1,370 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Incrementally maintained time-series rollup tables
+File: rollup
+Project: PiHome
+File Created: Saturday, 17th October 2026 9:15:44 pm
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import datetime as dt
+import logging
+from collections import OrderedDict
+from functools import lru_cache, partial
+from typing import Any, Dict, List, Tuple
+
+import psycopg2.extensions
+import psycopg2.extras
+
+from pihome.db import DBMgr, register_insert_hook
+
+_LOG = logging.getLogger(__name__)
+
+#: Rollup bucket sizes. Each is a date_trunc field.
+GRAINS = ("minute", "hour", "day")
+
+#: Raw time-series tables that are rolled up. Rows are grouped by group_cols and bucketed by
+#: their datetime column. vault_root holds the database secret of the table's schema.
+ROLLUPS: Dict[str, Dict[str, Any]] = {
+    "environment": {
+        "vault_root": "sensor/",
+        "group_cols": ["location"],
+        "metrics": ["temperature", "humidity"],
+    },
+    "power": {
+        "vault_root": "solar/",
+        "group_cols": [],
+        "metrics": [
+            "grid_power",
+            "solar_power",
+            "battery_power",
+            "battery_charge",
+            "power_usage",
+        ],
+    },
+    "system_stats": {
+        "vault_root": "report/",
+        "group_cols": ["nodename"],
+        "metrics": ["cpu_temp", "cpu_usage", "mem_usage", "disk_usage"],
+    },
+}
+
+#: Aggregates kept per metric. avg is sum / count.
+_AGGREGATES = ("min", "max", "sum", "count", "last")
+
+
+def rollup_table(table: str, grain: str) -> str:
+    """
+    Gets the name of a rollup table.
+
+    Args:
+        table (str): The raw table.
+        grain (str): The bucket size.
+
+    Returns:
+        str: The rollup table name.
+    """
+    return f"{table}_{grain}"
+
+
+def truncate(value: dt.datetime, grain: str) -> dt.datetime:
+    """
+    Truncates a datetime to the start of its bucket like date_trunc.
+
+    Args:
+        value (dt.datetime): The datetime.
+        grain (str): The bucket size.
+
+    Returns:
+        dt.datetime: The bucket start.
+    """
+    value = value.replace(second=0, microsecond=0)
+    if grain == "minute":
+        return value
+    value = value.replace(minute=0)
+    if grain == "hour":
+        return value
+    return value.replace(hour=0)
+
+
+def _columns(table: str) -> Tuple[str, ...]:
+    """
+    Gets the columns of a table's rollup tables in insert order.
+
+    Args:
+        table (str): The raw table.
+
+    Returns:
+        Tuple[str, ...]: The group columns, bucket, n, last_datetime and the metric aggregates.
+    """
+    spec = ROLLUPS[table]
+    cols = [*spec["group_cols"], "bucket", "n", "last_datetime"]
+    for metric in spec["metrics"]:
+        cols.extend(f"{metric}_{agg}" for agg in _AGGREGATES)
+    return tuple(cols)
+
+
+def create_rollup_tables(db: DBMgr, table: str):
+    """
+    Creates the rollup tables of a raw table if they do not exist.
+
+    Args:
+        db (DBMgr): The DB manager for the table's schema.
+        table (str): The raw table.
+    """
+    spec = ROLLUPS[table]
+    key = ", ".join([*spec["group_cols"], "bucket"])
+    col_defs = [f"{col} TEXT NOT NULL" for col in spec["group_cols"]]
+    col_defs += ["bucket TIMESTAMP NOT NULL", "n BIGINT NOT NULL", "last_datetime TIMESTAMP"]
+    for metric in spec["metrics"]:
+        col_defs += [
+            f"{metric}_min DOUBLE PRECISION",
+            f"{metric}_max DOUBLE PRECISION",
+            f"{metric}_sum DOUBLE PRECISION",
+            f"{metric}_count BIGINT NOT NULL DEFAULT 0",
+            f"{metric}_last DOUBLE PRECISION",
+        ]
+    with db.transaction():
+        for grain in GRAINS:
+            name = rollup_table(table, grain)
+            _LOG.info(f"Creating rollup table {name}")
+            db.execute_raw(
+                f"CREATE TABLE IF NOT EXISTS {name} ({', '.join(col_defs)}, PRIMARY KEY ({key}))"
+            )
+
+
+@lru_cache(maxsize=None)
+def _upsert_sql(table: str, grain: str) -> Tuple[str, str]:
+    """
+    Generates the statement that merges pre-aggregated buckets into a rollup table.
+
+    Args:
+        table (str): The raw table.
+        grain (str): The bucket size.
+
+    Returns:
+        Tuple[str, str]: The execute_values statement and its row template.
+    """
+    spec = ROLLUPS[table]
+    cols = _columns(table)
+    name = rollup_table(table, grain)
+    sets = [
+        "n = r.n + EXCLUDED.n",
+        "last_datetime = GREATEST(r.last_datetime, EXCLUDED.last_datetime)",
+    ]
+    newer = "EXCLUDED.last_datetime >= r.last_datetime"
+    for m in spec["metrics"]:
+        sets += [
+            f"{m}_min = LEAST(r.{m}_min, EXCLUDED.{m}_min)",
+            f"{m}_max = GREATEST(r.{m}_max, EXCLUDED.{m}_max)",
+            f"{m}_sum = COALESCE(r.{m}_sum + EXCLUDED.{m}_sum, r.{m}_sum, EXCLUDED.{m}_sum)",
+            f"{m}_count = r.{m}_count + EXCLUDED.{m}_count",
+            f"{m}_last = CASE WHEN {newer} THEN EXCLUDED.{m}_last ELSE r.{m}_last END",
+        ]
+    key = ", ".join([*spec["group_cols"], "bucket"])
+    sql = (
+        f"INSERT INTO {name} AS r ({', '.join(cols)}) VALUES %s "
+        f"ON CONFLICT ({key}) DO UPDATE SET {', '.join(sets)}"
+    )
+    template = f"({', '.join(f'%({col})s' for col in cols)})"
+    return sql, template
+
+
+def aggregate(table: str, rows: List[Dict[str, Any]], grain: str) -> List[Dict[str, Any]]:
+    """
+    Aggregates raw rows into one rollup row per group and bucket.
+
+    Args:
+        table (str): The raw table.
+        rows (List[Dict[str, Any]]): The raw rows. Rows without a datetime are skipped.
+        grain (str): The bucket size.
+
+    Returns:
+        List[Dict[str, Any]]: The rollup rows.
+    """
+    spec = ROLLUPS[table]
+    buckets: Dict[Tuple, Dict[str, Any]] = OrderedDict()
+    for row in rows:
+        when = row.get("datetime")
+        if not isinstance(when, dt.datetime):
+            continue
+        group = tuple(row.get(col) for col in spec["group_cols"])
+        bucket = truncate(when, grain)
+        agg = buckets.get(group + (bucket,))
+        if agg is None:
+            agg = dict(zip(spec["group_cols"], group), bucket=bucket, n=0, last_datetime=when)
+            for metric in spec["metrics"]:
+                agg.update(
+                    {
+                        f"{metric}_min": None,
+                        f"{metric}_max": None,
+                        f"{metric}_sum": None,
+                        f"{metric}_count": 0,
+                        f"{metric}_last": row.get(metric),
+                    }
+                )
+            buckets[group + (bucket,)] = agg
+        agg["n"] += 1
+        newer = when >= agg["last_datetime"]
+        if newer:
+            agg["last_datetime"] = when
+        for metric in spec["metrics"]:
+            value = row.get(metric)
+            if newer:
+                agg[f"{metric}_last"] = value
+            if value is None:
+                continue
+            agg[f"{metric}_count"] += 1
+            if agg[f"{metric}_min"] is None:
+                agg[f"{metric}_min"] = agg[f"{metric}_max"] = agg[f"{metric}_sum"] = value
+            else:
+                agg[f"{metric}_min"] = min(agg[f"{metric}_min"], value)
+                agg[f"{metric}_max"] = max(agg[f"{metric}_max"], value)
+                agg[f"{metric}_sum"] += value
+    return list(buckets.values())
+
+
+def update_rollups(table: str, c: psycopg2.extensions.cursor, rows: List[Dict[str, Any]]):
+    """
+    Merges newly inserted raw rows into every rollup table of a raw table. Registered as a DBMgr
+    insert hook by register so it runs in the insert transaction.
+
+    Args:
+        table (str): The raw table.
+        c (psycopg2.extensions.cursor): The cursor of the insert transaction.
+        rows (List[Dict[str, Any]]): The inserted rows.
+    """
+    for grain in GRAINS:
+        agg_rows = aggregate(table, rows, grain)
+        if agg_rows:
+            sql, template = _upsert_sql(table, grain)
+            psycopg2.extras.execute_values(c, sql, agg_rows, template=template)
+
+
+_HOOKS = {table: partial(update_rollups, table) for table in ROLLUPS}
+
+
+def register():
+    """
+    Registers the rollup insert hooks so every DBMgr in the process keeps the rollup tables up to
+    date as raw rows are inserted, including rows replayed from XDB. Safe to call more than once.
+    """
+    for table, hook in _HOOKS.items():
+        register_insert_hook(table, hook)
+
+
+def backfill(
+    db: DBMgr, table: str, start: dt.date, end: dt.date, grains: Tuple[str, ...] = GRAINS
+):
+    """
+    Recomputes the rollup buckets of a raw table from the raw rows, one day per transaction.
+    Buckets in the range are overwritten so backfilling is idempotent.
+
+    Args:
+        db (DBMgr): The DB manager for the table's schema.
+        table (str): The raw table.
+        start (dt.date): The first day to recompute.
+        end (dt.date): The day after the last day to recompute.
+        grains (Tuple[str, ...], optional): The rollups to recompute. Defaults to GRAINS.
+    """
+    spec = ROLLUPS[table]
+    cols = _columns(table)
+    key = [*spec["group_cols"], "bucket"]
+    sets = ", ".join(f"{col} = EXCLUDED.{col}" for col in cols if col not in key)
+    day = start
+    while day < end:
+        params = {"start": day, "end": day + dt.timedelta(days=1)}
+        with db.transaction():
+            for grain in grains:
+                selects = [*spec["group_cols"], f"date_trunc('{grain}', datetime) AS bucket"]
+                selects += ["COUNT(*)", "MAX(datetime)"]
+                for m in spec["metrics"]:
+                    selects += [
+                        f"MIN({m})",
+                        f"MAX({m})",
+                        f"SUM({m})",
+                        f"COUNT({m})",
+                        f"(ARRAY_AGG({m} ORDER BY datetime DESC))[1]",
+                    ]
+                group_by = ", ".join([*spec["group_cols"], "bucket"])
+                rowcount = db.execute_raw(
+                    f"INSERT INTO {rollup_table(table, grain)} ({', '.join(cols)}) "
+                    f"SELECT {', '.join(selects)} FROM {table} "
+                    f"WHERE datetime >= %(start)s AND datetime < %(end)s GROUP BY {group_by} "
+                    f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {sets}",
+                    params,
+                )
+                _LOG.info(f"Backfilled {rowcount} {grain} buckets of {table} for {day}")
+        day += dt.timedelta(days=1)
+
+
+def fetch_rollup(
+    db: DBMgr,
+    table: str,
+    grain: str,
+    start: dt.datetime,
+    end: dt.datetime,
+    **group: Any,
+) -> List[Dict[str, Any]]:
+    """
+    Fetches rollup buckets in a time range, oldest first. Uses the rollup primary key so the cost
+    depends on the number of buckets and not on the raw history.
+
+    Args:
+        db (DBMgr): The DB manager for the table's schema.
+        table (str): The raw table.
+        grain (str): The bucket size.
+        start (dt.datetime): The first bucket to fetch.
+        end (dt.datetime): The end of the range, exclusive.
+
+    Keyword Args:
+        Group column values to filter on, such as location="attic".
+
+    Raises:
+        ValueError: If a keyword arg is not a group column of the table.
+
+    Returns:
+        List[Dict[str, Any]]: The buckets with group columns, bucket, n, last_datetime and the
+            min, max, avg and last of every metric.
+    """
+    spec = ROLLUPS[table]
+    unknown = set(group) - set(spec["group_cols"])
+    if unknown:
+        raise ValueError(f"Invalid group columns for {table}: {', '.join(sorted(unknown))}")
+    selects = [*spec["group_cols"], "bucket", "n", "last_datetime"]
+    for m in spec["metrics"]:
+        selects += [f"{m}_min", f"{m}_max", f"{m}_sum / NULLIF({m}_count, 0)", f"{m}_last"]
+    names = [*spec["group_cols"], "bucket", "n", "last_datetime"]
+    for m in spec["metrics"]:
+        names += [f"{m}_min", f"{m}_max", f"{m}_avg", f"{m}_last"]
+    where = ["bucket >= %(start)s", "bucket < %(end)s"]
+    where += [f"{col} = %({col})s" for col in group]
+    rows = db.fetch_raw(
+        f"SELECT {', '.join(selects)} FROM {rollup_table(table, grain)} "
+        f"WHERE {' AND '.join(where)} ORDER BY bucket",
+        {"start": start, "end": end, **group},
+    )
+    return [dict(zip(names, row)) for row in rows]
@@ -0,0 +1,282 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Job scheduler that runs periodic jobs on a thread pool
+File: scheduler
+Project: PiHome
+File Created: Sunday, 18th October 2026 1:05:52 am
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from pihome.shared import Cadence
+
+_LOG = logging.getLogger(__name__)
+
+
+class Job:
+    """
+    A periodic job run on a Cadence. By default runs are aligned to the slots of the day: a job
+    with an interval of 180 and an offset of 10 runs at 10 seconds past every third minute.
+
+    Attributes:
+        name (str): The job name used in logs.
+        func (Callable[[], Any]): Runs the job.
+        interval (float): Seconds between runs.
+        cadence (Cadence): Schedules the runs, see Cadence for offset, jitter and policy.
+        timeout (Optional[float]): Seconds after which a run is reported as hung. A hung run
+            cannot be killed. With the SKIP policy its next runs are skipped until it returns,
+            with CATCH_UP they wait for it.
+        retries (int): Attempts per run.
+        retry_delay (float): Seconds between attempts.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Any],
+        interval: float,
+        offset: float = 0,
+        jitter: float = 0,
+        timeout: float = None,
+        retries: int = 1,
+        retry_delay: float = 5,
+        policy: str = Cadence.SKIP,
+        max_catch_up: Optional[int] = None,
+    ) -> None:
+        """
+        Initializes the job.
+
+        Args:
+            name (str): The job name used in logs.
+            func (Callable[[], Any]): Runs the job.
+            interval (float): Seconds between runs.
+            offset (float, optional): Seconds after each slot of the day. Defaults to 0.
+            jitter (float, optional): Maximum random delay in seconds. Defaults to 0.
+            timeout (float, optional): Seconds after which a run is hung. Defaults to None.
+            retries (int, optional): Attempts per run. Defaults to 1.
+            retry_delay (float, optional): Seconds between attempts. Defaults to 5.
+            policy (str, optional): Handling of overdue runs, Cadence.SKIP or
+                Cadence.CATCH_UP. Defaults to Cadence.SKIP.
+            max_catch_up (Optional[int], optional): The most overdue runs kept by CATCH_UP.
+                Defaults to None.
+        """
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cadence = Cadence(
+            interval, offset=offset, jitter=jitter, policy=policy, max_catch_up=max_catch_up
+        )
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_duration: Optional[float] = None
+        self.future: Optional[Future] = None
+        self.started: Optional[float] = None
+        self.hung = False
+
+    @property
+    def running(self) -> bool:
+        """
+        bool: True while a run has not returned.
+        """
+        return self.future is not None and not self.future.done()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the run statistics of the job.
+
+        Returns:
+            Dict[str, Any]: runs, failures, skipped, missed, last_duration and running.
+        """
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "missed": self.cadence.missed,
+            "last_duration": self.last_duration,
+            "running": self.running,
+        }
+
+
+class Scheduler:
+    """
+    Runs jobs on a small thread pool from a heap ordered by their next run on the monotonic
+    clock, so one process can run every collector of a node. A job never overlaps itself: a
+    run that is due while the previous one is still going is skipped with the SKIP policy and
+    held until the previous one returns with CATCH_UP.
+
+    Attributes:
+        exit_event (threading.Event): Stops the scheduler when set. Jobs should wait on it
+            instead of sleeping so they stop promptly.
+        max_sleep (float): The longest the loop sleeps, so a wall clock change such as the first
+            NTP sync after boot is noticed and aligned jobs are realigned.
+        hold_poll (float): Seconds between checks for held CATCH_UP runs.
+    """
+
+    max_sleep = 30
+    hold_poll = 1
+
+    def __init__(self, exit_event: threading.Event, workers: int = 4) -> None:
+        """
+        Initializes the scheduler.
+
+        Args:
+            exit_event (threading.Event): Stops the scheduler when set.
+            workers (int, optional): Threads that run jobs. Defaults to 4.
+        """
+        self.exit_event = exit_event
+        self.jobs: List[Job] = []
+        self.__workers = workers
+        self.__heap: List = []
+        self.__seq = itertools.count()
+
+    def add(self, job: Job, run_now: bool = False):
+        """
+        Adds a job. Jobs must be added before run is called.
+
+        Args:
+            job (Job): The job.
+            run_now (bool, optional): Run the job immediately once in addition to its
+                scheduled runs. Defaults to False.
+        """
+        _LOG.info(f"Scheduling job {job.name} every {job.interval} seconds")
+        self.jobs.append(job)
+        heapq.heappush(self.__heap, (job.cadence.deadline, next(self.__seq), job, True))
+        if run_now:
+            heapq.heappush(self.__heap, (time.monotonic(), next(self.__seq), job, False))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Gets the run statistics of every job.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: The stats keyed by job name, see Job.stats.
+        """
+        return {job.name: job.stats() for job in self.jobs}
+
+    def run(self):
+        """
+        Runs the jobs until exit_event is set, then waits for running jobs to return.
+        """
+        with ThreadPoolExecutor(self.__workers, thread_name_prefix="job") as executor:
+            while not self.exit_event.is_set():
+                self.__realign()
+                now = time.monotonic()
+                while self.__heap and self.__heap[0][0] <= now:
+                    _, seq, job, scheduled = heapq.heappop(self.__heap)
+                    if scheduled and job.running and job.cadence.policy == Cadence.CATCH_UP:
+                        # hold the run until the previous one returns instead of losing it
+                        heapq.heappush(self.__heap, (now + self.hold_poll, seq, job, True))
+                        continue
+                    self.__dispatch(executor, job)
+                    if not scheduled:
+                        continue
+                    dropped = job.cadence.tick()
+                    if dropped:
+                        _LOG.warning(f"Job {job.name} fell behind. Dropped {dropped} run(s).")
+                    heapq.heappush(self.__heap, (job.cadence.deadline, seq, job, True))
+                self.__check_hung()
+                wait = self.max_sleep
+                if self.__heap:
+                    wait = min(wait, self.__heap[0][0] - time.monotonic())
+                self.exit_event.wait(max(wait, 0))
+            _LOG.info("Waiting for running jobs to finish.")
+
+    def __realign(self):
+        """
+        Reschedules the jobs whose cadence was realigned after a wall clock change.
+        """
+        realigned = [job for job in self.jobs if job.cadence.realign()]
+        if not realigned:
+            return
+        _LOG.warning(f"Wall clock changed. Realigned jobs {[job.name for job in realigned]}.")
+        self.__heap = [
+            (job.cadence.deadline if scheduled and job in realigned else due, seq, job, scheduled)
+            for due, seq, job, scheduled in self.__heap
+        ]
+        heapq.heapify(self.__heap)
+
+    def __dispatch(self, executor: ThreadPoolExecutor, job: Job):
+        """
+        Submits a run of a job unless the previous run is still going.
+
+        Args:
+            executor (ThreadPoolExecutor): Runs the job.
+            job (Job): The job.
+        """
+        if job.running:
+            job.skipped += 1
+            _LOG.warning(f"Skipping job {job.name}. The previous run has not returned.")
+            return
+        job.started = time.monotonic()
+        job.hung = False
+        job.future = executor.submit(self.__execute, job)
+
+    def __check_hung(self):
+        """
+        Logs runs that exceeded their job's timeout once per run.
+        """
+        for job in self.jobs:
+            if job.timeout is None or job.hung or not job.running:
+                continue
+            if time.monotonic() - job.started > job.timeout:
+                job.hung = True
+                _LOG.error(
+                    f"Job {job.name} has been running for more than {job.timeout} seconds. "
+                    "Its runs are skipped or held until it returns."
+                )
+
+    def __execute(self, job: Job):
+        """
+        Runs a job, retrying failed attempts.
+
+        Args:
+            job (Job): The job.
+        """
+        for attempt in range(1, job.retries + 1):
+            try:
+                job.func()
+                break
+            except Exception as ex:
+                if attempt < job.retries:
+                    _LOG.error(f"Job {job.name} failed. {type(ex).__name__}: {str(ex)}")
+                    if self.exit_event.wait(job.retry_delay):
+                        break
+                else:
+                    job.failures += 1
+                    _LOG.exception(f"Job {job.name} failed after {attempt} attempt(s).")
+        job.runs += 1
+        job.last_duration = time.monotonic() - job.started
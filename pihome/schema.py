@@ -0,0 +1,474 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Versioned schema bootstrap with partition and index management
+File: schema
+Project: PiHome
+File Created: Saturday, 17th October 2026 11:02:47 pm
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import datetime as dt
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pihome.db import DBMgr
+from pihome.latest import create_latest_state
+from pihome.rollup import ROLLUPS, create_rollup_tables
+from pihome.shared import get_db_params
+from pihome.vault import VaultMgr
+
+_LOG = logging.getLogger(__name__)
+
+#: Months of partitions kept created ahead of the current month.
+PARTITION_MONTHS_AHEAD = 3
+
+#: The PiHome tables. vault_root holds the database secret of the table's schema. Tables with a
+#: partition_col are range partitioned by month on it. Indexes are (name, columns, unique, method)
+#: and unique indexes double as the ON CONFLICT keys of insert_or_update_data.
+TABLES: Dict[str, Dict[str, Any]] = {
+    "environment": {
+        "vault_root": "sensor/",
+        "columns": [
+            "location TEXT NOT NULL",
+            "datetime TIMESTAMP NOT NULL",
+            "temperature DOUBLE PRECISION",
+            "humidity DOUBLE PRECISION",
+            "temp_critical BOOLEAN",
+            "humidity_critical BOOLEAN",
+        ],
+        "partition_col": "datetime",
+        "indexes": [
+            ("key", ["location", "datetime DESC"], True, "btree"),
+            ("datetime_brin", ["datetime"], False, "brin"),
+        ],
+    },
+    "power": {
+        "vault_root": "solar/",
+        "columns": [
+            "datetime TIMESTAMP NOT NULL",
+            "grid_status TEXT",
+            "grid_power DOUBLE PRECISION",
+            "solar_status TEXT",
+            "solar_power DOUBLE PRECISION",
+            "battery_status TEXT",
+            "battery_power DOUBLE PRECISION",
+            "battery_charge DOUBLE PRECISION",
+            "battery_critical BOOLEAN",
+            "power_usage DOUBLE PRECISION",
+        ],
+        "partition_col": "datetime",
+        "indexes": [("key", ["datetime DESC"], True, "btree")],
+    },
+    "energy": {
+        "vault_root": "solar/",
+        "columns": [
+            "date DATE NOT NULL",
+            "import DOUBLE PRECISION",
+            "export DOUBLE PRECISION",
+            "consumption DOUBLE PRECISION",
+            "self_consumption DOUBLE PRECISION",
+            "production DOUBLE PRECISION",
+        ],
+        "indexes": [("key", ["date DESC"], True, "btree")],
+    },
+    "system_stats": {
+        "vault_root": "report/",
+        "columns": [
+            "nodename TEXT NOT NULL",
+            "datetime TIMESTAMP NOT NULL",
+            "location TEXT",
+            "cpu_temp DOUBLE PRECISION",
+            "cpu_usage DOUBLE PRECISION",
+            "mem_usage DOUBLE PRECISION",
+            "disk_usage BIGINT",
+            "disk_total BIGINT",
+            "uptime TEXT",
+            "cpu_temp_critical BOOLEAN",
+            "cpu_usage_critical BOOLEAN",
+            "mem_usage_critical BOOLEAN",
+            "disk_usage_critical BOOLEAN",
+        ],
+        "partition_col": "datetime",
+        "indexes": [
+            ("key", ["nodename", "datetime DESC"], True, "btree"),
+            ("datetime_brin", ["datetime"], False, "brin"),
+        ],
+    },
+    "notifications": {
+        "vault_root": "report/",
+        "columns": [
+            "datetime TIMESTAMP NOT NULL",
+            "node TEXT NOT NULL",
+            "app TEXT NOT NULL",
+            "type TEXT",
+            "msg TEXT",
+            "status TEXT NOT NULL DEFAULT 'unread'",
+            "pushed BOOLEAN",
+        ],
+        "indexes": [
+            ("key", ["datetime", "app", "node"], True, "btree"),
+            ("status", ["status", "datetime DESC"], False, "btree"),
+        ],
+    },
+    "qotd": {
+        "vault_root": "quote/",
+        "columns": [
+            "datetime TIMESTAMP NOT NULL",
+            "quote TEXT NOT NULL",
+            "author TEXT",
+            "title TEXT",
+        ],
+        "indexes": [("datetime", ["datetime DESC"], False, "btree")],
+    },
+}
+
+_LOWER_BOUND = re.compile(r"FROM \('([^']+)'\)")
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+def _month_start(day: dt.date, months: int = 0) -> dt.date:
+    """
+    Gets the first day of the month a number of months from the month of a day.
+
+    Args:
+        day (dt.date): The day.
+        months (int, optional): The months to add. Defaults to 0.
+
+    Returns:
+        dt.date: The first day of the month.
+    """
+    month = day.year * 12 + day.month - 1 + months
+    return dt.date(month // 12, month % 12 + 1, 1)
+
+
+def _relkind(db: DBMgr, name: str) -> Optional[str]:
+    """
+    Gets the kind of a relation in the schema.
+
+    Args:
+        db (DBMgr): The DB manager.
+        name (str): The relation name.
+
+    Returns:
+        Optional[str]: r for a table, p for a partitioned table or None if it does not exist.
+    """
+    row = db.fetch_raw("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [name], True)
+    return row[0] if row else None
+
+
+def partitions(
+    db: DBMgr, table: str
+) -> List[Tuple[str, Optional[dt.date], Optional[dt.date]]]:
+    """
+    Lists the partitions of a partitioned table.
+
+    Args:
+        db (DBMgr): The DB manager for the table's schema.
+        table (str): The partitioned table.
+
+    Returns:
+        List[Tuple[str, Optional[dt.date], Optional[dt.date]]]: The partition names with their
+            inclusive lower and exclusive upper bounds. Unbounded ends are None.
+    """
+    rows = db.fetch_raw(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s) "
+        "ORDER BY c.relname",
+        [table],
+    )
+    result = []
+    for name, bound in rows:
+        lower, upper = (pattern.search(bound or "") for pattern in (_LOWER_BOUND, _UPPER_BOUND))
+        result.append(
+            (
+                name,
+                dt.date.fromisoformat(lower.group(1)[:10]) if lower else None,
+                dt.date.fromisoformat(upper.group(1)[:10]) if upper else None,
+            )
+        )
+    return result
+
+
+def _create_table(db: DBMgr, table: str):
+    """
+    Creates a table and its indexes if they do not exist. An existing unpartitioned table that
+    should be partitioned is renamed to {table}_legacy and attached as the partition holding
+    everything before next month so no rows are copied.
+
+    Args:
+        db (DBMgr): The DB manager for the table's schema.
+        table (str): The table.
+    """
+    spec = TABLES[table]
+    col = spec.get("partition_col")
+    kind = _relkind(db, table)
+    if kind is None:
+        _LOG.info(f"Creating table {table}")
+        sql = f"CREATE TABLE {table} ({', '.join(spec['columns'])})"
+        if col:
+            sql += f" PARTITION BY RANGE ({col})"
+        db.execute_raw(sql)
+    elif kind == "r" and col:
+        legacy = f"{table}_legacy"
+        upper = _month_start(dt.date.today(), 1)
+        _LOG.info(f"Partitioning {table}. Existing rows are kept in {legacy}.")
+        db.execute_raw(f"ALTER TABLE {table} RENAME TO {legacy}")
+        db.execute_raw(
+            f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ({col})"
+        )
+        db.execute_raw(
+            f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{upper}')"
+        )
+    if col and _relkind(db, f"{table}_default") is None:
+        db.execute_raw(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+    for name, cols, unique, method in spec["indexes"]:
+        if _relkind(db, f"{table}_{name}") is not None:
+            continue
+        if unique:
+            _move_duplicates(db, table, [col.split()[0] for col in cols])
+        db.execute_raw(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX {table}_{name} "
+            f"ON {table} USING {method} ({', '.join(cols)})"
+        )
+
+
+def _move_duplicates(db: DBMgr, table: str, cols: List[str]) -> int:
+    """
+    Moves rows that would violate a new unique index on existing data to {table}_duplicates, so
+    one duplicate in a legacy table does not abort the migration. One row of each duplicate key
+    is kept in the table. Rows with a NULL key column never conflict and are left alone.
+
+    Args:
+        db (DBMgr): The DB manager for the table's schema.
+        table (str): The table.
+        cols (List[str]): The key columns of the unique index.
+
+    Returns:
+        int: The number of rows moved.
+    """
+    key = ", ".join(cols)
+    not_null = " AND ".join(f"{col} IS NOT NULL" for col in cols)
+    row = db.fetch_raw(
+        f"SELECT COUNT(*), SUM(n - 1) FROM (SELECT COUNT(*) AS n FROM {table} WHERE {not_null} "
+        f"GROUP BY {key} HAVING COUNT(*) > 1) dup",
+        single_row=True,
+    )
+    if not row[0]:
+        return 0
+    _LOG.warning(
+        f"{table} has {row[1]} duplicate rows over {row[0]} keys of ({key}). Moving them to "
+        f"{table}_duplicates before creating the unique index."
+    )
+    with db.transaction():
+        db.execute_raw(f"CREATE TABLE IF NOT EXISTS {table}_duplicates (LIKE {table})")
+        moved = db.execute_raw(
+            f"WITH ranked AS (SELECT tableoid AS rel, ctid AS tid, ROW_NUMBER() OVER "
+            f"(PARTITION BY {key} ORDER BY ctid DESC) AS n FROM {table} WHERE {not_null}), "
+            f"moved AS (DELETE FROM {table} t USING ranked r WHERE t.tableoid = r.rel "
+            f"AND t.ctid = r.tid AND r.n > 1 RETURNING t.*) "
+            f"INSERT INTO {table}_duplicates SELECT * FROM moved"
+        )
+    _LOG.warning(f"Moved {moved} duplicate rows from {table} to {table}_duplicates.")
+    return moved
+
+
+def _create_partition(db: DBMgr, table: str, start: dt.date, end: dt.date) -> str:
+    """
+    Creates the partition of a table for [start, end). Rows of the range that landed in the
+    default partition are moved into it before it is attached.
+
+    Args:
+        db (DBMgr): The DB manager for the table's schema.
+        table (str): The partitioned table.
+        start (dt.date): The first day of the partition.
+        end (dt.date): The day after the last day of the partition.
+
+    Returns:
+        str: The partition name.
+    """
+    col = TABLES[table]["partition_col"]
+    name = f"{table}_p{start.year}{start.month:02d}"
+    with db.transaction():
+        db.execute_raw(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+        if _relkind(db, f"{table}_default") is not None:
+            moved = db.execute_raw(
+                f"WITH moved AS (DELETE FROM {table}_default "
+                f"WHERE {col} >= '{start}' AND {col} < '{end}' RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            )
+            if moved:
+                _LOG.info(f"Moved {moved} rows from {table}_default to {name}")
+        db.execute_raw(
+            f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"
+        )
+    return name
+
+
+def ensure_partitions(
+    db: DBMgr, table: str, months_ahead: int = PARTITION_MONTHS_AHEAD
+) -> List[str]:
+    """
+    Creates the monthly partitions of a table from the end of its last partition, or the current
+    month, through months_ahead months from now.
+
+    Args:
+        db (DBMgr): The DB manager for the table's schema.
+        table (str): The partitioned table.
+        months_ahead (int, optional): Months to create ahead. Defaults to PARTITION_MONTHS_AHEAD.
+
+    Returns:
+        List[str]: The partitions created.
+    """
+    uppers = [upper for _, _, upper in partitions(db, table) if upper is not None]
+    start = max(uppers) if uppers else _month_start(dt.date.today())
+    last = _month_start(dt.date.today(), months_ahead)
+    created = []
+    while start <= last:
+        end = _month_start(start, 1)
+        created.append(_create_partition(db, table, start, end))
+        start = end
+    if created:
+        _LOG.info(f"Created partitions {created}")
+    return created
+
+
+def drop_partitions(db: DBMgr, table: str, before: dt.date) -> List[str]:
+    """
+    Drops the monthly partitions of a table that only hold rows before a day. This is how
+    retention removes whole months without deleting rows one by one. The legacy and default
+    partitions are never dropped.
+
+    Args:
+        db (DBMgr): The DB manager for the table's schema.
+        table (str): The partitioned table.
+        before (dt.date): The retention cutoff.
+
+    Returns:
+        List[str]: The partitions dropped.
+    """
+    dropped = []
+    for name, _, upper in partitions(db, table):
+        if upper is not None and upper <= before and name.startswith(f"{table}_p"):
+            _LOG.info(f"Dropping partition {name}")
+            db.execute_raw(f"DROP TABLE {name}")
+            dropped.append(name)
+    return dropped
+
+
+def _create_tables(db: DBMgr, tables: List[str]):
+    """
+    Migration 1. Creates the tables, their indexes and partitions.
+
+    Args:
+        db (DBMgr): The DB manager for the schema.
+        tables (List[str]): The tables in the schema.
+    """
+    for table in tables:
+        _create_table(db, table)
+        if TABLES[table].get("partition_col"):
+            ensure_partitions(db, table)
+
+
+def _create_rollups(db: DBMgr, tables: List[str]):
+    """
+    Migration 2. Creates the rollup tables of the rolled up tables.
+
+    Args:
+        db (DBMgr): The DB manager for the schema.
+        tables (List[str]): The tables in the schema.
+    """
+    for table in tables:
+        if table in ROLLUPS:
+            create_rollup_tables(db, table)
+
+
+#: Schema migrations in the order they are applied. Each is (version, description, migration)
+#: and is applied once per vault root in one transaction.
+MIGRATIONS: List[Tuple[int, str, Callable[[DBMgr, List[str]], None]]] = [
+    (1, "Create tables, indexes and partitions", _create_tables),
+    (2, "Create rollup tables", _create_rollups),
+    (3, "Create and seed latest_state", create_latest_state),
+]
+
+
+def migrate(db: DBMgr, vault_root: str) -> int:
+    """
+    Applies the migrations that have not been applied to the tables of a vault root. Applied
+    versions are recorded in the schema_version table of the schema.
+
+    Args:
+        db (DBMgr): The DB manager for the vault root's schema.
+        vault_root (str): The vault root, such as sensor/.
+
+    Returns:
+        int: The schema version after migrating.
+    """
+    component = vault_root.strip("/")
+    tables = [table for table, spec in TABLES.items() if spec["vault_root"] == vault_root]
+    db.execute_raw(
+        "CREATE TABLE IF NOT EXISTS schema_version (component TEXT NOT NULL, "
+        "version INTEGER NOT NULL, description TEXT NOT NULL, "
+        "applied TIMESTAMP NOT NULL DEFAULT now(), PRIMARY KEY (component, version))"
+    )
+    row = db.fetch_raw(
+        "SELECT COALESCE(MAX(version), 0) FROM schema_version WHERE component = %s",
+        [component],
+        True,
+    )
+    current = row[0]
+    for version, description, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        _LOG.info(f"Applying {component} schema migration {version}: {description}")
+        with db.transaction():
+            migration(db, tables)
+            db.execute_raw(
+                "INSERT INTO schema_version (component, version, description) VALUES (%s, %s, %s)",
+                [component, version, description],
+            )
+        current = version
+    return current
+
+
+def bootstrap(vault: VaultMgr):
+    """
+    Migrates every schema to the latest version and creates the partitions that are due.
+
+    Args:
+        vault (VaultMgr): Used to get the database secrets.
+    """
+    for vault_root in dict.fromkeys(spec["vault_root"] for spec in TABLES.values()):
+        db = DBMgr(**get_db_params(vault, vault_root, "SchemaMgr"))
+        try:
+            version = migrate(db, vault_root)
+            _LOG.info(f"Schema {vault_root} is at version {version}")
+            for table, spec in TABLES.items():
+                if spec["vault_root"] == vault_root and spec.get("partition_col"):
+                    ensure_partitions(db, table)
+        finally:
+            db.exit()
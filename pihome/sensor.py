@@ -34,11 +34,19 @@ import board
 import adafruit_dht
 import datetime as dt
 import logging
-from typing import TYPE_CHECKING, Any, Dict
+import math
+import statistics
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Tuple
 import pihome.constants as constants
 
 from pihome.db import DBMgr
 from pihome.log import log_dict
+from pihome.latest import register as register_latest
+from pihome.rollup import register as register_rollups
+from pihome.shared import Cadence
 
 if TYPE_CHECKING:
     from pihome.vault import VaultMgr
@@ -46,6 +54,202 @@ if TYPE_CHECKING:
 _LOG = logging.getLogger(__name__)
 
 
+class DHTSampler:
+    """
+    Oversamples a DHT22 sensor in a background thread. Reads are kept in a ring buffer covering
+    the last window seconds and summarized with outlier rejection, so a single failed or noisy
+    read no longer costs a whole collection cycle. The sensor device is re-created after a run
+    of failed reads.
+
+    Attributes:
+        pin (board.Pin): The data pin the sensor is connected to.
+        interval (float): Seconds between reads. The DHT22 cannot be read more than once every
+            2 seconds.
+        window (float): Seconds of reads that are summarized.
+        outlier_k (float): Reads further than this many scaled median absolute deviations from
+            the median are rejected.
+        restart_after (int): Consecutive failed reads after which the device is re-created.
+        dht (adafruit_dht.DHT22): The sensor device.
+    """
+
+    #: Scales the median absolute deviation to a standard deviation for normal noise.
+    __MAD_SCALE = 1.4826
+    #: The smallest deviation used for rejection, the sensor resolution. Keeps identical reads
+    #: from rejecting everything that differs by one step.
+    __RESOLUTION = 0.1
+
+    def __init__(
+        self,
+        pin,
+        interval: float = 2.5,
+        window: float = 60,
+        outlier_k: float = 3.5,
+        restart_after: int = 10,
+    ) -> None:
+        """
+        Initializes the sampler. Call start to begin reading.
+
+        Args:
+            pin (board.Pin): The data pin the sensor is connected to.
+            interval (float, optional): Seconds between reads. Defaults to 2.5.
+            window (float, optional): Seconds of reads that are summarized. Defaults to 60.
+            outlier_k (float, optional): The rejection threshold in scaled deviations.
+                Defaults to 3.5.
+            restart_after (int, optional): Consecutive failed reads after which the device is
+                re-created. Defaults to 10.
+        """
+        self.pin = pin
+        self.interval = interval
+        self.window = window
+        self.outlier_k = outlier_k
+        self.restart_after = restart_after
+        self.dht = adafruit_dht.DHT22(pin)
+        # (monotonic time, temperature in C, humidity), the values are None for failed reads
+        self.__reads: Deque[Tuple[float, Optional[float], Optional[float]]] = deque(
+            maxlen=math.ceil(window / interval) + 1
+        )
+        self.__lock = threading.Lock()
+        self.__new_read = threading.Condition(self.__lock)
+        self.__stop = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+        self.__failures = 0
+
+    def start(self):
+        """
+        Starts reading the sensor in a daemon thread.
+        """
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, name="dht-sampler", daemon=True)
+        self.__thread.start()
+
+    def exit(self):
+        """
+        Stops reading and releases the sensor device.
+        """
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout=self.interval + 5)
+        with self.__lock:
+            self.__exit_device()
+
+    def restart(self):
+        """
+        Re-creates the sensor device. Buffered reads are kept.
+        """
+        _LOG.info("Restarting DHT sensor.")
+        with self.__lock:
+            self.__exit_device()
+            self.dht = adafruit_dht.DHT22(self.pin)
+            self.__failures = 0
+
+    def __exit_device(self):
+        """
+        Releases the sensor device, logging any error.
+        """
+        try:
+            self.dht.exit()
+        except Exception as ex:
+            _LOG.error(f"{type(ex).__name__}: {str(ex)}")
+
+    def __run(self):
+        """
+        Reads the sensor every interval seconds until exit is called.
+        """
+        cadence = Cadence(self.interval, align=False)
+        while cadence.wait(self.__stop):
+            cadence.tick()
+            self.__read()
+            if self.__failures >= self.restart_after:
+                self.restart()
+
+    def __read(self):
+        """
+        Takes one read and adds it to the buffer. DHT reads fail often with RuntimeError, those
+        are only logged at debug level.
+        """
+        temp = humidity = None
+        with self.__lock:
+            dht = self.dht
+        try:
+            humidity = dht.humidity
+            temp = dht.temperature
+        except RuntimeError as ex:
+            _LOG.debug(f"DHT read failed. {str(ex)}")
+        except Exception as ex:
+            _LOG.error(f"DHT read failed. {type(ex).__name__}: {str(ex)}")
+        ok = temp is not None and humidity is not None
+        with self.__lock:
+            self.__failures = 0 if ok else self.__failures + 1
+            self.__reads.append((time.monotonic(), temp if ok else None, humidity if ok else None))
+            if ok:
+                self.__new_read.notify_all()
+
+    def __filter(self, values: List[float]) -> List[float]:
+        """
+        Rejects outliers using the median absolute deviation.
+
+        Args:
+            values (List[float]): The values.
+
+        Returns:
+            List[float]: The values within outlier_k scaled deviations of the median.
+        """
+        median = statistics.median(values)
+        mad = statistics.median(abs(value - median) for value in values)
+        limit = self.outlier_k * max(self.__MAD_SCALE * mad, self.__RESOLUTION)
+        return [value for value in values if abs(value - median) <= limit]
+
+    def summary(self, timeout: float = 0) -> Dict[str, Any]:
+        """
+        Summarizes the reads of the last window seconds. Each of temperature and humidity is
+        filtered for outliers, and the median and mean of the remaining reads are returned.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a successful read if there is none
+                in the window, such as right after starting. Defaults to 0.
+
+        Raises:
+            RuntimeError: If no read succeeded within the window.
+
+        Returns:
+            Dict[str, Any]: temperature and humidity (medians), temperature_mean,
+                humidity_mean, samples (successful reads), rejected (outliers), reads (all reads)
+                and success_rate. Temperatures are in C.
+        """
+        with self.__lock:
+            reads = self.__fresh_reads()
+            if not any(temp is not None for _, temp, _ in reads) and timeout > 0:
+                self.__new_read.wait(timeout)
+                reads = self.__fresh_reads()
+        samples = [(temp, humidity) for _, temp, humidity in reads if temp is not None]
+        if not samples:
+            raise RuntimeError(f"No successful DHT reads in {len(reads)} attempt(s).")
+        summary: Dict[str, Any] = {}
+        rejected = 0
+        for i, key in enumerate(("temperature", "humidity")):
+            values = self.__filter([sample[i] for sample in samples])
+            rejected += len(samples) - len(values)
+            summary[key] = statistics.median(values)
+            summary[f"{key}_mean"] = statistics.fmean(values)
+        summary["samples"] = len(samples)
+        summary["rejected"] = rejected
+        summary["reads"] = len(reads)
+        summary["success_rate"] = round(len(samples) / len(reads) * 100, 1)
+        return summary
+
+    def __fresh_reads(self) -> List[Tuple[float, Optional[float], Optional[float]]]:
+        """
+        Gets the buffered reads of the last window seconds. The lock must be held.
+
+        Returns:
+            List[Tuple[float, Optional[float], Optional[float]]]: The reads.
+        """
+        cutoff = time.monotonic() - self.window
+        return [read for read in self.__reads if read[0] >= cutoff]
+
+
 class SensorMgr:
     """
     This class manages gathering data from environment sensors and adding it to the database. The
@@ -55,8 +259,9 @@ class SensorMgr:
     Attributes:
         location (str): The relative location of the sensor. Used to distinguish multiple sensors
             at the same home.
-        dht (adafruit_dht.DHT22): The sensor module used to query sensors.
+        sampler (DHTSampler): Oversamples the DHT22 sensor in the background.
         db (DBMgr): The database module to add data to the DB.
+        buffer_writes (bool): Whether rows are buffered, see DBMgr.buffer_insert_data.
     """
 
     __VAULT_ROOT = "sensor/"
@@ -64,48 +269,56 @@ class SensorMgr:
     __AVAIL_LOCATIONS = ["upstairs", "downstairs", "attic"]
 
     __DHT_PIN = board.D24
+    #: Seconds get_sensor_data waits for a first read after starting.
+    __FIRST_READ_TIMEOUT = 30
 
-    def __init__(self, vault: "VaultMgr", location: str) -> None:
+    def __init__(self, vault: "VaultMgr", location: str, buffer_writes: bool = False) -> None:
         """
         Initializes the sensor manager. Allows it to start monitoring sensor data.
 
         Args:
             vault (VaultMgr): Used to connect to the vault and get secrets.
             location (str): The location of the device.
+            buffer_writes (bool, optional): Buffer the per-cycle rows and write them in batches,
+                see DBMgr.buffer_insert_data. Buffered rows reach the DB up to
+                DBMgr.buffer_max_age seconds late and are lost if the process is killed.
+                Defaults to False.
         """
         if location not in self.__AVAIL_LOCATIONS:
             raise ValueError(
                 f"Invalid location {location}. Must be one of {self.__AVAIL_LOCATIONS}"
             )
         _LOG.info(f"Initializing Sensor Manager.")
-        self.dht = adafruit_dht.DHT22(self.__DHT_PIN)
         self.location = location
+        self.buffer_writes = buffer_writes
         self.__vault = vault
         self.__connect_to_database()
+        self.sampler = DHTSampler(self.__DHT_PIN)
+        self.sampler.start()
 
     def exit(self):
         """
-        Exits the sensor manager. Calls the DB exit method to close DB connection.
+        Exits the sensor manager. Stops the sampler and calls the DB exit method to close DB
+        connection.
         """
+        self.sampler.exit()
         self.db.exit()
-        try:
-            self.dht.exit()
-        except Exception as ex:
-            _LOG.error(f"{type(ex).__name__}: {str(ex)}")
 
     def restart(self):
         """
-        Restarts the sensor manager. This is helpful when sensor calls start erroring out.
+        Restarts the sensor. This is helpful when sensor calls start erroring out. The DB
+        connection is not affected.
         """
-        self.exit()
-        self.__connect_to_database()
-        self.dht = adafruit_dht.DHT22(self.__DHT_PIN)
+        self.sampler.restart()
 
     def __connect_to_database(self):
         """
-        Connects to the database by initializing the db manager.
+        Connects to the database by initializing the db manager. Raw rows inserted through it
+        also update the rollup tables and latest_state.
         """
         db_params = self.__get_databse_params()
+        register_rollups()
+        register_latest()
         self.db = DBMgr(**db_params)
 
     def __get_databse_params(self) -> Dict[str, Any]:
@@ -144,15 +357,25 @@ class SensorMgr:
     def get_sensor_data(self) -> Dict[str, Any]:
         """
         Retrieves environment information from the sensors. This information is returned as a dict.
+        The temperature and humidity are the medians of the sampler's recent reads after outlier
+        rejection, see DHTSampler.summary.
+
+        Raises:
+            RuntimeError: If no read succeeded recently.
 
         Returns:
             Dict[str, Any]: The environment sensor data.
         """
         now = dt.datetime.now().replace(second=0, microsecond=0)
         _LOG.info("Getting environment data")
-        humdity = self.dht.humidity
-        temp = self.dht.temperature
-        temp = self.__to_farenheit(temp)
+        summary = self.sampler.summary(timeout=self.__FIRST_READ_TIMEOUT)
+        _LOG.info(
+            f"Sampled {summary['samples']}/{summary['reads']} reads "
+            f"({summary['success_rate']}% success), rejected {summary['rejected']} outliers. "
+            f"Means: {summary['temperature_mean']:.2f}\u00b0C {summary['humidity_mean']:.2f}%"
+        )
+        humdity = round(summary["humidity"], 2)
+        temp = round(self.__to_farenheit(summary["temperature"]), 2)
         sensor_data = {
             "datetime": now,
             "temperature": temp,
@@ -170,7 +393,8 @@ class SensorMgr:
 
     def update_db_sensor_data(self, sensor_data: Dict[str, Any]):
         """
-        Updates the database with sensor data provided in the params.
+        Updates the database with sensor data provided in the params. The row is buffered if
+        buffer_writes is set, see DBMgr.buffer_insert_data.
 
         Args:
             sensor_data (Dict[str, Any]): The sensor data to add to the database
@@ -180,4 +404,7 @@ class SensorMgr:
         """
         if not ("datetime" in sensor_data and "location" in sensor_data):
             raise ValueError("Missing primary key columns: location, datetime")
-        self.db.insert_data(self.__SENSOR_TABLE, sensor_data)
+        if self.buffer_writes:
+            self.db.buffer_insert_data(self.__SENSOR_TABLE, sensor_data)
+        else:
+            self.db.insert_data(self.__SENSOR_TABLE, sensor_data)
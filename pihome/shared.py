@@ -32,15 +32,20 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 -----
 """
+import datetime as dt
 import json
 import logging
+import math
 import os
+import random
 import shutil
 import signal
 import threading
+import time
 from pathlib import Path
-from typing import Union
+from typing import Any, Dict, Optional, Union
 
+import pihome.constants as constants
 from pihome.vault import VaultMgr
 
 _LOG = logging.getLogger(__name__)
@@ -75,6 +80,213 @@ class GracefulExit:
         self.exit_now.set()
 
 
+class Backoff:
+    """
+    Exponential backoff for retrying an operation that depends on a remote service.
+
+    Attrs:
+        initial (float): The first delay in seconds.
+        maximum (float): The largest delay in seconds.
+        factor (float): The multiplier applied to the delay after every failure.
+        failures (int): The number of consecutive failures.
+    """
+
+    def __init__(self, initial: float = 1, maximum: float = 300, factor: float = 2) -> None:
+        """
+        Initializes the backoff.
+
+        Args:
+            initial (float, optional): The first delay in seconds. Defaults to 1.
+            maximum (float, optional): The largest delay in seconds. Defaults to 300.
+            factor (float, optional): The delay multiplier. Defaults to 2.
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.failures = 0
+
+    def next(self) -> float:
+        """
+        Records a failure and returns how long to wait before the next attempt.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        delay = min(self.initial * self.factor ** self.failures, self.maximum)
+        self.failures += 1
+        return delay
+
+    def reset(self):
+        """
+        Records a success so the next failure starts from the initial delay.
+        """
+        self.failures = 0
+
+
+class Cadence:
+    """
+    Drift free schedule of ticks every interval seconds, for sampling at any interval such as 15
+    seconds. Tick times are computed from a fixed origin on the monotonic clock, so slow cycles
+    and wall clock changes do not shift later ticks. Aligned cadences start at the next slot
+    of the day like the old minute % N checks, e.g. an interval of 180 and an offset of 10 ticks
+    at 10 seconds past every third minute.
+
+    Ticks that are already overdue when a tick is consumed are handled by the policy. SKIP drops
+    them and waits for the next slot. CATCH_UP keeps them due so they run back to back, at most
+    max_catch_up of them, which keeps a late cycle from losing its sample.
+
+    Attrs:
+        interval (float): The seconds between ticks.
+        offset (float): The seconds after each slot of the day aligned ticks happen.
+        jitter (float): Up to this many random seconds are added to each tick so many nodes do
+            not hit the DB at the same instant. Jitter never shifts later ticks.
+        policy (str): SKIP or CATCH_UP.
+        max_catch_up (Optional[int]): The most overdue ticks kept by CATCH_UP. None keeps all.
+        align (bool): Whether ticks are aligned to the slots of the day.
+        missed (int): The number of ticks dropped so far.
+    """
+
+    SKIP = "skip"
+    CATCH_UP = "catch_up"
+
+    #: Seconds the wall clock may move against the monotonic clock before ticks are realigned.
+    STEP_TOLERANCE = 1.0
+
+    def __init__(
+        self,
+        interval: float,
+        offset: float = 0,
+        jitter: float = 0,
+        policy: str = SKIP,
+        max_catch_up: Optional[int] = None,
+        align: bool = True,
+    ) -> None:
+        """
+        Initializes the cadence. The first tick is the next aligned slot, or offset seconds from
+        now if the cadence is not aligned.
+
+        Args:
+            interval (float): The seconds between ticks.
+            offset (float, optional): The seconds after each slot. Defaults to 0.
+            jitter (float, optional): The maximum random delay in seconds. Defaults to 0.
+            policy (str, optional): SKIP or CATCH_UP. Defaults to SKIP.
+            max_catch_up (Optional[int], optional): The most overdue ticks kept by CATCH_UP.
+                Defaults to None.
+            align (bool, optional): Align ticks to the slots of the day. Defaults to True.
+
+        Raises:
+            ValueError: If the interval is not positive or the policy is unknown.
+        """
+        if interval <= 0:
+            raise ValueError(f"Interval must be positive, got {interval}.")
+        if policy not in (self.SKIP, self.CATCH_UP):
+            raise ValueError(f"Policy must be {self.SKIP} or {self.CATCH_UP}, got {policy}.")
+        self.interval = interval
+        self.offset = offset
+        self.jitter = jitter
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.align = align
+        self.missed = 0
+        self.__clock = time.time() - time.monotonic()
+        self.__origin = self.__first_slot()
+        self.__next = self.__origin
+        self.__delay = random.uniform(0, jitter) if jitter else 0
+
+    def __first_slot(self) -> float:
+        """
+        Gets the monotonic time of the first tick from now.
+
+        Returns:
+            float: The monotonic time.
+        """
+        now = time.monotonic()
+        if not self.align:
+            return now + self.offset
+        today = dt.datetime.now()
+        midnight = dt.datetime.combine(today.date(), dt.time())
+        elapsed = (today - midnight).total_seconds() - self.offset
+        return now + (-elapsed) % self.interval
+
+    @property
+    def deadline(self) -> float:
+        """
+        float: The monotonic time of the next tick including jitter.
+        """
+        return self.__next + self.__delay
+
+    def remaining(self) -> float:
+        """
+        Gets the seconds until the next tick.
+
+        Returns:
+            float: The seconds, 0 if the tick is due.
+        """
+        return max(self.deadline - time.monotonic(), 0)
+
+    def due(self) -> bool:
+        """
+        Checks if the next tick is due.
+
+        Returns:
+            bool: True if the tick is due.
+        """
+        return time.monotonic() >= self.deadline
+
+    def tick(self) -> int:
+        """
+        Consumes the next tick and schedules the one after it. Call it when the tick's work
+        starts.
+
+        Returns:
+            int: The number of overdue ticks the policy dropped.
+        """
+        now = time.monotonic()
+        slot = math.floor((self.__next - self.__origin) / self.interval + 1e-9) + 1
+        overdue = 0
+        if now >= self.__origin + slot * self.interval:
+            overdue = math.floor((now - self.__origin) / self.interval + 1e-9) - slot + 1
+        dropped = overdue
+        if self.policy == self.CATCH_UP:
+            dropped = 0 if self.max_catch_up is None else max(overdue - self.max_catch_up, 0)
+        self.missed += dropped
+        self.__next = self.__origin + (slot + dropped) * self.interval
+        self.__delay = random.uniform(0, self.jitter) if self.jitter else 0
+        return dropped
+
+    def wait(self, event: threading.Event) -> bool:
+        """
+        Waits for the next tick without consuming it.
+
+        Args:
+            event (threading.Event): Stops the wait when set, usually GracefulExit.exit_now.
+
+        Returns:
+            bool: True if the tick is due, False if the event was set.
+        """
+        while not event.wait(self.remaining()):
+            if self.due():
+                return True
+        return False
+
+    def realign(self) -> bool:
+        """
+        Moves aligned ticks back onto the slots of the day if the wall clock stepped, such as on
+        the first NTP sync after boot. The pending tick is kept if it is earlier than the new
+        slot, so no tick is lost to the change.
+
+        Returns:
+            bool: True if the ticks were realigned.
+        """
+        clock = time.time() - time.monotonic()
+        if not self.align or abs(clock - self.__clock) <= self.STEP_TOLERANCE:
+            return False
+        self.__clock = clock
+        self.__origin = self.__first_slot()
+        self.__next = min(self.__next, self.__origin)
+        return True
+
+
 def load_json_data(fpath: Path) -> Union[list, dict]:
     """
     Loads a JSON file and returns data.
@@ -111,7 +323,9 @@ def write_json_data(fpath: Path, data: Union[list, dict], stage: bool = False):
 def connect_to_vault() -> VaultMgr:
     """
     Connects to the vault using environment variables. The required env vars must be set prior to
-    calling this function.
+    calling this function. The secrets under constants.vault_prefetch are prefetched and kept in
+    the encrypted disk cache, so the process starts from the cache without waiting on vault. The
+    login, token renewal and secret refresh happen in the background.
 
     Raises:
         ValueError: If required env vars are not set.
@@ -124,9 +338,66 @@ def connect_to_vault() -> VaultMgr:
         if os.getenv(env_var) is None:
             raise ValueError(f"ENV VAR {env_var} is not set.")
     try:
-        vault = VaultMgr(os.getenv("VAULT_URL"), os.getenv("ROLE_ID"), os.getenv("SECRET_ID"))
+        vault = VaultMgr(
+            os.getenv("VAULT_URL"),
+            os.getenv("ROLE_ID"),
+            os.getenv("SECRET_ID"),
+            cache_dir=constants.vault_cache_dir,
+        )
+        vault.prefetch(constants.vault_prefetch)
+        vault.start_renewal()
     except Exception as ex:
         _LOG.error(f"Vault Connection Error. {type(ex).__name__}: {str(ex)}")
         vault = None
     finally:
         return vault
+
+
+def wait_for_vault(exit_event: threading.Event) -> Optional[VaultMgr]:
+    """
+    Connects to the vault, retrying every 10 seconds until it succeeds or exit_event is set.
+
+    Args:
+        exit_event (threading.Event): Stops retrying when set.
+
+    Returns:
+        Optional[VaultMgr]: The vault manager or None if exit_event was set first.
+    """
+    vault = None
+    attempts = 0
+    _LOG.info("Attempting to connect to vault.")
+    timeout = 0.5
+    while vault is None and not exit_event.wait(timeout=timeout):
+        vault = connect_to_vault()
+        attempts += 1
+        if vault is None:
+            _LOG.info(f"Connection failed (total attempts={attempts}). Retrying...")
+            timeout = 10
+    if vault is not None:
+        _LOG.info(f"Connected to vault after {attempts} attempt(s).")
+    return vault
+
+
+def get_db_params(vault: VaultMgr, vault_root: str, application_name: str) -> Dict[str, Any]:
+    """
+    Builds the DBMgr connection parameters from the database secret stored under a vault root,
+    the same way the managers do.
+
+    Args:
+        vault (VaultMgr): The vault manager.
+        vault_root (str): The vault root holding the database secret, such as sensor/.
+        application_name (str): The application name reported to the DB.
+
+    Returns:
+        Dict[str, Any]: The database parameters.
+    """
+    data = vault.get_secret(f"{vault_root}database")
+    return {
+        "host": data["hostname"],
+        "user": data["user"],
+        "password": data["password"],
+        "port": data["port"],
+        "dbname": data["dbname"],
+        "options": f"-c search_path={data['schema']}",
+        "application_name": application_name,
+    }
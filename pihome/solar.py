@@ -38,6 +38,8 @@ import pihome.constants as constants
 import solaredge
 from pihome.log import log_dict
 from pihome.db import DBMgr
+from pihome.latest import register as register_latest
+from pihome.rollup import register as register_rollups
 
 if TYPE_CHECKING:
     from pihome.vault import VaultMgr
@@ -55,6 +57,7 @@ class SolarMgr:
     Attributes:
         solar (solaredge.Solaredge): The solaredge module to query solaredge.
         db (DBMgr): The database module to add data to the DB.
+        buffer_writes (bool): Whether power rows are buffered, see DBMgr.buffer_insert_data.
     """
 
     __TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
@@ -69,15 +72,20 @@ class SolarMgr:
     __ENERGY_TABLE = "energy"
     __POWER_TABLE = "power"
 
-    def __init__(self, vault: "VaultMgr") -> None:
+    def __init__(self, vault: "VaultMgr", buffer_writes: bool = False) -> None:
         """
         Initializes the solar manager. Connects to the database and the solaredge API during the
         initialization process.
 
         Args:
             vault (VaultMgr): The vault to read secrets from.
+            buffer_writes (bool, optional): Buffer the per-cycle rows and write them in batches,
+                see DBMgr.buffer_insert_data. Buffered rows reach the DB up to
+                DBMgr.buffer_max_age seconds late and are lost if the process is killed.
+                Defaults to False.
         """
         _LOG.info(f"Initializing Solar Manager")
+        self.buffer_writes = buffer_writes
         self.__vault = vault
         data = self.__get_solaredge_credentials()
         self.__site_id = data["site_id"]
@@ -99,9 +107,12 @@ class SolarMgr:
 
     def __connect_to_database(self):
         """
-        Connects to the database by initializing the DB manager.
+        Connects to the database by initializing the DB manager. Raw rows inserted through it
+        also update the rollup tables and latest_state.
         """
         db_params = self.__get_databse_params()
+        register_rollups()
+        register_latest()
         self.db = DBMgr(**db_params)
 
     def __get_solaredge_credentials(self) -> Dict[str, Any]:
@@ -200,7 +211,8 @@ class SolarMgr:
 
     def update_power_data(self, power_data: Dict[str, Any]):
         """
-        Uploads the given power data to the database.
+        Uploads the given power data to the database. The row is buffered if buffer_writes is
+        set, see DBMgr.buffer_insert_data.
 
         Args:
             power_data (Dict[str, Any]): The power data to add to the DB.
@@ -210,4 +222,7 @@ class SolarMgr:
         """
         if "datetime" not in power_data:
             raise ValueError(f"Missing primary key column datetime.")
-        self.db.insert_data(self.__POWER_TABLE, power_data, ["datetime"])
+        if self.buffer_writes:
+            self.db.buffer_insert_data(self.__POWER_TABLE, power_data)
+        else:
+            self.db.insert_data(self.__POWER_TABLE, power_data)
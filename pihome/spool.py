@@ -0,0 +1,600 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Write ahead spool for transactions that could not be written to the DB
+File: spool
+Project: PiHome
+File Created: Saturday, 17th October 2026 1:47:05 pm
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import atexit
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pihome.codec import Decoder, Encoder
+
+_LOG = logging.getLogger(__name__)
+
+#: Every segment starts with the magic bytes followed by the format version. Version 1 segments
+#: hold JSON records. Version 2 segments hold records encoded with pihome.codec.
+MAGIC = b"PXDB"
+VERSION = 2
+_HEADER = struct.Struct(">4sB")
+#: Every frame is framed by its payload length and the crc32 of the payload.
+_FRAME = struct.Struct(">II")
+#: Version 2 frame payloads start with their kind. Define frames add a string to the segment
+#: intern table and record frames hold an encoded record.
+_DEFINE = b"D"
+_RECORD = b"R"
+#: Keys of XDB records that hold row data. Their string values are not interned.
+_RAW_KEYS = frozenset({"data", "condition"})
+
+#: Segments that are still being written to by their process.
+ACTIVE_SUFFIX = ".wal"
+#: Segments that will not be written to again.
+SEALED_SUFFIX = ".seg"
+CHECKPOINT_FILE = "spool.ckpt"
+
+#: inotify event mask for segments being created, appended to or sealed.
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+
+_WRITERS: Dict[Path, "SpoolWriter"] = {}
+_WRITERS_LOCK = threading.Lock()
+
+
+class SpoolWriter:
+    """
+    Appends transactions to an append only spool log. Each process writes to its own segment file
+    so appends never contend across processes. Records are binary encoded with table, column and
+    connection strings interned once per segment, length prefixed and checksummed, and fsync calls
+    are batched so a burst of failed transactions costs one fsync instead of one per
+    record. Segments are sealed and a new one is started once they reach max_segment_size.
+
+    Attributes:
+        dirpath (Path): The spool dir.
+        max_segment_size (int): Size in bytes at which the active segment is sealed.
+        fsync_interval (float): Maximum seconds an appended record waits before it is fsynced.
+    """
+
+    def __init__(
+        self, dirpath: Path, max_segment_size: int = 4 * 1024 ** 2, fsync_interval: float = 1.0
+    ) -> None:
+        """
+        Initializes the spool writer. The segment file is only created on the first append.
+
+        Args:
+            dirpath (Path): The spool dir.
+            max_segment_size (int, optional): Segment size in bytes before rotating. Defaults to
+                4 MiB.
+            fsync_interval (float, optional): Seconds between batched fsync calls. Defaults to 1.0.
+        """
+        self.dirpath = Path(dirpath)
+        self.max_segment_size = max_segment_size
+        self.fsync_interval = fsync_interval
+        self.__lock = threading.Lock()
+        self.__fd: Optional[int] = None
+        self.__path: Optional[Path] = None
+        self.__size = 0
+        self.__dirty = False
+        self.__last_fsync = 0.0
+        self.__timer: Optional[threading.Timer] = None
+        self.__last_ns = 0
+        self.__counter = 0
+        self.__encoder = Encoder(raw_keys=_RAW_KEYS)
+
+    def __next_seq(self) -> List[int]:
+        """
+        Gets the sequence number for the next record. Must be called with the lock held.
+
+        Returns:
+            List[int]: The wall clock time in ns, the pid and a per process counter. The time
+                never goes backwards within a process even if the clock is stepped.
+        """
+        self.__last_ns = max(time.time_ns(), self.__last_ns + 1)
+        self.__counter += 1
+        return [self.__last_ns, os.getpid(), self.__counter]
+
+    def __open_segment(self):
+        """
+        Creates a new active segment and writes the segment header. Must be called with the lock
+        held.
+        """
+        self.dirpath.mkdir(mode=0o777, parents=True, exist_ok=True)
+        name = f"xdb_{time.time_ns():020d}_{os.getpid()}{ACTIVE_SUFFIX}"
+        self.__path = self.dirpath / name
+        self.__fd = os.open(self.__path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o666)
+        header = _HEADER.pack(MAGIC, VERSION)
+        os.write(self.__fd, header)
+        self.__encoder.reset()
+        self.__size = len(header)
+        self.__dirty = True
+        _LOG.info(f"Started spool segment {self.__path}")
+
+    def __sync(self):
+        """
+        Fsyncs the active segment if it has unsynced records. Must be called with the lock held.
+        """
+        if self.__fd is not None and self.__dirty:
+            os.fsync(self.__fd)
+            self.__dirty = False
+        self.__last_fsync = time.monotonic()
+
+    def __seal(self):
+        """
+        Fsyncs, closes and seals the active segment. Must be called with the lock held.
+        """
+        if self.__fd is None:
+            return
+        self.__sync()
+        os.close(self.__fd)
+        sealed = self.__path.with_suffix(SEALED_SUFFIX)
+        os.replace(self.__path, sealed)
+        _LOG.info(f"Sealed spool segment {sealed}")
+        self.__fd = None
+        self.__path = None
+        self.__size = 0
+
+    def append(self, record: Dict[str, Any]):
+        """
+        Appends a record to the spool. The record is written immediately and fsynced within
+        fsync_interval seconds. A monotonic sequence number is stored with it under "seq".
+
+        Args:
+            record (Dict[str, Any]): The transaction to spool. Types pihome.codec cannot encode
+                natively are stored as their string representation.
+        """
+        with self.__lock:
+            if self.__fd is None:
+                self.__open_segment()
+            new, payload = self.__encoder.encode({**record, "seq": self.__next_seq()})
+            payloads = [_DEFINE + value.encode() for value in new] + [_RECORD + payload]
+            # one write so a record is never separated from the strings it defines
+            frame = b"".join(
+                _FRAME.pack(len(payload), zlib.crc32(payload)) + payload for payload in payloads
+            )
+            os.write(self.__fd, frame)
+            self.__size += len(frame)
+            self.__dirty = True
+            if self.__size >= self.max_segment_size:
+                self.__seal()
+            elif time.monotonic() - self.__last_fsync >= self.fsync_interval:
+                self.__sync()
+            elif self.__timer is None or not self.__timer.is_alive():
+                self.__timer = threading.Timer(self.fsync_interval, self.flush)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+    def flush(self):
+        """
+        Fsyncs any records that have not been synced yet.
+        """
+        with self.__lock:
+            self.__sync()
+
+    def close(self):
+        """
+        Syncs and seals the active segment. A later append starts a new segment.
+        """
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+            self.__seal()
+
+
+def get_spool_writer(dirpath: Path) -> SpoolWriter:
+    """
+    Gets the process wide spool writer for a spool dir. The writer is sealed when the process
+    exits.
+
+    Args:
+        dirpath (Path): The spool dir.
+
+    Returns:
+        SpoolWriter: The shared spool writer.
+    """
+    dirpath = Path(dirpath)
+    with _WRITERS_LOCK:
+        writer = _WRITERS.get(dirpath)
+        if writer is None:
+            writer = SpoolWriter(dirpath)
+            _WRITERS[dirpath] = writer
+            atexit.register(writer.close)
+    return writer
+
+
+def _pid_alive(pid: int) -> bool:
+    """
+    Checks whether a process is still running.
+
+    Args:
+        pid (int): The process id.
+
+    Returns:
+        bool: True if the process exists. False otherwise.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SpoolReader:
+    """
+    Reads transactions back from the spool in the order they were written. Progress is stored in a
+    checkpoint file so records are only replayed once, and fully replayed sealed segments are
+    deleted. Active segments are read up to their last complete record. Checkpoints may be
+    recorded from several threads.
+
+    Attributes:
+        dirpath (Path): The spool dir.
+        checkpoint_path (Path): The file holding the replay offset of each segment.
+    """
+
+    def __init__(self, dirpath: Path) -> None:
+        """
+        Initializes the reader and loads the checkpoint file.
+
+        Args:
+            dirpath (Path): The spool dir.
+        """
+        self.dirpath = Path(dirpath)
+        self.checkpoint_path = self.dirpath / CHECKPOINT_FILE
+        #: Replay offsets keyed by segment name without suffix so they survive sealing.
+        self.offsets: Dict[str, int] = {}
+        self.__lock = threading.RLock()
+        if self.checkpoint_path.exists():
+            try:
+                with open(self.checkpoint_path) as f:
+                    self.offsets = json.load(f)
+            except ValueError:
+                _LOG.exception(f"Invalid spool checkpoint {self.checkpoint_path}. Ignoring it.")
+
+    def has_pending(self) -> bool:
+        """
+        Cheaply checks whether the spool holds records that have not been replayed by comparing
+        segment sizes with their checkpoints. No records are read.
+
+        Returns:
+            bool: True if there may be records to replay.
+        """
+        if not self.dirpath.exists():
+            return False
+        for entry in os.scandir(self.dirpath):
+            name, suffix = os.path.splitext(entry.name)
+            if suffix not in (ACTIVE_SUFFIX, SEALED_SUFFIX):
+                continue
+            if entry.stat().st_size > max(self.offsets.get(name, 0), _HEADER.size):
+                return True
+            if suffix == SEALED_SUFFIX:
+                # fully replayed segments still need to be cleaned up
+                return True
+        return False
+
+    def segments(self) -> List[Path]:
+        """
+        Lists the segments in the spool dir oldest first. Active segments left behind by processes
+        that are no longer running are sealed first.
+
+        Returns:
+            List[Path]: The segment paths.
+        """
+        if not self.dirpath.exists():
+            return []
+        segments = []
+        for fp in self.dirpath.iterdir():
+            if fp.suffix == ACTIVE_SUFFIX:
+                pid = int(fp.stem.rsplit("_", 1)[1])
+                if not _pid_alive(pid):
+                    sealed = fp.with_suffix(SEALED_SUFFIX)
+                    _LOG.info(f"Sealing segment {fp} left behind by process {pid}.")
+                    os.replace(fp, sealed)
+                    fp = sealed
+                segments.append(fp)
+            elif fp.suffix == SEALED_SUFFIX:
+                segments.append(fp)
+        return sorted(segments, key=lambda fp: fp.stem)
+
+    def locate(self, stem: str) -> Optional[Path]:
+        """
+        Finds the current path of a segment. Active segments are renamed when they are sealed.
+
+        Args:
+            stem (str): The segment name without suffix.
+
+        Returns:
+            Optional[Path]: The segment path. None if the segment no longer exists.
+        """
+        for suffix in (SEALED_SUFFIX, ACTIVE_SUFFIX):
+            fp = self.dirpath / f"{stem}{suffix}"
+            if fp.exists():
+                return fp
+        return None
+
+    def read(self, segment: Path, offset: int = 0) -> Iterator[Tuple[Dict[str, Any], int]]:
+        """
+        Reads the records of a segment starting at its checkpoint or offset, whichever is later.
+        Records written without a sequence number get one from the segment creation time, the pid
+        and the record offset.
+
+        Args:
+            segment (Path): The segment to read.
+            offset (int, optional): The offset of the first record to read. Must be a record
+                boundary. Defaults to 0.
+
+        Yields:
+            Tuple[Dict[str, Any], int]: The record and the offset just past it.
+        """
+        _, created, pid = segment.stem.split("_")
+        if not segment.exists():
+            segment = self.locate(segment.stem)
+            if segment is None:
+                return
+        sealed = segment.suffix == SEALED_SUFFIX
+        with open(segment, "rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            magic, version = _HEADER.unpack(header)
+            if magic != MAGIC or version not in (1, VERSION):
+                _LOG.error(f"Unknown spool segment format in {segment}. Skipping it.")
+                return
+            start = max(self.offsets.get(segment.stem, 0), offset, _HEADER.size)
+            decoder = Decoder()
+            # the intern table of a version 2 segment is rebuilt from its start
+            offset = _HEADER.size if version > 1 else start
+            f.seek(offset)
+            while True:
+                frame = f.read(_FRAME.size)
+                if len(frame) < _FRAME.size:
+                    break
+                length, crc = _FRAME.unpack(frame)
+                end = offset + _FRAME.size + length
+                if offset < start:
+                    if f.read(1) != _DEFINE:
+                        f.seek(end)
+                        offset = end
+                        continue
+                    f.seek(offset + _FRAME.size)
+                payload = f.read(length)
+                if len(payload) < length:
+                    break
+                if zlib.crc32(payload) != crc:
+                    if sealed:
+                        _LOG.error(f"Corrupt record in {segment} at {offset}. Skipping the rest.")
+                    break
+                try:
+                    if version == 1:
+                        record = json.loads(payload)
+                    elif payload[:1] == _DEFINE:
+                        decoder.define(payload[1:].decode())
+                        offset = end
+                        continue
+                    else:
+                        record = decoder.decode(payload[1:])
+                except ValueError:
+                    _LOG.exception(f"Invalid record in {segment} at {offset}. Skipping the rest.")
+                    break
+                record.setdefault("seq", [int(created), int(pid), offset])
+                offset = end
+                yield record, offset
+
+    def pending(self, offsets: Dict[str, int] = {}) -> Iterator[Tuple[Path, Dict[str, Any], int]]:
+        """
+        Reads all records that have not been checkpointed yet, oldest first.
+
+        Args:
+            offsets (Dict[str, int], optional): Offsets keyed by segment name without suffix to
+                start reading from when they are past the checkpoint. Used to skip records that
+                were already read but are not replayed yet. Defaults to {}.
+
+        Yields:
+            Tuple[Path, Dict[str, Any], int]: The segment, the record and the offset just past it.
+        """
+        for segment in self.segments():
+            with self.__lock:
+                segment = self.locate(segment.stem)
+                if segment is None:
+                    continue
+                if self.__replayed(segment):
+                    self.checkpoint(segment, segment.stat().st_size)
+                    continue
+            for record, offset in self.read(segment, offsets.get(segment.stem, 0)):
+                yield segment, record, offset
+
+    def __replayed(self, segment: Path) -> bool:
+        """
+        Checks whether every record of a sealed segment has been replayed.
+
+        Args:
+            segment (Path): The segment.
+
+        Returns:
+            bool: True if the segment is sealed and fully replayed.
+        """
+        offset = max(self.offsets.get(segment.stem, 0), _HEADER.size)
+        return segment.suffix == SEALED_SUFFIX and offset >= segment.stat().st_size
+
+    def checkpoint(self, segment: Path, offset: int):
+        """
+        Records that all records of a segment before offset have been replayed. Sealed segments
+        that are fully replayed are deleted.
+
+        Args:
+            segment (Path): The segment. It may have been sealed since it was read.
+            offset (int): The offset just past the last replayed record.
+        """
+        stem = segment.stem
+        with self.__lock:
+            segment = self.locate(stem)
+            if segment is None:
+                self.offsets.pop(stem, None)
+            elif segment.suffix == SEALED_SUFFIX and offset >= segment.stat().st_size:
+                _LOG.info(f"Spool segment {segment} fully replayed. Deleting it.")
+                segment.unlink()
+                self.offsets.pop(stem, None)
+            else:
+                self.offsets[stem] = offset
+            self.save()
+
+    def save(self):
+        """
+        Atomically writes the checkpoint file. Offsets of segments that no longer exist are
+        dropped.
+        """
+        self.offsets = {
+            stem: offset
+            for stem, offset in self.offsets.items()
+            if (self.dirpath / f"{stem}{ACTIVE_SUFFIX}").exists()
+            or (self.dirpath / f"{stem}{SEALED_SUFFIX}").exists()
+        }
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.offsets, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+class SpoolWatcher:
+    """
+    Waits for changes to the spool dir so the replayer can drain new records as soon as they are
+    written. Uses inotify where available and falls back to polling the size of the segments.
+
+    Attributes:
+        dirpath (Path): The spool dir.
+        poll_interval (float): Seconds between checks when inotify is not available.
+    """
+
+    def __init__(self, dirpath: Path, poll_interval: float = 5.0) -> None:
+        """
+        Initializes the watcher. Creates the spool dir if it does not exist so it can be watched.
+
+        Args:
+            dirpath (Path): The spool dir.
+            poll_interval (float, optional): Seconds between polls in fallback mode. Defaults to
+                5.0.
+        """
+        self.dirpath = Path(dirpath)
+        self.poll_interval = poll_interval
+        self.dirpath.mkdir(mode=0o777, parents=True, exist_ok=True)
+        self.__fd: Optional[int] = None
+        try:
+            self.__fd = self.__inotify_init()
+            _LOG.info(f"Watching {self.dirpath} with inotify.")
+        except (OSError, AttributeError) as ex:
+            _LOG.warning(f"inotify not available ({str(ex)}). Polling {self.dirpath} instead.")
+            self.__snapshot = self.__scan()
+            self.__last_poll = time.monotonic()
+
+    def __inotify_init(self) -> int:
+        """
+        Creates a non blocking inotify instance watching the spool dir.
+
+        Raises:
+            OSError: If inotify could not be set up.
+
+        Returns:
+            int: The inotify file descriptor.
+        """
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        if libc.inotify_add_watch(fd, str(self.dirpath).encode(), _WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, os.strerror(errno))
+        return fd
+
+    def __scan(self) -> Dict[str, int]:
+        """
+        Gets the size of every segment in the spool dir.
+
+        Returns:
+            Dict[str, int]: The segment sizes keyed by file name.
+        """
+        return {
+            entry.name: entry.stat().st_size
+            for entry in os.scandir(self.dirpath)
+            if entry.name.endswith((ACTIVE_SUFFIX, SEALED_SUFFIX))
+        }
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Waits up to timeout seconds for the spool to change.
+
+        Args:
+            timeout (float): The maximum seconds to wait.
+
+        Returns:
+            bool: True if the spool changed. False if the timeout expired.
+        """
+        if self.__fd is None:
+            remaining = self.__last_poll + self.poll_interval - time.monotonic()
+            if remaining > timeout:
+                time.sleep(timeout)
+                return False
+            time.sleep(max(remaining, 0))
+            self.__last_poll = time.monotonic()
+            snapshot = self.__scan()
+            changed = snapshot != self.__snapshot
+            self.__snapshot = snapshot
+            return changed
+        ready, _, _ = select.select([self.__fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.__fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        """
+        Stops watching the spool dir.
+        """
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
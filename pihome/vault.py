@@ -30,70 +30,296 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 -----
 """
+import base64
+import hashlib
+import json
 import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
 import hvac
-from typing import List, Dict
+from hvac.exceptions import Forbidden, Unauthorized, VaultError
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = InvalidToken = None
+
+from pihome.cache import TTLCache
 
 _LOG = logging.getLogger(__name__)
 
 
 class VaultMgr:
     """
-    Allows other modules to read and list vault secrets.
+    Allows other modules to read and list vault secrets. The token lease is tracked locally so
+    the client only logs in again when the token is about to expire instead of asking vault on
+    every call, and secrets are cached for secret_ttl seconds.
+
+    With a cache_dir, prefetched secrets are also kept on disk encrypted with a key derived from
+    the app role credentials, which keeps the secrets out of backups and shares but not away
+    from a user that can read the env files. If that cache is valid at startup the manager
+    starts offline from it without waiting for a login, and start_renewal logs in in the
+    background. Reads fall back to the last known value while vault is down.
 
     Attributes:
         client (hvac.Client): Client used to connect to vault and retrieve secrets.
         role_id (str): The role for the current application. Used to connect to vault
         secret_id (str): The secret id used in the connection.
+        cache_dir (Optional[Path]): Holds the encrypted secret cache. None disables it.
 
     """
 
     KV_VERSION = 1
     MOUNT_POINT = "kv"
+    #: Seconds a secret read is cached. 0 disables the cache.
+    secret_ttl = 300
+    #: Seconds before the token expires that it is renewed or replaced.
+    renew_margin = 60
+    #: Seconds the encrypted disk cache can be used after it was written.
+    disk_cache_ttl = 7 * 24 * 3600
+    #: Seconds between background prefetches that refresh the disk cache.
+    refresh_interval = 3600
+    #: Seconds between background attempts to reach vault while offline.
+    retry_interval = 30
 
-    def __init__(self, endpoint: str, role_id: str, secret_id: str) -> None:
+    def __init__(
+        self, endpoint: str, role_id: str, secret_id: str, cache_dir: Path = None
+    ) -> None:
         """
-        Initializes the vault client and attempts to authenticate using role and secret and sets the
-        default kv engine.
+        Initializes the vault client and sets the default kv engine. If the disk cache holds
+        secrets the manager starts offline from them right away, otherwise it authenticates using
+        role and secret. See start_renewal for leaving offline mode.
 
         Args:
             endpoint (str): The endpoint for the vault server.
             role_id (str): The app role id.
             secret_id (str): The secret id for the app role.
+            cache_dir (Path, optional): Holds the encrypted secret cache. Defaults to None.
+
+        Raises:
+            Exception: If vault cannot be reached and there is no usable disk cache.
         """
         _LOG.debug(f"Connecting to vault server {endpoint}.")
         self.endpoint = endpoint
         self.client = hvac.Client(self.endpoint)
         self.secret_id = secret_id
         self.role_id = role_id
-        self._authenticate()
+        self.cache_dir = cache_dir
+        self.__lock = threading.RLock()
+        self.__token_expires: Optional[float] = None
+        self.__renewable = False
+        self.__secrets = TTLCache(ttl=self.secret_ttl)
+        self.__known: Dict[str, Dict[str, str]] = {}
+        self.__prefixes: List[str] = []
+        self.__refreshed = time.monotonic()
+        self.__offline = False
+        self.__retry_at = time.monotonic()
+        self.__renewer: Optional[threading.Thread] = None
+        self.__stop = threading.Event()
         self.client.secrets.kv.default_kv_version = self.KV_VERSION
+        if self.__load_cache():
+            _LOG.info("Starting from cached secrets. Logging in to vault in the background.")
+            self.__offline = True
+        else:
+            self._authenticate()
 
-    def _authenticate(self):
+    @property
+    def offline(self) -> bool:
         """
-        Checks for authentication and authenticates if client is not currently authenticated.
+        bool: True while secrets are served from the disk cache, from startup until the first
+            background login succeeds or while vault is unreachable.
         """
-        if self.client.is_authenticated():
-            return
-        _LOG.debug(f"Authenticating for app role {self.role_id}")
-        self.client.auth.approle.login(role_id=self.role_id, secret_id=self.secret_id)
+        return self.__offline
 
-    def get_secret(self, path: str) -> Dict[str, str]:
+    def _authenticate(self, force: bool = False):
+        """
+        Logs in with the app role unless the current token is valid for longer than renew_margin.
+        A token without an expiry never needs a new login.
+
+        Args:
+            force (bool, optional): Log in even if the token looks valid, such as after vault
+                rejected it. Defaults to False.
+        """
+        with self.__lock:
+            if not force and self.client.token and not self.__expiring():
+                return
+            _LOG.debug(f"Authenticating for app role {self.role_id}")
+            resp = self.client.auth.approle.login(role_id=self.role_id, secret_id=self.secret_id)
+            self.__set_lease(resp["auth"])
+
+    def __set_lease(self, auth: Dict):
+        """
+        Records the lease of the current token.
+
+        Args:
+            auth (Dict): The auth block of a login or renew response.
+        """
+        lease = auth.get("lease_duration") or 0
+        self.__token_expires = time.monotonic() + lease if lease else None
+        self.__renewable = bool(auth.get("renewable"))
+
+    def __expiring(self) -> bool:
+        """
+        Checks if the token expires within renew_margin seconds.
+
+        Returns:
+            bool: True if the token has to be renewed or replaced.
+        """
+        if self.__token_expires is None:
+            return False
+        return self.__token_expires - time.monotonic() <= self.renew_margin
+
+    def renew(self):
         """
-        Gets all kv pairs for a secret specified in the vault.
+        Renews the token if it is about to expire, logging in again if it cannot be renewed.
+        """
+        with self.__lock:
+            if not self.__expiring():
+                return
+            if self.__renewable:
+                try:
+                    _LOG.debug("Renewing vault token")
+                    self.__set_lease(self.client.auth.token.renew_self()["auth"])
+                    if not self.__expiring():
+                        return
+                except Exception as ex:
+                    _LOG.warning(f"Could not renew vault token. {type(ex).__name__}: {str(ex)}")
+            self._authenticate(force=True)
+
+    def start_renewal(self):
+        """
+        Starts a daemon thread that renews the token before it expires so requests never wait for
+        a login. It also refreshes the prefetched secrets every refresh_interval seconds and, while
+        offline, logs in right away and then retries vault every retry_interval seconds. Calling
+        it again has no effect.
+        """
+        with self.__lock:
+            if self.__renewer is not None:
+                return
+            self.__renewer = threading.Thread(
+                target=self.__renew_loop, name="vault-renew", daemon=True
+            )
+            self.__renewer.start()
+
+    def stop_renewal(self):
+        """
+        Stops the renewal thread.
+        """
+        self.__stop.set()
+        if self.__renewer is not None:
+            self.__renewer.join()
+            self.__renewer = None
+
+    def __renew_loop(self):
+        """
+        Renews the token, refreshes the prefetched secrets and reconnects while offline until
+        stop_renewal is called.
+        """
+        while True:
+            with self.__lock:
+                expires = self.__token_expires
+            if self.__offline:
+                wait = self.__retry_at - time.monotonic()
+            else:
+                wait = 3600 if expires is None else expires - time.monotonic() - self.renew_margin
+                if self.__prefixes:
+                    refresh = self.__refreshed + self.refresh_interval - time.monotonic()
+                    wait = min(wait, refresh)
+            if self.__stop.wait(max(wait, 0)):
+                return
+            try:
+                if self.__offline:
+                    self.__retry_at = time.monotonic() + self.retry_interval
+                    self._authenticate(force=True)
+                    _LOG.info("Connected to vault. Leaving offline mode.")
+                    self.__offline = False
+                    self.prefetch()
+                else:
+                    self.renew()
+                    if time.monotonic() - self.__refreshed >= self.refresh_interval:
+                        self.prefetch()
+            except Exception as ex:
+                _LOG.error(f"Vault maintenance failed. {type(ex).__name__}: {str(ex)}")
+
+    def __call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Calls a client method, logging in again and retrying once if vault rejects the token.
+
+        Args:
+            func (Callable[..., Any]): The client method.
+            *args: Positional arguments for func.
+            **kwargs: Keyword arguments for func.
+
+        Returns:
+            Any: The client method's return value.
+        """
+        self._authenticate()
+        try:
+            return func(*args, **kwargs)
+        except (Forbidden, Unauthorized):
+            _LOG.info("Vault token rejected. Logging in again.")
+            self._authenticate(force=True)
+            return func(*args, **kwargs)
+
+    def __read(self, path: str) -> Dict[str, str]:
+        """
+        Reads a secret from vault. The last known value is returned if vault cannot be reached.
 
         Args:
             path (str): The path to the secret.
 
         Returns:
-            dict: All kv pairs for the secret.
+            Dict[str, str]: All kv pairs for the secret.
         """
-        if not self.client.is_authenticated():
-            self._authenticate()
+        if self.__offline and path in self.__known:
+            return self.__known[path]
         _LOG.info(f"Getting secret for path {path}")
-        secret = self.client.secrets.kv.read_secret(path=path, mount_point=self.MOUNT_POINT)
+        try:
+            secret = self.__call(
+                self.client.secrets.kv.read_secret, path=path, mount_point=self.MOUNT_POINT
+            )
+        except Exception as ex:
+            if path not in self.__known:
+                raise
+            _LOG.warning(f"Using last known secret {path}. {type(ex).__name__}: {str(ex)}")
+            return self.__known[path]
+        self.__known[path] = secret["data"]
         return secret["data"]
 
+    def get_secret(self, path: str) -> Dict[str, str]:
+        """
+        Gets all kv pairs for a secret specified in the vault. Reads are cached for secret_ttl
+        seconds, see invalidate.
+
+        Args:
+            path (str): The path to the secret.
+
+        Returns:
+            dict: All kv pairs for the secret.
+        """
+        if not self.secret_ttl:
+            return dict(self.__read(path))
+        # callers get a copy so changing it does not change the cached secret
+        return dict(self.__secrets.get_or_load(path, lambda: self.__read(path), self.secret_ttl))
+
+    def invalidate(self, path: str = None):
+        """
+        Drops a cached secret so the next read goes to vault, such as after the credentials it
+        holds were rejected.
+
+        Args:
+            path (str, optional): The path to the secret. Drops every secret if None. Defaults to
+                None.
+        """
+        if path is None:
+            self.__secrets.clear()
+        else:
+            self.__secrets.invalidate(path)
+
     def list_secrets(self, path: str = "") -> List[str]:
         """
         Lists all the secrets available at the current path. If no path is supplied defaults to the
@@ -105,8 +331,142 @@ class VaultMgr:
         Returns:
             List[str]: Containing all secrets at the current path.
         """
-        if not self.client.is_authenticated():
-            self._authenticate()
         _LOG.info(f"Listing secrets for path {path}")
-        secrets = self.client.secrets.kv.list_secrets(path=path, mount_point=self.MOUNT_POINT)
+        secrets = self.__call(
+            self.client.secrets.kv.list_secrets, path=path, mount_point=self.MOUNT_POINT
+        )
         return secrets["data"]["keys"]
+
+    def prefetch(self, prefixes: Iterable[str] = None) -> Dict[str, Dict[str, str]]:
+        """
+        Reads every secret under the prefixes in one pass, caches them and writes the disk cache,
+        so managers created afterwards read their secrets from memory. Prefixes the app role may
+        not list and secrets it may not read are skipped. The prefixes are remembered for the
+        background refresh.
+
+        Args:
+            prefixes (Iterable[str], optional): Prefixes such as sensor/. Defaults to the
+                prefixes of the last prefetch.
+
+        Returns:
+            Dict[str, Dict[str, str]]: The secrets keyed by path.
+        """
+        if prefixes is not None:
+            self.__prefixes = list(prefixes)
+        if self.__offline:
+            return dict(self.__known)
+        self._authenticate()
+        fetched = {}
+        pending = list(self.__prefixes)
+        while pending:
+            prefix = pending.pop()
+            try:
+                keys = self.client.secrets.kv.list_secrets(
+                    path=prefix, mount_point=self.MOUNT_POINT
+                )["data"]["keys"]
+            except VaultError as ex:
+                _LOG.debug(f"Skipping prefix {prefix}. {type(ex).__name__}: {str(ex)}")
+                continue
+            for key in keys:
+                path = f"{prefix}{key}"
+                if key.endswith("/"):
+                    pending.append(path)
+                    continue
+                try:
+                    secret = self.client.secrets.kv.read_secret(
+                        path=path, mount_point=self.MOUNT_POINT
+                    )
+                except VaultError as ex:
+                    _LOG.warning(f"Skipping secret {path}. {type(ex).__name__}: {str(ex)}")
+                    continue
+                fetched[path] = secret["data"]
+                self.__known[path] = secret["data"]
+                self.__secrets.set(path, secret["data"])
+        self.__refreshed = time.monotonic()
+        _LOG.info(f"Prefetched {len(fetched)} secrets under {self.__prefixes}")
+        self.__save_cache()
+        return fetched
+
+    def __fernet(self) -> Optional["Fernet"]:
+        """
+        Gets the cipher of the disk cache. The key is derived from the app role credentials.
+
+        Returns:
+            Optional[Fernet]: The cipher or None if the disk cache is disabled.
+        """
+        if self.cache_dir is None:
+            return None
+        if Fernet is None:
+            _LOG.warning("cryptography is not installed. Secrets are not cached on disk.")
+            return None
+        digest = hashlib.sha256(f"{self.role_id}:{self.secret_id}".encode()).digest()
+        return Fernet(base64.urlsafe_b64encode(digest))
+
+    def __cache_file(self) -> Path:
+        """
+        Gets the disk cache file of the app role.
+
+        Returns:
+            Path: The cache file.
+        """
+        role = hashlib.sha256(self.role_id.encode()).hexdigest()[:16]
+        return Path(self.cache_dir) / f"vault_{role}.cache"
+
+    def __save_cache(self):
+        """
+        Writes the known secrets to the encrypted disk cache. The file is replaced atomically so
+        daemons sharing the app role never read a partial cache.
+        """
+        fernet = self.__fernet()
+        if fernet is None:
+            return
+        cache_file = self.__cache_file()
+        try:
+            cache_file.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(fernet.encrypt(json.dumps(self.__known).encode()))
+            os.replace(tmp_file, cache_file)
+        except OSError as ex:
+            _LOG.warning(f"Could not write secret cache. {type(ex).__name__}: {str(ex)}")
+
+    def __load_cache(self) -> bool:
+        """
+        Loads the known secrets from the encrypted disk cache if it exists and has not expired.
+
+        Returns:
+            bool: True if secrets were loaded.
+        """
+        fernet = self.__fernet()
+        if fernet is None or not self.__cache_file().exists():
+            return False
+        try:
+            token = self.__cache_file().read_bytes()
+            self.__known = json.loads(fernet.decrypt(token, ttl=self.disk_cache_ttl))
+        except (OSError, ValueError, InvalidToken) as ex:
+            _LOG.warning(f"Secret cache unusable. {type(ex).__name__}: {str(ex)}")
+            return False
+        return bool(self.__known)
+
+
+_VAULT: Optional[VaultMgr] = None
+_VAULT_LOCK = threading.Lock()
+
+
+def get_vault() -> VaultMgr:
+    """
+    Gets the process wide vault manager, connecting with the VAULT_URL, ROLE_ID and SECRET_ID
+    env vars on first use and renewing its token in the background. Long running processes such
+    as the web servers use it so requests share one login and one secret cache.
+
+    Returns:
+        VaultMgr: The shared vault manager.
+    """
+    global _VAULT
+    with _VAULT_LOCK:
+        if _VAULT is None:
+            vault = VaultMgr(os.getenv("VAULT_URL"), os.getenv("ROLE_ID"), os.getenv("SECRET_ID"))
+            vault.start_renewal()
+            _VAULT = vault
+        return _VAULT
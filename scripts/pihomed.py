@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+PiHome daemon that runs all collectors of a node in one process
+File: pihomed
+Project: PiHome
+File Created: Sunday, 18th October 2026 2:02:33 am
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import argparse
+import re
+import socket
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+import pihome.constants as constants
+from pihome.collectors import COLLECTORS, run_collectors
+from pihome.log import get_logger
+
+
+def get_node_type() -> Optional[str]:
+    """
+    Gets the node type from the hostname, such as sensor for pisensor1.
+
+    Returns:
+        Optional[str]: The node type or None if the hostname does not match.
+    """
+    match = re.search(r"^pi(?P<nodetype>[a-zA-Z]+)\d*$", socket.gethostname())
+    return match.group("nodetype") if match else None
+
+
+def main(collectors: List[str]) -> int:
+    """
+    Runs the collectors on one scheduler sharing the vault and DB connections.
+
+    Args:
+        collectors (List[str]): The collectors to run.
+
+    Returns:
+        int: The exit code to exit with.
+    """
+    try:
+        log.info(f"Starting collectors {collectors}")
+        exit_code = run_collectors(collectors)
+    except Exception:
+        _, _, exc_tb = sys.exc_info()
+        exit_code = exc_tb.tb_lineno
+        log.exception("Fatal Error")
+    finally:
+        return exit_code
+
+
+if __name__ == "__main__":
+    log_filepath = constants.log_dir / f"{Path(__file__).stem}.log"
+    log = get_logger(log_filepath, level="DEBUG")
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "collectors",
+        nargs="*",
+        help=f"The collectors to run, any of {list(COLLECTORS)}. Defaults to the collectors of "
+        "the node type.",
+        default=None,
+    )
+    args = parser.parse_args()
+    collectors = args.collectors or constants.pihomed_collectors.get(
+        get_node_type(), ["health", "xdb"]
+    )
+    sys.exit(main(collectors))
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Retention script that purges and downsamples old PiHome data
+File: retention
+Project: PiHome
+File Created: Saturday, 17th October 2026 10:34:12 pm
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import datetime as dt
+import sys
+from pathlib import Path
+
+import pihome.constants as constants
+from pihome.log import get_logger
+from pihome.retention import RetentionMgr
+from pihome.shared import GracefulExit, connect_to_vault
+
+
+def main():
+    try:
+        exit_code = 0
+        exit_control = GracefulExit()
+        vault = None
+        attempts = 0
+        log.info(f"Attempting to connect to vault.")
+        timeout = 0.5
+        while vault is None and not exit_control.exit_now.wait(timeout=timeout):
+            vault = connect_to_vault()
+            attempts += 1
+            if vault is None:
+                log.info(f"Connection failed (total attempts={attempts}). Retrying...")
+            if vault is None:
+                timeout = 10
+        if exit_control.exit_now.is_set():
+            log.info("Exit signal recieved. Exiting...")
+            exit_code = 255
+            return
+        log.info(f"Connected to vault after {attempts} attempt(s).")
+        retention = RetentionMgr(vault)
+        start_hour, end_hour = constants.retention_hours
+        last_run = None
+        timeout = 0.5
+        while not exit_control.exit_now.wait(timeout=timeout):
+            now = dt.datetime.now()
+            if start_hour <= now.hour < end_hour and last_run != now.date():
+                until = now.replace(hour=end_hour, minute=0, second=0, microsecond=0)
+                log.info(f"Applying retention policy until {until}")
+                deleted = retention.run(exit_control.exit_now, until)
+                log.info(f"Retention policy applied: {deleted}")
+                last_run = now.date()
+            now = dt.datetime.now()
+            next_check = (now + dt.timedelta(minutes=10)).replace(second=0, microsecond=0)
+            timeout = (next_check - now).total_seconds()
+            log.debug(f"Waiting for next check: {next_check}")
+        retention.exit()
+        log.info(f"Exited at {dt.datetime.now()}")
+    except:
+        _, _, exc_tb = sys.exc_info()
+        exit_code = exc_tb.tb_lineno
+        log.exception("Fatal Error")
+    finally:
+        return exit_code
+
+
+if __name__ == "__main__":
+    log_filepath = constants.log_dir / f"{Path(__file__).stem}.log"
+    log = get_logger(log_filepath, level="DEBUG")
+    sys.exit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Backfills the time-series rollup tables from the raw rows
+File: rollup
+Project: PiHome
+File Created: Saturday, 17th October 2026 9:48:12 pm
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+
+import argparse
+import datetime as dt
+import sys
+from pathlib import Path
+
+import pihome.constants as constants
+from pihome.db import DBMgr
+from pihome.log import get_logger
+from pihome.rollup import ROLLUPS, backfill, create_rollup_tables
+from pihome.shared import connect_to_vault, get_db_params
+
+
+def main(tables: list, start: dt.date, end: dt.date) -> int:
+    """
+    Creates the rollup tables if needed and recomputes their buckets from the raw rows.
+
+    Args:
+        tables (list): The raw tables to backfill.
+        start (dt.date): The first day to backfill.
+        end (dt.date): The last day to backfill.
+
+    Returns:
+        int: The exit code to exit with.
+    """
+    try:
+        exit_code = 0
+        vault = connect_to_vault()
+        if vault is None:
+            log.error("Could not connect to vault.")
+            exit_code = 1
+            return
+        for table in tables:
+            db_params = get_db_params(vault, ROLLUPS[table]["vault_root"], Path(__file__).stem)
+            db = DBMgr(**db_params)
+            try:
+                create_rollup_tables(db, table)
+                log.info(f"Backfilling {table} rollups from {start} to {end}")
+                backfill(db, table, start, end + dt.timedelta(days=1))
+            finally:
+                db.exit()
+    except Exception:
+        _, _, exc_tb = sys.exc_info()
+        exit_code = exc_tb.tb_lineno
+        log.exception("Fatal Error")
+    finally:
+        return exit_code
+
+
+if __name__ == "__main__":
+    log_filepath = constants.log_dir / f"{Path(__file__).stem}.log"
+    log = get_logger(log_filepath, level="DEBUG")
+    parser = argparse.ArgumentParser(description="Backfills the time-series rollup tables.")
+    parser.add_argument(
+        "--table",
+        type=str,
+        help="The raw table to backfill. All rolled up tables by default.",
+        choices=list(ROLLUPS),
+        action="append",
+    )
+    parser.add_argument(
+        "--start",
+        type=dt.date.fromisoformat,
+        help="The first day to backfill (YYYY-MM-DD). Defaults to 7 days ago.",
+        default=dt.date.today() - dt.timedelta(days=7),
+    )
+    parser.add_argument(
+        "--end",
+        type=dt.date.fromisoformat,
+        help="The last day to backfill (YYYY-MM-DD). Defaults to today.",
+        default=dt.date.today(),
+    )
+    args = parser.parse_args()
+    sys.exit(main(args.table or list(ROLLUPS), args.start, args.end))
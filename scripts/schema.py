@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Schema bootstrap script that creates and migrates the PiHome tables
+File: schema
+Project: PiHome
+File Created: Saturday, 17th October 2026 11:40:05 pm
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import sys
+from pathlib import Path
+
+import pihome.constants as constants
+from pihome.log import get_logger
+from pihome.schema import bootstrap
+from pihome.shared import connect_to_vault
+
+
+def main() -> int:
+    """
+    Applies the pending schema migrations and creates the partitions that are due.
+
+    Returns:
+        int: The exit code to exit with.
+    """
+    try:
+        exit_code = 0
+        vault = connect_to_vault()
+        if vault is None:
+            log.error("Could not connect to vault.")
+            exit_code = 1
+        else:
+            bootstrap(vault)
+            log.info("Schema is up to date.")
+    except:
+        _, _, exc_tb = sys.exc_info()
+        exit_code = exc_tb.tb_lineno
+        log.exception("Fatal Error")
+    finally:
+        return exit_code
+
+
+if __name__ == "__main__":
+    log_filepath = constants.log_dir / f"{Path(__file__).stem}.log"
+    log = get_logger(log_filepath, level="DEBUG")
+    sys.exit(main())
@@ -30,68 +30,24 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 -----
 """
-
-import datetime as dt
-import os
 import sys
 from pathlib import Path
-from typing import Any, Dict
 
 import pihome.constants as constants
-from pihome.i2cdisplay import Display
+from pihome.collectors import run_collectors
 from pihome.log import get_logger
-from pihome.shared import GracefulExit, connect_to_vault
 
 
 def main() -> int:
+    """
+    Runs the display collector on its own. Nodes normally run it in pihomed with their other
+    collectors.
+
+    Returns:
+        int: The exit code to exit with.
+    """
     try:
-        exit_code = 0
-        exit_control = GracefulExit()
-        vault = None
-        attempts = 0
-        log.info(f"Attempting to connect to vault.")
-        timeout = 0.5
-        while vault is None and not exit_control.exit_now.wait(timeout=timeout):
-            vault = connect_to_vault()
-            attempts += 1
-            if vault is None:
-                log.info(f"Connection failed (total attempts={attempts}). Retrying...")
-            if vault is None:
-                timeout = 10
-        if exit_control.exit_now.is_set():
-            log.info("Exit signal recieved. Exiting...")
-            exit_code = 255
-            return
-        log.info(f"Connected to vault after {attempts} attempt(s).")
-        location = os.getenv("LOCATION")
-        display = Display(vault, location)
-        timeout = 0.5
-        max_tries = 5
-        while not exit_control.exit_now.wait(timeout=timeout):
-            exit_proc = False
-            now = dt.datetime.now()
-            num_tries = 0
-            while num_tries < max_tries:
-                num_tries += 1
-                try:
-                    sensor_data = display.get_sensor_data()
-                    display.display_sensor_data(sensor_data)
-                except Exception as ex:
-                    if num_tries < max_tries:
-                        log.error(f"{type(ex).__name__}: {str(ex)}")
-                    else:
-                        log.exception(f"Could not fetch sensor data for {now}.")
-                    exit_proc = exit_control.exit_now.wait(5)
-                finally:
-                    if exit_proc:
-                        break
-            if not exit_proc:
-                now = dt.datetime.now()
-                next_minute = (now + dt.timedelta(minutes=1)).replace(second=15, microsecond=0)
-                timeout = (next_minute - now).total_seconds()
-                log.debug(f"Waiting for next minute: {next_minute}")
-        display.exit()
-        log.info(f"Exited at {now}")
+        exit_code = run_collectors(["display"])
     except Exception:
         _, _, exc_tb = sys.exc_info()
         exit_code = exc_tb.tb_lineno
@@ -53,6 +53,7 @@ except ImportError:
 
 PY_PACKAGES = {
     "hvac": "hvac",
+    "cryptography": "cryptography",
     "solaredge": "solaredge",
     "psycopg2": "psycopg2",
     "django": "django",
@@ -77,7 +78,13 @@ APT_PACKAGES = [
     "libgpiod2",
 ]
 
-DIRS = {constants.log_dir: 0o777, constants.mnt_dir: 0o777, constants.data_dir: 0o777}
+DIRS = {
+    constants.log_dir: 0o777,
+    constants.mnt_dir: 0o777,
+    constants.data_dir: 0o777,
+    constants.xdb_dir: 0o777,
+    constants.xdb_dead_dir: 0o777,
+}
 FILES = {constants.script_dir: {"*": 0o775}}
 
 FSTAB_LINE = (
@@ -88,19 +95,20 @@ FSTAB = "/etc/fstab"
 SYSTEMD_PATH = Path("/etc/systemd/system")
 
 SERVICES = {
-    "common": ["healthcheck", "xdb"],
+    "common": ["pihomed"],
     "frame": [
         "vault",
         "unseal",
         "pihomebackup",
         "pihomeweb",
-        "solarmonitor",
-        "quotefetch",
+        "retention",
         "hyperion",
     ],
-    "sensor": ["envsense", "sensordisplay"],
+    "sensor": [],
     "display": ["picontrol"],
 }
+#: Services replaced by pihomed. They are stopped and disabled on nodes that still run them.
+RETIRED_SERVICES = ["healthcheck", "xdb", "solarmonitor", "quotefetch", "envsense", "sensordisplay"]
 
 LOCATIONS = {"sensor1": "downstairs", "sensor2": "upstairs", "sensor3": "attic"}
 
@@ -214,7 +222,19 @@ def mount_backup_drive():
     constants.backup_dir.mkdir(exist_ok=True, mode=0o777)
 
 
+def retire_services():
+    for service in RETIRED_SERVICES:
+        sym_path = SYSTEMD_PATH / f"{service}.service"
+        if not sym_path.is_symlink():
+            continue
+        log.info(f"Retiring service {service}")
+        subprocess.run(f"systemctl stop {service}", shell=True)
+        subprocess.run(f"systemctl disable {service}", shell=True)
+        sym_path.unlink()
+
+
 def configure_services(node_type: str):
+    retire_services()
     service_types = ["common", node_type]
     for service_type in service_types:
         log.info(f"Configuring {service_type} services")
@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+"""
+Tests for the XDB replay planner
+File: test_replay
+Project: PiHome
+File Created: Sunday, 18th October 2026 4:12:41 am
+Author: Aziz Contractor
+-----
+MIT License
+
+Copyright (c) 2021 Your Company
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+-----
+"""
+import unittest
+from typing import Any, Dict
+
+from pihome.replay import plan_replay
+
+_TARGET = {"dbname": "pihome", "dboptions": None, "dbkwargs": {}}
+
+
+def _record(seq: int, txn_type: str, **kwargs) -> Dict[str, Any]:
+    """
+    Builds an XDB record like the ones DBMgr.write_xdb spools.
+
+    Args:
+        seq (int): The sequence number.
+        txn_type (str): The transaction type.
+
+    Keyword Args:
+        The transaction kwargs, such as table, data, key_cols and condition.
+
+    Returns:
+        Dict[str, Any]: The record.
+    """
+    return {**_TARGET, "seq": [0, 0, seq], "txn_type": txn_type, "kwargs": kwargs}
+
+
+class PlanReplayTest(unittest.TestCase):
+    def test_delete_cancels_insert(self):
+        ops = plan_replay(
+            [
+                _record(1, "insert", table="t", data={"k": 1, "v": 1}),
+                _record(2, "delete", table="t", condition={"v": 1}),
+            ]
+        )
+        self.assertEqual([op["txn_type"] for op in ops], ["delete"])
+        self.assertEqual(sorted(ops[0]["sources"]), [(0, 0, 1), (0, 0, 2)])
+
+    def test_update_keeps_insert(self):
+        ops = plan_replay(
+            [
+                _record(1, "insert", table="t", data={"id": 1, "status": "a"}),
+                _record(2, "update", table="t", data=[{"id": 1, "status": "b"}], key_cols=["id"]),
+                _record(3, "delete", table="t", condition={"status": "a"}),
+            ]
+        )
+        self.assertEqual([op["txn_type"] for op in ops], ["insert", "update", "delete"])
+
+    def test_insert_update_keeps_insert(self):
+        ops = plan_replay(
+            [
+                _record(1, "insert", table="t", data={"k": 1, "v": 1}),
+                _record(2, "insert_update", table="t", data={"k": 1, "w": 5}, key_cols=["k"]),
+                _record(3, "delete", table="t", condition={"v": 1}),
+            ]
+        )
+        self.assertEqual([op["txn_type"] for op in ops], ["insert", "insert_update", "delete"])
+
+    def test_insert_updates_coalesce(self):
+        ops = plan_replay(
+            [
+                _record(1, "insert_update", table="t", data={"k": 1, "v": 1}, key_cols=["k"]),
+                _record(2, "insert_update", table="t", data={"k": 1, "w": 5}, key_cols=["k"]),
+            ]
+        )
+        self.assertEqual(len(ops), 1)
+        self.assertEqual(ops[0]["kwargs"]["data"], {"k": 1, "v": 1, "w": 5})
+        self.assertEqual(ops[0]["sources"], [(0, 0, 1), (0, 0, 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -35,6 +35,11 @@ import datetime as dt
 from django.db import connections
 from django.http import Http404, HttpRequest, JsonResponse
 from django.shortcuts import render
+from pihome.cache import TTLCache
+
+#: Shares get_stats results across requests and open dashboards. Node stats are written every
+#: five minutes so a short ttl serves the polls in between from memory.
+_STATS_CACHE = TTLCache(ttl=15)
 
 # Create your views here.
 def index(request: HttpRequest):
@@ -44,33 +49,37 @@ def index(request: HttpRequest):
 def get_stats(request: HttpRequest):
     if not request.is_ajax():
         raise Http404("Page not found")
+    return JsonResponse(_STATS_CACHE.get_or_load("stats", _load_stats))
+
+
+def _load_stats() -> dict:
+    """
+    Loads the latest stats of every node that reported today with one DISTINCT ON query, which
+    the (nodename, datetime DESC) key index serves.
+
+    Returns:
+        dict: The display stats keyed by node.
+    """
     with connections["report"].cursor() as c:
         c.execute(
-            "SELECT nodename, MAX(datetime) FROM system_stats WHERE DATE(datetime) = %s "
-            "GROUP BY nodename",
-            (dt.date.today(),),
+            "SELECT DISTINCT ON (nodename) nodename, datetime, cpu_temp, cpu_usage, mem_usage, "
+            "disk_usage, disk_total, location, uptime FROM system_stats WHERE datetime >= %s "
+            "ORDER BY nodename, datetime DESC",
+            (dt.datetime.combine(dt.date.today(), dt.time()),),
         )
         rows = c.fetchall()
-        node_data = {node: {"updated": timestamp} for node, timestamp in rows}
-        for node, timestamp in rows:
-            node_data[node]["update_late"] = dt.datetime.now() > timestamp + dt.timedelta(
-                minutes=15
-            )
-            c.execute(
-                "SELECT cpu_temp,cpu_usage,mem_usage,disk_usage,disk_total,location,uptime FROM "
-                "system_stats WHERE nodename = %s AND datetime = %s",
-                (node, timestamp),
-            )
-            row = c.fetchone()
-            node_data[node]["CPU Temperature"] = f"{round(row[0],2)}\u00b0 C"
-            node_data[node]["CPU Usage"] = f"{round(row[1],2)}%"
-            node_data[node]["Memory Usage"] = f"{round(row[2],2)}%"
-            node_data[node]["Disk"] = (
-                f"{int(round(row[3]/1024**3))} GB / {int(round(row[4]/1024**3))} GB "
-                f"({round((row[3]/row[4])*100,2)}%)"
-            )
-            node_data[node]["Uptime"] = row[6].title()
-            if "sensor" in node:
-                node_data[node]["Location"] = row[5].title()
-
-    return JsonResponse(node_data)
+    node_data = {}
+    for node, timestamp, *row in rows:
+        node_data[node] = {"updated": timestamp}
+        node_data[node]["update_late"] = dt.datetime.now() > timestamp + dt.timedelta(minutes=15)
+        node_data[node]["CPU Temperature"] = f"{round(row[0],2)}\u00b0 C"
+        node_data[node]["CPU Usage"] = f"{round(row[1],2)}%"
+        node_data[node]["Memory Usage"] = f"{round(row[2],2)}%"
+        node_data[node]["Disk"] = (
+            f"{int(round(row[3]/1024**3))} GB / {int(round(row[4]/1024**3))} GB "
+            f"({round((row[3]/row[4])*100,2)}%)"
+        )
+        node_data[node]["Uptime"] = row[6].title()
+        if "sensor" in node:
+            node_data[node]["Location"] = row[5].title()
+    return node_data
@@ -10,6 +10,12 @@ function load_solar_data() {
             var power_data = response["power"];
             var energy_data = response["energy"];
             solar_div.innerHTML = "";
+            if (!power_data || !energy_data) {
+                var h = document.createElement("h3");
+                h.innerText = "No solar data yet";
+                solar_div.appendChild(h);
+                return;
+            }
             var data_row = document.createElement("div");
             data_row.className = "w3-cell-row";
             create_solar_status(data_row, power_data, energy_data);
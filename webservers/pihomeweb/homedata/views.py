@@ -32,18 +32,50 @@ SOFTWARE.
 """
 
 import datetime as dt
+import json
 import logging
-import os
+from typing import List
 
 import pihole as ph
 from django.db import connections
 from django.http import Http404, HttpRequest, JsonResponse
 from django.shortcuts import render
+from pihome.cache import TTLCache
 from pihome.router import RouterMgr
-from pihome.vault import VaultMgr
+from pihome.vault import get_vault
 
 _LOG = logging.getLogger(__name__)
 
+#: How often sensor and solar readings are collected. A cached response expires when the next
+#: reading is due and is kept no longer than one cadence.
+SENSOR_CADENCE = dt.timedelta(minutes=3)
+SOLAR_CADENCE = dt.timedelta(minutes=10)
+#: Age after which a reading is flagged as late.
+SENSOR_LATE = dt.timedelta(minutes=5)
+SOLAR_LATE = dt.timedelta(minutes=15)
+#: Seconds a response is cached while a reading is overdue.
+_LATE_TTL = 15
+_CACHE = TTLCache(ttl=SOLAR_CADENCE.total_seconds())
+
+
+def _until_due(updated: List[dt.datetime], cadence: dt.timedelta) -> float:
+    """
+    Gets the seconds until the next reading is due, so a cached response is replaced as soon as
+    the data it was built from can change.
+
+    Args:
+        updated (List[dt.datetime]): The timestamps of the latest readings.
+        cadence (dt.timedelta): The collection cadence.
+
+    Returns:
+        float: The ttl of the response. _LATE_TTL if every reading is overdue.
+    """
+    now = dt.datetime.now()
+    due = [timestamp + cadence for timestamp in updated if timestamp + cadence > now]
+    if not due:
+        return _LATE_TTL
+    return max(min((min(due) - now).total_seconds(), cadence.total_seconds()), 1)
+
 
 # Create your views here.
 def index(request: HttpRequest):
@@ -53,31 +85,66 @@ def index(request: HttpRequest):
 def load_solar_data(request: HttpRequest):
     if not request.is_ajax():
         raise Http404("Page not found")
+    resp = _CACHE.get_or_load(
+        "solar",
+        _load_solar_data,
+        lambda resp: _until_due(
+            [resp["power"]["datetime"]] if resp["power"] else [], SOLAR_CADENCE
+        ),
+    )
+    resp = {
+        **resp,
+        "update_late": resp["power"] is None
+        or resp["power"]["datetime"] < dt.datetime.now() - SOLAR_LATE,
+    }
+    _LOG.info(resp)
+    return JsonResponse(resp)
+
+
+def _load_solar_data() -> dict:
+    """
+    Loads today's energy and the latest power reading with one query. The query always returns
+    one row, with NULLs if there is no energy or power data yet, such as on a fresh install.
+
+    Returns:
+        dict: The energy and power data. Either is None if there is no data.
+    """
     with connections["solar"].cursor() as c:
-        c.execute("SELECT * FROM energy WHERE date = %s", (dt.date.today(),))
-        row = c.fetchone()
-        cols = [col.name for col in c.description]
-        energy_data = {col: item for col, item in zip(cols, row)}
         c.execute(
-            "SELECT * FROM power WHERE DATE(datetime) = %s AND datetime = "
-            "(SELECT MAX(datetime) FROM power)",
-            (dt.date.today(),),
+            "SELECT (SELECT to_jsonb(e)::text FROM energy e WHERE e.date = %s), "
+            "l.datetime, l.data::text FROM (SELECT 1) one "
+            "LEFT JOIN latest_state l ON l.source = %s AND l.key = ''",
+            (dt.date.today(), "power"),
         )
-        row = c.fetchone()
-        cols = [col.name for col in c.description]
-        power_data = {col: item for col, item in zip(cols, row)}
-    resp = {"power": power_data, "energy": energy_data}
-    if power_data["datetime"] < dt.datetime.now() - dt.timedelta(minutes=15):
-        resp["update_late"] = True
-    else:
-        resp["update_late"] = False
-    _LOG.info(resp)
-    return JsonResponse(resp)
+        energy, timestamp, power = c.fetchone()
+    power_data = {**json.loads(power), "datetime": timestamp} if power else None
+    return {"power": power_data, "energy": json.loads(energy) if energy else None}
 
 
 def load_sensor_data(request: HttpRequest):
     if not request.is_ajax():
         raise Http404("Page not found")
+    sensor_data = _CACHE.get_or_load(
+        "sensor",
+        _load_sensor_data,
+        lambda data: _until_due([loc["updated"] for loc in data.values()], SENSOR_CADENCE),
+    )
+    now = dt.datetime.now()
+    sensor_data = {
+        loc: {**data, "update_late": data["updated"] <= now - SENSOR_LATE}
+        for loc, data in sensor_data.items()
+    }
+    _LOG.info(sensor_data)
+    return JsonResponse(sensor_data)
+
+
+def _load_sensor_data() -> dict:
+    """
+    Loads the latest reading of every location that reported today with one query.
+
+    Returns:
+        dict: The sensor data keyed by location.
+    """
     icon_classes = {
         "upstairs": "fas fa-sort-amount-up-alt fa-7x",
         "downstairs": "fas fa-sort-amount-down-alt fa-7x",
@@ -85,36 +152,26 @@ def load_sensor_data(request: HttpRequest):
     }
     with connections["sensor"].cursor() as c:
         c.execute(
-            "SELECT location, MAX(datetime) FROM environment WHERE DATE(datetime) = %s "
-            "GROUP BY location",
-            (dt.date.today(),),
+            "SELECT key, datetime, (data->>'temperature')::float, (data->>'humidity')::float "
+            "FROM latest_state WHERE source = %s AND datetime >= %s",
+            ("environment", dt.datetime.combine(dt.date.today(), dt.time())),
         )
         rows = c.fetchall()
-        sensor_data = {
-            loc.title(): {"updated": timestamp, "icon-class": icon_classes[loc]}
-            for loc, timestamp in rows
+    return {
+        loc.title(): {
+            "updated": timestamp,
+            "icon-class": icon_classes[loc],
+            "temperature": temperature,
+            "humidity": humidity,
         }
-        for loc, timestamp in rows:
-            c.execute(
-                "SELECT temperature,humidity FROM environment "
-                "WHERE location = %s AND datetime = %s",
-                (loc, timestamp),
-            )
-            row = c.fetchone()
-            sensor_data[loc.title()]["temperature"] = row[0]
-            sensor_data[loc.title()]["humidity"] = row[1]
-            if sensor_data[loc.title()]["updated"] <= dt.datetime.now() - dt.timedelta(minutes=5):
-                sensor_data[loc.title()]["update_late"] = True
-            else:
-                sensor_data[loc.title()]["update_late"] = False
-    _LOG.info(sensor_data)
-    return JsonResponse(sensor_data)
+        for loc, timestamp, temperature, humidity in rows
+    }
 
 
 def load_network_data(request: HttpRequest):
     if not request.is_ajax():
         raise Http404("Page not found")
-    vault = VaultMgr(os.getenv("VAULT_URL"), os.getenv("ROLE_ID"), os.getenv("SECRET_ID"))
+    vault = get_vault()
     router_data = vault.get_secret("network/router")
     router = RouterMgr(**router_data)
     wan_data = router.get_status_wan()
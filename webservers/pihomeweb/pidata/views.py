@@ -34,13 +34,12 @@ SOFTWARE.
 
 import datetime as dt
 import logging
-import os
 import time
 
 import ipinfo
 import pyowm
 from django.http import Http404, HttpRequest, JsonResponse
-from pihome.vault import VaultMgr
+from pihome.vault import get_vault
 from django.db import connections
 from dateutil import tz
 
@@ -63,7 +62,7 @@ def load_location(request: HttpRequest):
     if not request.is_ajax():
         raise Http404("Page not found")
     now = dt.datetime.now()
-    vault = VaultMgr(os.getenv("VAULT_URL"), os.getenv("ROLE_ID"), os.getenv("SECRET_ID"))
+    vault = get_vault()
     last_update = dt.datetime.strptime(
         request.session.get("location_last_update", "20200101_010101"), "%Y%m%d_%H%M%S"
     )
@@ -96,7 +95,7 @@ def load_weather(request: HttpRequest):
     _LOG.info(f"Weather Last updated: {last_update}")
     if last_update is None or last_update + dt.timedelta(minutes=update_interval_mins) <= now:
         _LOG.info("Fetching new weather data.")
-        vault = VaultMgr(os.getenv("VAULT_URL"), os.getenv("ROLE_ID"), os.getenv("SECRET_ID"))
+        vault = get_vault()
         api_key = vault.get_secret(owm_token_path)["api_key"]
         owm = pyowm.OWM(api_key)
         mgr = owm.weather_manager()